@@ -0,0 +1,700 @@
+"""Benchmarks de PMDB-Scraper sin acceso a TMDB.
+
+Uso:
+    python benchmark.py completo --peliculas 500 --latencia-ms 40 --tasa-errores 0.01 --tasa-429 0.02
+    python benchmark.py motores --peliculas 300 --latencia-ms 40
+    python benchmark.py catalogo --entradas 1000,10000,100000
+    python benchmark.py txt --entradas 100000
+    python benchmark.py arranque --peliculas 2000 --repeticiones 10
+    python benchmark.py emparejar --archivos 20000 --candidatos 200
+    python benchmark.py indice --peliculas 300 --exportacion 500000
+"""
+import argparse
+import gzip
+import importlib.util
+import json
+import logging
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import Counter
+import contextlib
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+RUTA_SCRAPER = Path(__file__).parent / "pmdb-scraper.py"
+
+# Formas habituales de nombrar los archivos en una biblioteca real
+PATRONES_NOMBRE = [
+    "{titulo} ({año}).mkv",
+    "{titulo} ({año}).mp4",
+    "{titulo_puntos}.{año}.1080p.BluRay.x264.mkv",
+    "{titulo} {año} 720p.mkv",
+    "{titulo} [{año}].avi",
+    "{titulo}.mkv",
+]
+
+TITULOS_BASE = [
+    "Alien", "Blade Runner", "Heat", "Casablanca", "Vertigo", "Amelie", "Ran", "Psycho",
+    "Jaws", "Rocky", "Fargo", "Seven", "Gladiator", "Memento", "Up", "Coco"
+]
+
+
+def titulo_sintetico(indice):
+    return f"{TITULOS_BASE[indice % len(TITULOS_BASE)]} {indice:05d}"
+
+
+class ManejadorTMDbFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def responder(self, estado, cuerpo, tipo="application/json"):
+        self.send_response(estado)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def do_GET(self):
+        servidor = self.server
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        ruta = url.path
+        servidor.registrar(re.sub(r"\d+", "N", ruta))
+        time.sleep(servidor.demora())
+
+        # La API key se valida sin fallos inyectados para que la ejecución llegue a empezar
+        if ruta != "/3/movie/top_rated":
+            sorteo = servidor.aleatorio.random()
+            if sorteo < servidor.tasa_429:
+                servidor.registrar("429")
+                self.send_response(429)
+                self.send_header("Retry-After", str(servidor.retry_after))
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            if sorteo < servidor.tasa_429 + servidor.tasa_errores:
+                servidor.registrar("500")
+                return self.responder(500, b'{"status_code": 11}')
+
+        if ruta.startswith("/img/"):
+            return self.responder(200, servidor.imagen, "image/jpeg")
+        if ruta == "/3/movie/top_rated":
+            return self.responder(200, b'{"page": 1, "results": []}')
+        if ruta == "/3/search/movie":
+            return self.responder(200, json.dumps(self.buscar(params.get("query", [""])[0])).encode())
+
+        coincidencia = re.match(r"/3/movie/(\d+)(?:/(images|videos|release_dates))?$", ruta)
+        if coincidencia:
+            pelicula_id, recurso = int(coincidencia.group(1)), coincidencia.group(2)
+            detalles = self.detalles(pelicula_id, params)
+            cuerpo = detalles if recurso is None else detalles[recurso]
+            return self.responder(200, json.dumps(cuerpo).encode())
+        return self.responder(404, b'{"status_code": 34}')
+
+    def buscar(self, consulta):
+        coincidencia = re.search(r"(\d{5})\b", consulta)
+        if not coincidencia:
+            return {"page": 1, "results": [], "total_results": 0}
+        indice = int(coincidencia.group(1))
+        resultados = [{
+            "id": indice * 10 + variante,
+            "title": titulo_sintetico(indice) + ("" if variante == 0 else f" {variante + 1}"),
+            "original_title": titulo_sintetico(indice),
+            "release_date": f"{2000 + variante}-01-01"
+        } for variante in range(3)]
+        return {"page": 1, "results": resultados, "total_results": len(resultados)}
+
+    def detalles(self, pelicula_id, params):
+        indice, variante = divmod(pelicula_id, 10)
+        idioma = params.get("language", ["en-US"])[0]
+        return {
+            "id": pelicula_id,
+            "title": titulo_sintetico(indice),
+            "original_title": titulo_sintetico(indice),
+            "release_date": f"{2000 + variante}-01-01",
+            "runtime": 100,
+            "overview": f"Sinopsis {indice} ({idioma})",
+            "tagline": "",
+            "vote_average": 7.1,
+            "poster_path": f"/p{pelicula_id}.jpg",
+            "backdrop_path": f"/b{pelicula_id}.jpg",
+            "genres": [{"id": 18, "name": "Drama"}],
+            "production_companies": [{"id": 1, "name": "Estudio"}],
+            "credits": {"id": pelicula_id, "cast": [], "crew": [{"id": 1, "name": "Director", "job": "Director"}]},
+            "images": {"id": pelicula_id, "logos": [{"file_path": f"/l{pelicula_id}.png", "iso_639_1": "en"}]},
+            "videos": {"id": pelicula_id, "results": [
+                {"key": f"v{pelicula_id}", "site": "YouTube", "type": "Trailer", "iso_639_1": "en"}
+            ]},
+            "release_dates": {"id": pelicula_id, "results": [
+                {"iso_3166_1": "US", "release_dates": [{"certification": "PG-13", "type": 3}]}
+            ]},
+            "translations": {"id": pelicula_id, "translations": []}
+        }
+
+
+class ServidorTMDbFalso(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, latencia_ms=0, tasa_errores=0.0, tasa_429=0.0, retry_after=1, tamano_imagen_kb=2, semilla=0):
+        super().__init__(("127.0.0.1", 0), ManejadorTMDbFalso)
+        self.latencia = latencia_ms / 1000
+        self.tasa_errores = tasa_errores
+        self.tasa_429 = tasa_429
+        self.retry_after = retry_after
+        self.imagen = b"\xff\xd8\xff" + b"\0" * (tamano_imagen_kb * 1024)
+        self.aleatorio = random.Random(semilla)
+        self.contador = Counter()
+        self.lock = threading.Lock()
+
+    def demora(self):
+        # Latencia con ±25% de variación, como una red real
+        return self.latencia * self.aleatorio.uniform(0.75, 1.25)
+
+    def registrar(self, ruta):
+        with self.lock:
+            self.contador[ruta] += 1
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_port}"
+
+
+@contextmanager
+def servidor_falso(latencia_ms=0, **opciones):
+    servidor = ServidorTMDbFalso(latencia_ms, **opciones)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    try:
+        yield servidor
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def video_minimo(directorio):
+    # Un segundo de vídeo H.264 de 64x36 con audio AAC (unos pocos KB) para que ffprobe tenga
+    # algo real que leer. Sin ffmpeg los archivos quedan vacíos y ffprobe falla rápido.
+    if not shutil.which("ffmpeg"):
+        logging.warning("ffmpeg no está instalado: la biblioteca sintética usará archivos vacíos")
+        return None
+    ruta = Path(directorio) / "muestra.mkv"
+    comando = [
+        "ffmpeg", "-v", "error", "-y",
+        "-f", "lavfi", "-i", "color=c=black:s=64x36:d=1",
+        "-f", "lavfi", "-i", "anullsrc=r=8000:cl=stereo",
+        "-t", "1", "-c:v", "libx264", "-c:a", "aac", str(ruta)
+    ]
+    if subprocess.run(comando, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode != 0:
+        logging.warning("ffmpeg no pudo generar el vídeo de muestra: se usarán archivos vacíos")
+        return None
+    return ruta.read_bytes()
+
+
+def nombre_realista(indice):
+    titulo = titulo_sintetico(indice)
+    patron = PATRONES_NOMBRE[indice % len(PATRONES_NOMBRE)]
+    nombre = patron.format(titulo=titulo, titulo_puntos=titulo.replace(" ", "."), año=2000)
+    # Parte de la biblioteca en subcarpetas, como las colecciones o sagas
+    return f"Coleccion {indice // 50:03d}/{nombre}" if indice % 4 == 0 else nombre
+
+
+def generar_biblioteca(ruta, cantidad, contenido=b"", realista=False):
+    ruta = Path(ruta)
+    ruta.mkdir(parents=True, exist_ok=True)
+    for indice in range(cantidad):
+        destino = ruta / (nombre_realista(indice) if realista else f"{titulo_sintetico(indice)} (2000).mkv")
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        destino.write_bytes(contenido or b"")
+    return ruta
+
+
+def cargar_scraper(url_servidor=None):
+    spec = importlib.util.spec_from_file_location("pmdb_scraper", RUTA_SCRAPER)
+    modulo = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(modulo)
+    logging.getLogger().setLevel(logging.WARNING)
+    if url_servidor is None:
+        return modulo
+
+    import themoviedb.routes_async._base as base_async
+    import themoviedb.routes_sync._base as base_sync
+    base_sync.Base.TMDB_URL = url_servidor
+    base_async.Base.TMDB_URL = url_servidor
+    modulo.URL_IMAGENES_TMDB = f"{url_servidor}/img/t/p"
+    return modulo
+
+
+def configuracion_base(ruta_biblioteca):
+    with open(Path(__file__).parent / "config.json", encoding="utf-8") as f:
+        config = json.load(f)
+    config.update({
+        "api_key": "benchmark",
+        "ruta_peliculas": str(ruta_biblioteca),
+        "idiomas": ["en-US"],
+        "metadata_language": "en-US",
+        "interface_language": "en-US",
+        "cache_tmdb": {"activado": False}
+    })
+    config["obtener_datos"]["trailer"] = False
+    return config
+
+
+def pico_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return pico / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def ejecutar_en_proceso(config, url_servidor):
+    # Cada ejecución en un proceso nuevo: el pico de RSS es solo de esa ejecución
+    directorio = tempfile.mkdtemp(prefix="pmdb-config-")
+    ruta_config = Path(directorio) / "config.json"
+    with open(ruta_config, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    resultado = subprocess.run(
+        [sys.executable, str(Path(__file__).resolve()), "ejecutar", "--config", str(ruta_config), "--url", url_servidor],
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+    )
+    lineas = resultado.stdout.strip().splitlines()
+    if resultado.returncode != 0 or not lineas:
+        raise RuntimeError(f"La ejecución del scraper terminó con código {resultado.returncode}")
+    return json.loads(lineas[-1])
+
+
+def comando_ejecutar(args):
+    modulo = cargar_scraper(args.url)
+    with open(args.config, encoding="utf-8") as f:
+        config = json.load(f)
+    with contextlib.redirect_stdout(open(os.devnull, "w")):
+        segundos = ejecutar_scraper(modulo, config)
+    print(json.dumps({"segundos": segundos, "pico_rss_mb": pico_rss_mb()}))
+
+
+def ejecutar_scraper(modulo, config):
+    directorio = tempfile.mkdtemp(prefix="pmdb-config-")
+    with open(Path(directorio) / "config.json", "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+    cwd = os.getcwd()
+    os.chdir(directorio)
+    try:
+        inicio = time.perf_counter()
+        modulo.main()
+        return time.perf_counter() - inicio
+    finally:
+        os.chdir(cwd)
+
+
+def benchmark_motores(args):
+    filas = []
+    with servidor_falso(args.latencia_ms) as servidor:
+        for motor in args.motores.split(","):
+            biblioteca = generar_biblioteca(tempfile.mkdtemp(prefix=f"pmdb-{motor}-"), args.peliculas)
+            config = configuracion_base(biblioteca)
+            config["motor"] = motor
+            config["hilos"] = args.hilos
+            servidor.contador.clear()
+
+            resultado = ejecutar_en_proceso(config, servidor.url)
+            segundos = resultado["segundos"]
+            peticiones = sum(servidor.contador.values())
+            filas.append((motor, segundos, args.peliculas / segundos, peticiones / args.peliculas, resultado["pico_rss_mb"]))
+
+    print(f"\n{args.peliculas} películas, latencia simulada {args.latencia_ms} ms, hilos={args.hilos}")
+    print(f"{'motor':<8} {'segundos':>9} {'archivos/s':>11} {'peticiones/película':>20} {'pico RSS':>10}")
+    for motor, segundos, por_segundo, por_pelicula, rss in filas:
+        print(f"{motor:<8} {segundos:>9.2f} {por_segundo:>11.1f} {por_pelicula:>20.1f} {rss or 0:>7.0f} MB")
+
+
+def benchmark_completo(args):
+    biblioteca = Path(tempfile.mkdtemp(prefix="pmdb-biblioteca-"))
+    generar_biblioteca(biblioteca, args.peliculas, video_minimo(biblioteca), realista=True)
+
+    with servidor_falso(args.latencia_ms, tasa_errores=args.tasa_errores, tasa_429=args.tasa_429,
+                        retry_after=args.retry_after, tamano_imagen_kb=args.imagen_kb) as servidor:
+        config = configuracion_base(biblioteca)
+        config["motor"] = args.motor
+        config["hilos"] = args.hilos
+        config["limite_peticiones"] = {}
+        resultado = ejecutar_en_proceso(config, servidor.url)
+        contador = Counter(servidor.contador)
+
+    with open(biblioteca / "metadata.json", encoding="utf-8") as f:
+        estadisticas = json.load(f)["estadisticas"]
+    informe = {}
+    if (biblioteca / "pmdb-informe.json").exists():
+        with open(biblioteca / "pmdb-informe.json", encoding="utf-8") as f:
+            informe = json.load(f)
+
+    segundos = resultado["segundos"]
+    inyectados = contador.pop("429", 0), contador.pop("500", 0)
+    print(f"\n{args.peliculas} archivos en {biblioteca}")
+    print(f"motor={args.motor} hilos={args.hilos} latencia={args.latencia_ms} ms "
+          f"errores={args.tasa_errores:.1%} 429={args.tasa_429:.1%}")
+    print(f"segundos: {segundos:.2f}  archivos/s: {args.peliculas / segundos:.1f}  "
+          f"pico RSS: {resultado['pico_rss_mb'] or 0:.0f} MB")
+    print(f"encontradas: {estadisticas['encontradas']}/{estadisticas['total_procesadas']}  "
+          f"429 inyectados: {inyectados[0]}  500 inyectados: {inyectados[1]}")
+    print(f"peticiones/película: {sum(contador.values()) / args.peliculas:.2f}")
+    for ruta, cantidad in contador.most_common():
+        print(f"  {ruta:<32} {cantidad:>7} {cantidad / args.peliculas:>7.2f}/película")
+
+    if informe.get("operaciones"):
+        print(f"\n{'operación':<20} {'llamadas':>9} {'errores':>8} {'p50 ms':>8} {'p95 ms':>8} {'total s':>8}")
+        for nombre, operacion in informe["operaciones"].items():
+            print(f"{nombre:<20} {operacion['cantidad']:>9} {operacion['errores']:>8} "
+                  f"{operacion['segundos_p50'] * 1000:>8.1f} {operacion['segundos_p95'] * 1000:>8.1f} "
+                  f"{operacion['segundos_total']:>8.2f}")
+
+
+def cronometrar_proceso(comando, cwd=None):
+    inicio = time.perf_counter()
+    resultado = subprocess.run(comando, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    segundos = time.perf_counter() - inicio
+    if resultado.returncode != 0:
+        raise RuntimeError(f"{' '.join(comando)} terminó con código {resultado.returncode}")
+    return segundos, resultado.stdout
+
+
+def benchmark_arranque(args):
+    # Lo que cuesta una ejecución de cron sin cambios: arranque del intérprete, escaneo y
+    # comparación con el manifiesto. La biblioteca se cataloga antes contra el TMDB falso;
+    # las ejecuciones medidas no tienen servidor, así que cualquier petición las haría fallar.
+    biblioteca = Path(tempfile.mkdtemp(prefix="pmdb-biblioteca-"))
+    generar_biblioteca(biblioteca, args.peliculas, realista=True)
+    config = configuracion_base(biblioteca)
+    config["limite_peticiones"] = {}
+    with servidor_falso() as servidor:
+        ejecutar_en_proceso(config, servidor.url)
+
+    directorio = tempfile.mkdtemp(prefix="pmdb-config-")
+    with open(Path(directorio) / "config.json", "w", encoding="utf-8") as f:
+        json.dump(config, f)
+
+    dependencias = "import requests, themoviedb, aiohttp, tqdm, rapidfuzz"
+    casos = [
+        ("intérprete", [sys.executable, "-c", "pass"], None),
+        ("dependencias", [sys.executable, "-c", dependencias], None),
+        ("sin cambios", [sys.executable, str(RUTA_SCRAPER)], directorio),
+    ]
+    print(f"\n{args.peliculas} archivos en {biblioteca}, {args.repeticiones} repeticiones")
+    print(f"{'caso':<14} {'mediana ms':>11} {'mínimo ms':>10}")
+    for nombre, comando, cwd in casos:
+        tiempos = []
+        for _ in range(args.repeticiones):
+            segundos, salida = cronometrar_proceso(comando, cwd)
+            tiempos.append(segundos)
+        if cwd and "Nothing to do" not in salida:
+            print(f"Aviso: la ejecución no tomó el camino rápido:\n{salida.strip()}")
+        tiempos.sort()
+        print(f"{nombre:<14} {tiempos[len(tiempos) // 2] * 1000:>11.0f} {tiempos[0] * 1000:>10.0f}")
+
+
+def benchmark_emparejar(args):
+    # Re-emparejar muchos archivos contra un conjunto de resultados ya descargado: una llamada a
+    # fuzz.ratio por par frente a rankear_lote (una matriz de similitud para todo el lote)
+    from datetime import date
+    from types import SimpleNamespace
+    from rapidfuzz import fuzz
+
+    modulo = cargar_scraper()
+    resultados = [
+        SimpleNamespace(id=indice, title=titulo_sintetico(indice), original_title=f"{titulo_sintetico(indice)} Original",
+                        release_date=date(1950 + indice % 70, 1, 1))
+        for indice in range(args.candidatos)
+    ]
+    consultas = [(titulo_sintetico(random.randrange(args.candidatos * 2)), str(1950 + indice % 70))
+                 for indice in range(args.archivos)]
+
+    def por_pares():
+        rankings = []
+        for nombre, año in consultas:
+            puntajes = []
+            for resultado in resultados:
+                puntaje = fuzz.ratio(nombre.lower(), resultado.title.lower()) / 100
+                if año == str(resultado.release_date.year):
+                    puntaje += 0.5
+                puntajes.append((puntaje, resultado))
+            rankings.append(sorted(puntajes, key=lambda candidato: candidato[0], reverse=True))
+        return rankings
+
+    print(f"\n{args.archivos} archivos x {args.candidatos} candidatos (título y título original), "
+          f"numpy: {'sí' if modulo.numpy_disponible() else 'no'}")
+    print(f"{'modo':<22} {'segundos':>9} {'archivos/s':>11}")
+    for nombre, funcion in [("por pares (anterior)", por_pares),
+                            ("lote, 1 hilo", lambda: modulo.rankear_lote(consultas, resultados, limite=args.limite)),
+                            ("lote, todos los hilos", lambda: modulo.rankear_lote(consultas, resultados, workers=-1, limite=args.limite))]:
+        segundos, _ = cronometrar(funcion)
+        print(f"{nombre:<22} {segundos:>9.2f} {args.archivos / segundos:>11.0f}")
+
+
+def generar_exportacion(ruta, peliculas, total, semilla=0):
+    # Exportación diaria sintética con el formato de TMDB: las películas que conoce el servidor
+    # falso (id = índice * 10 + variante) y relleno hasta el total con títulos parecidos
+    aleatorio = random.Random(semilla)
+    with gzip.open(ruta, "wt", encoding="utf-8") as f:
+        for indice in range(peliculas):
+            for variante in range(3):
+                titulo = titulo_sintetico(indice) + ("" if variante == 0 else f" {variante + 1}")
+                f.write(json.dumps({"adult": False, "id": indice * 10 + variante, "original_title": titulo,
+                                    "popularity": round(10 - variante + aleatorio.random(), 3), "video": False}) + "\n")
+        for relleno in range(max(0, total - peliculas * 3)):
+            titulo = f"{aleatorio.choice(TITULOS_BASE)} {aleatorio.choice(TITULOS_BASE)} {relleno}"
+            f.write(json.dumps({"adult": relleno % 50 == 0, "id": 10_000_000 + relleno, "original_title": titulo,
+                                "popularity": round(aleatorio.random() * 5, 3), "video": False}) + "\n")
+    return ruta
+
+
+def benchmark_indice(args):
+    directorio = Path(tempfile.mkdtemp(prefix="pmdb-indice-"))
+    exportacion = generar_exportacion(directorio / "movie_ids.json.gz", args.peliculas, args.exportacion)
+    modulo = cargar_scraper()
+    modulo.metricas = modulo.Metricas()
+
+    ruta_db = directorio / "titulos.sqlite"
+    segundos, peliculas = cronometrar(modulo.IndiceTitulos.construir, exportacion, ruta_db)
+    print(f"\nexportación: {exportacion.stat().st_size / 2**20:.1f} MB, {peliculas} películas")
+    print(f"construcción: {segundos:.1f} s  índice: {ruta_db.stat().st_size / 2**20:.1f} MB")
+
+    indice = modulo.IndiceTitulos(ruta_db)
+    # Las mismas consultas que haría la etapa de búsqueda; el índice 0 se omite porque su ID 0 no es válido
+    consultas = []
+    for indice_pelicula in range(1, args.peliculas):
+        archivo = Path(nombre_realista(indice_pelicula))
+        consultas.append(modulo.separar_año(modulo.extraer_nombre_pelicula(archivo.name), archivo)[0])
+    segundos, rankings = cronometrar(lambda: [indice.buscar(consulta) for consulta in consultas])
+    aciertos = sum(1 for indice_pelicula, ranking in enumerate(rankings, 1)
+                   if ranking and ranking[0].resultado.id == indice_pelicula * 10)
+    print(f"búsquedas: {len(consultas) / segundos:.0f}/s  primer candidato correcto: {aciertos}/{len(consultas)}")
+    indice.cerrar()
+
+    biblioteca = Path(tempfile.mkdtemp(prefix="pmdb-biblioteca-"))
+    generar_biblioteca(biblioteca, args.peliculas, realista=True)
+    config = configuracion_base(biblioteca)
+    config["limite_peticiones"] = {}
+    config["indice_titulos"] = {"activado": True, "exportacion": str(exportacion), "ruta": str(ruta_db)}
+    with servidor_falso(args.latencia_ms) as servidor:
+        resultado = ejecutar_en_proceso(config, servidor.url)
+        contador = Counter(servidor.contador)
+    with open(biblioteca / "metadata.json", encoding="utf-8") as f:
+        estadisticas = json.load(f)["estadisticas"]
+    print(f"ejecución con índice: {resultado['segundos']:.2f} s  encontradas: "
+          f"{estadisticas['encontradas']}/{estadisticas['total_procesadas']}")
+    for ruta, cantidad in contador.most_common():
+        print(f"  {ruta:<32} {cantidad:>7}")
+
+
+def catalogo_sintetico(cantidad, ruta_base="/peliculas"):
+    return {
+        "metadata": [{
+            "tipo": "pelicula",
+            "archivo_original": f"{ruta_base}/{titulo_sintetico(i)} (2000).mkv",
+            "nombre_extraido": titulo_sintetico(i),
+            "metadata": {"tmdb_id": i * 10, "titulo_tmdb": titulo_sintetico(i)}
+        } for i in range(cantidad)],
+        "estadisticas": {}
+    }
+
+
+def cronometrar(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return time.perf_counter() - inicio, resultado
+
+
+def buscar_lineal(datos, archivo):
+    # Búsqueda anterior a IndiceCatalogo: recorrido completo de la lista por cada archivo
+    for item in datos["metadata"]:
+        if item.get("archivo_original") == archivo:
+            return item
+    return None
+
+
+def benchmark_catalogo(args):
+    modulo = cargar_scraper()
+    muestra_lineal = args.muestra_lineal
+    print(f"{'entradas':>9} {'indexar':>10} {'N búsquedas índice':>18} {'1 búsqueda lineal':>16} "
+          f"{'fusión 1% (índice)':>19} {'N búsquedas lineal':>22}")
+
+    for cantidad in (int(valor) for valor in args.entradas.split(",")):
+        datos = catalogo_sintetico(cantidad)
+        rutas = [item["archivo_original"] for item in datos["metadata"]]
+
+        t_indexar, catalogo = cronometrar(modulo.IndiceCatalogo, datos)
+        t_indexada, _ = cronometrar(lambda: sum(1 for ruta in rutas if ruta in catalogo))
+
+        muestra = rutas[-min(muestra_lineal, cantidad):]
+        t_muestra, _ = cronometrar(lambda: [buscar_lineal(datos, ruta) for ruta in muestra])
+        por_busqueda = t_muestra / len(muestra)
+
+        nuevos = [{
+            "archivo_original": ruta if i % 2 else f"{ruta}.nuevo",
+            "nombre_extraido": "x",
+            "metadata": {"tmdb_id": i}
+        } for i, ruta in enumerate(rutas[:max(1, cantidad // 100)])]
+        t_fusion, _ = cronometrar(lambda: [catalogo.guardar_item(item) for item in nuevos])
+
+        # Una ejecución completa hacía una búsqueda lineal por archivo: N búsquedas de N/2 de media
+        print(f"{cantidad:>9} {t_indexar * 1000:>8.1f}ms {t_indexada * 1000:>16.1f}ms "
+              f"{por_busqueda * 1e6:>13.1f}µs/b {t_fusion * 1000:>17.1f}ms {por_busqueda * cantidad / 2:>20.1f}s")
+
+
+def entrada_completa(indice, ruta_base="/peliculas"):
+    nombre = f"{titulo_sintetico(indice)} (2000)"
+    return {
+        "tipo": "pelicula",
+        "archivo_original": f"{ruta_base}/{nombre}.mkv",
+        "nombre_extraido": titulo_sintetico(indice),
+        "metadata": {
+            "titulo": titulo_sintetico(indice),
+            "titulo_tmdb": titulo_sintetico(indice),
+            "director": "Director",
+            "productora": ["Estudio"],
+            "rating": 0.71,
+            "descripcion": "Sinopsis de prueba " * 20,
+            "generos": ["Drama", "Thriller"],
+            "fecha_lanzamiento": "2000-01-01",
+            "boxfront_local": f"{ruta_base}/media/boxFront/{nombre}.jpg",
+            "screenshot_local": f"{ruta_base}/media/screenshot/{nombre}.jpg",
+            "wheel_local": f"{ruta_base}/media/wheel/{nombre}.png",
+            "video_local": None,
+            "tmdb_id": indice * 10,
+            "x-classification": "PG-13",
+            "x-added-date": "2024-05-01 12:00:00",
+            "x-codec": "H.265",
+            "x-resolution": "4K",
+            "x-aspect": "2.40:1",
+            "x-audio": "E-AC-3 5.1",
+            "x-tagline": "Lema",
+            "x-Duration": "120 min"
+        }
+    } if indice % 20 else {
+        "tipo": "pelicula",
+        "archivo_original": f"{ruta_base}/{nombre}.avi",
+        "nombre_extraido": titulo_sintetico(indice),
+        "metadata": None
+    }
+
+
+def medir_exportacion(funcion):
+    # tracemalloc multiplica el tiempo de cada asignación: el tiempo se mide en otra pasada
+    segundos, _ = cronometrar(funcion)
+    tracemalloc.start()
+    try:
+        funcion()
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return segundos, pico
+
+
+def benchmark_txt(args):
+    modulo = cargar_scraper()
+    print(f"{'entradas':>9} {'modo':<12} {'segundos':>9} {'entradas/s':>11} {'pico memoria':>13} {'tamaño txt':>11}")
+
+    for cantidad in (int(valor) for valor in args.entradas.split(",")):
+        directorio = Path(tempfile.mkdtemp(prefix="pmdb-txt-"))
+        ruta_json = directorio / "metadata.json"
+        ruta_txt = directorio / "metadata.txt"
+        datos = {"metadata": [entrada_completa(i) for i in range(cantidad)], "estadisticas": {}}
+        with open(ruta_json, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
+        cambiados = {item["archivo_original"] for item in datos["metadata"][:max(1, cantidad // 100)]}
+        catalogo = modulo.IndiceCatalogo(datos)
+        del datos
+
+        def en_memoria():
+            with open(ruta_json, encoding="utf-8") as f:
+                modulo.convert_json_to_txt(json.load(f), ruta_txt)
+
+        def streaming():
+            modulo.convert_json_to_txt(modulo.iterar_metadata_json(ruta_json), ruta_txt)
+
+        def incremental():
+            # guardar_metadata como al final de una ejecución con un 1% de entradas modificadas:
+            # escribe metadata.json y copia el resto de bloques del metadata.txt anterior
+            catalogo.cambiados = set(cambiados)
+            modulo.guardar_metadata(catalogo, ruta_json)
+
+        for modo, funcion in (("memoria", en_memoria), ("streaming", streaming), ("guardar 1%", incremental)):
+            segundos, pico = medir_exportacion(funcion)
+            print(f"{cantidad:>9} {modo:<12} {segundos:>9.2f} {cantidad / segundos:>11.0f} "
+                  f"{pico / 2**20:>10.1f} MB {ruta_txt.stat().st_size / 2**20:>8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="comando", required=True)
+
+    completo = subparsers.add_parser("completo", help="Ejecuta main() sobre una biblioteca sintética contra un TMDB falso")
+    completo.add_argument("--peliculas", type=int, default=500)
+    completo.add_argument("--latencia-ms", type=float, default=40)
+    completo.add_argument("--tasa-errores", type=float, default=0.0, help="Fracción de respuestas 500")
+    completo.add_argument("--tasa-429", type=float, default=0.0, help="Fracción de respuestas 429")
+    completo.add_argument("--retry-after", type=int, default=1)
+    completo.add_argument("--imagen-kb", type=int, default=64)
+    completo.add_argument("--motor", default="hilos")
+    completo.add_argument("--hilos", type=int, default=10)
+    completo.set_defaults(funcion=benchmark_completo)
+
+    ejecutar = subparsers.add_parser("ejecutar", help="Uso interno: una ejecución del scraper en este proceso")
+    ejecutar.add_argument("--config", required=True)
+    ejecutar.add_argument("--url", required=True)
+    ejecutar.set_defaults(funcion=comando_ejecutar)
+
+    motores = subparsers.add_parser("motores", help="Compara el motor de hilos con el motor asyncio")
+    motores.add_argument("--peliculas", type=int, default=300)
+    motores.add_argument("--latencia-ms", type=float, default=40)
+    motores.add_argument("--hilos", type=int, default=10)
+    motores.add_argument("--motores", default="hilos,async")
+    motores.set_defaults(funcion=benchmark_motores)
+
+    catalogo = subparsers.add_parser("catalogo", help="Mide las búsquedas en metadata.json con y sin índice")
+    catalogo.add_argument("--entradas", default="1000,10000,100000")
+    catalogo.add_argument("--muestra-lineal", type=int, default=200)
+    catalogo.set_defaults(funcion=benchmark_catalogo)
+
+    txt = subparsers.add_parser("txt", help="Mide la exportación de metadata.json a metadata.txt")
+    txt.add_argument("--entradas", default="100000")
+    txt.set_defaults(funcion=benchmark_txt)
+
+    arranque = subparsers.add_parser("arranque", help="Mide el arranque de una ejecución sin cambios en la biblioteca")
+    arranque.add_argument("--peliculas", type=int, default=2000)
+    arranque.add_argument("--repeticiones", type=int, default=10)
+    arranque.set_defaults(funcion=benchmark_arranque)
+
+    emparejar = subparsers.add_parser("emparejar", help="Mide el emparejamiento por lotes de nombres con resultados de búsqueda")
+    emparejar.add_argument("--archivos", type=int, default=20000)
+    emparejar.add_argument("--candidatos", type=int, default=200)
+    emparejar.add_argument("--limite", type=int, default=5, help="Candidatos por archivo (0 = todos)")
+    emparejar.set_defaults(funcion=benchmark_emparejar)
+
+    indice = subparsers.add_parser("indice", help="Mide el índice local de títulos y una ejecución que lo usa")
+    indice.add_argument("--peliculas", type=int, default=300)
+    indice.add_argument("--exportacion", type=int, default=500000, help="Películas en la exportación sintética")
+    indice.add_argument("--latencia-ms", type=float, default=40)
+    indice.set_defaults(funcion=benchmark_indice)
+
+    args = parser.parse_args()
+    args.funcion(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,31 @@ import logging
 import json
 from pathlib import Path
 import re
-import requests
-import shutil
 import time
-from themoviedb import TMDb
 from datetime import datetime
-from tqdm import tqdm
-from rapidfuzz import fuzz
-import yt_dlp
 import os
 import subprocess
 import sys
 import concurrent.futures
+import asyncio
 import queue
 import contextlib
-import io
+import sqlite3
+import threading
+import random
+import signal
+import bisect
+import functools
+import gzip
+import hashlib
+import heapq
+import unicodedata
+from email.utils import parsedate_to_datetime
+from datetime import timezone
+from urllib.parse import urlencode, urlparse
+
+# requests, themoviedb, aiohttp, tqdm y rapidfuzz se importan dentro de las funciones que los
+# usan: una ejecución sin cambios en la biblioteca termina sin cargarlos
 
 log_file = Path(__file__).parent / "console.log"
 logging.basicConfig(
@@ -54,6 +64,13 @@ TRANSLATIONS = {
         "screenshots": "- Capturas (screenshot):",
         "logos": "- Logos (wheel):",
         "trailers": "- Tráilers descargados:",
+        "tmdb_cache": "Caché TMDb (aciertos/fallos):",
+        "library_changes": "Cambios en la biblioteca: {} nuevos, {} modificados, {} movidos, {} eliminados",
+        "nothing_to_do": "Sin cambios en la biblioteca ({} archivos). Nada que hacer.",
+        "journal_recovered": "Recuperados {} resultados de una ejecución interrumpida",
+        "network_usage": "Peticiones a TMDB: {}, descargado: {:.1f} MB",
+        "interrupted": "Interrupción recibida: terminando los archivos en curso (Ctrl+C otra vez para salir ya)",
+        "already_in_library": "Ya en la biblioteca",
         "select_correct_movie": "Selecciona el número de la película correcta (o 0 para cancelar):",
         "trailer_downloaded": "Trailer descargado exitosamente para:",
         "trailer_no_downloaded": "Trailer no descargado para:",
@@ -98,6 +115,13 @@ TRANSLATIONS = {
         "screenshots": "- Screenshots:",
         "logos": "- Logos (wheel):",
         "trailers": "- Downloaded trailers:",
+        "tmdb_cache": "TMDb cache (hits/misses):",
+        "library_changes": "Library changes: {} new, {} changed, {} moved, {} deleted",
+        "nothing_to_do": "No library changes ({} files). Nothing to do.",
+        "journal_recovered": "Recovered {} results from an interrupted run",
+        "network_usage": "TMDB requests: {}, downloaded: {:.1f} MB",
+        "interrupted": "Interrupt received: finishing files in progress (Ctrl+C again to quit now)",
+        "already_in_library": "Already in library",
         "select_correct_movie": "Select the correct movie number (or 0 to cancel):",
         "trailer_downloaded": "Trailer successfully downloaded for:",
         "trailer_no_downloaded": "Trailer not downloaded for:",
@@ -134,16 +158,14 @@ def get_translation(key, interface_language):
 def eliminar_archivos_relacionados(pelicula, ruta_base):
     try:
         nombre_base = Path(pelicula.get("archivo_original", "")).stem
+        indice = indice_media or construir_indice_media(crear_carpetas_imagenes(ruta_base))
 
-        carpetas_media = ['boxFront', 'screenshot', 'wheel', 'video']
-        for carpeta in carpetas_media:
-            media_path = Path(ruta_base) / 'media' / carpeta
-            for archivo in media_path.glob(f"{nombre_base}.*"):
-                try:
-                    archivo.unlink()
-                    logging.info(f"Archivo eliminado: {archivo}")
-                except Exception as e:
-                    logging.warning(f"No se pudo eliminar {archivo}: {e}")
+        for ruta in indice.quitar(nombre_base):
+            try:
+                Path(ruta).unlink()
+                logging.info(f"Archivo eliminado: {ruta}")
+            except Exception as e:
+                logging.warning(f"No se pudo eliminar {ruta}: {e}")
 
         return True
     except Exception as e:
@@ -190,36 +212,991 @@ def load_config():
         logging.error(f"Error al cargar configuración: {str(e)}")
         raise
 
+SEPARADOR_RUTAS_TXT = '\\' if os.name == 'nt' else '/'
+
 def normalizar_ruta_para_sistema(ruta, es_asset=False):
 
     if not ruta:
         return ''
 
-    path_obj = Path(ruta)
-    separador = '\\' if os.name == 'nt' else '/'
+    # os.path en lugar de Path: se llama cinco veces por entrada al exportar metadata.txt
+    carpeta, nombre = os.path.split(ruta)
+    separador = SEPARADOR_RUTAS_TXT
 
     if es_asset:
-        return f".{separador}media{separador}{path_obj.parent.name}{separador}{path_obj.name}"
+        return f".{separador}media{separador}{os.path.basename(carpeta)}{separador}{nombre}"
+
+    return f".{separador}{nombre}"
+
+URL_IMAGENES_TMDB = "https://image.tmdb.org/t/p"
+
+# Escalones de tamaño que sirve TMDB para cada tipo de imagen (ver /configuration)
+TAMANOS_IMAGENES_TMDB = {
+    "poster": ("w92", "w154", "w185", "w342", "w500", "w780", "original"),
+    "backdrop": ("w300", "w780", "w1280", "original"),
+    "logo": ("w45", "w92", "w154", "w185", "w300", "w500", "original")
+}
+
+TAMANOS_IMAGENES_DEFECTO = {
+    "poster": "w500",
+    "backdrop": "w1280",
+    "logo": "w500"
+}
+
+# Asset local -> (tipo de imagen TMDB, carpeta de media)
+IMAGENES_ASSETS = {
+    "boxfront": ("poster", "boxFront"),
+    "screenshot": ("backdrop", "screenshot"),
+    "wheel": ("logo", "wheel")
+}
+
+def ajustar_tamano_imagen(solicitado, escalones):
+    if solicitado in escalones:
+        return solicitado
+    ancho = re.fullmatch(r'w?(\d+)', solicitado)
+    if ancho:
+        for escalon in escalones[:-1]:
+            if int(escalon[1:]) >= int(ancho.group(1)):
+                return escalon
+    return "original"
+
+def configurar_tamanos_imagenes(config):
+    configurados = {**TAMANOS_IMAGENES_DEFECTO, **config.get('tamanos_imagenes', {})}
+    tamanos = {}
+    for tipo, escalones in TAMANOS_IMAGENES_TMDB.items():
+        solicitado = str(configurados[tipo]).lower()
+        tamanos[tipo] = ajustar_tamano_imagen(solicitado, escalones)
+        if tamanos[tipo] != solicitado:
+            logging.warning(f"Tamaño '{solicitado}' no disponible en TMDB para {tipo}. Se usará {tamanos[tipo]}")
+    config['tamanos_imagenes'] = tamanos
+
+def url_imagen_tmdb(ruta, tipo, config):
+    return f"{URL_IMAGENES_TMDB}/{config['tamanos_imagenes'][tipo]}{ruta}"
+
+LIMITES_PETICIONES_DEFECTO = {
+    "api.themoviedb.org": 35,
+    "image.tmdb.org": 50
+}
+
+CODIGOS_REINTENTABLES = (429, 500, 502, 503, 504)
+
+class LimitadorPeticiones:
+    # Token bucket compartido por todos los hilos que hablan con un mismo host
+    def __init__(self, peticiones_por_segundo):
+        self.tasa = float(peticiones_por_segundo)
+        self.capacidad = max(1.0, self.tasa)
+        self.tokens = self.capacidad
+        self.ultimo = time.monotonic()
+        self.pausado_hasta = 0.0
+        self.lock = threading.Lock()
+
+    def reservar(self):
+        with self.lock:
+            ahora = time.monotonic()
+            self.tokens = min(self.capacidad, self.tokens + (ahora - self.ultimo) * self.tasa)
+            self.ultimo = ahora
+            self.tokens -= 1
+            espera_tokens = -self.tokens / self.tasa if self.tokens < 0 else 0.0
+            return max(espera_tokens, self.pausado_hasta - ahora)
+
+    def adquirir(self):
+        espera = self.reservar()
+        if espera > 0:
+            time.sleep(espera)
+
+    def pausar(self, segundos):
+        with self.lock:
+            self.pausado_hasta = max(self.pausado_hasta, time.monotonic() + segundos)
+
+limitadores = {}
+limitadores_lock = threading.Lock()
+
+def configurar_limitadores(config):
+    limites = dict(LIMITES_PETICIONES_DEFECTO)
+    limites.update(config.get('limite_peticiones', {}))
+    with limitadores_lock:
+        limitadores.clear()
+        for host, peticiones_por_segundo in limites.items():
+            if peticiones_por_segundo and peticiones_por_segundo > 0:
+                limitadores[host] = LimitadorPeticiones(peticiones_por_segundo)
+
+def obtener_limitador(url):
+    return limitadores.get(urlparse(url).hostname)
+
+def leer_retry_after(respuesta):
+    valor = respuesta.headers.get('Retry-After')
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(valor) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def calcular_espera_reintento(intento, retry_after=None, maximo=60.0):
+    if retry_after is not None:
+        return min(maximo, retry_after) + random.uniform(0, 1)
+    tope = min(maximo, 2 ** intento)
+    return tope / 2 + random.uniform(0, tope / 2)
+
+def peticion_limitada(sesion, method, url, **kwargs):
+    # Respeta el límite del host y reintenta 429/5xx esperando lo que indique Retry-After,
+    # en lugar de dejar que el error haga repetir toda la película.
+    limitador = obtener_limitador(url)
+    max_reintentos = config['max_reintentos']
+
+    for intento in range(max_reintentos + 1):
+        if limitador:
+            limitador.adquirir()
+        respuesta = sesion.request(method, url, **kwargs)
+        if respuesta.status_code not in CODIGOS_REINTENTABLES or intento == max_reintentos:
+            return respuesta
+
+        retry_after = leer_retry_after(respuesta)
+        espera = calcular_espera_reintento(intento, retry_after)
+        if limitador and respuesta.status_code == 429:
+            limitador.pausar(espera)
+        metricas.contar(f"reintentos_http_{respuesta.status_code}")
+        logging.warning(f"Respuesta {respuesta.status_code} de {urlparse(url).hostname}, reintentando en {espera:.1f}s")
+        respuesta.close()
+        time.sleep(espera)
+
+    return respuesta
+
+sesion_http = None
+sesion_http_lock = threading.Lock()
+
+def crear_sesion_http(config):
+    # Sesión con pool de conexiones keep-alive compartida por todos los hilos. Los reintentos
+    # de transporte cubren errores de conexión y lectura; los 429/5xx los gestiona peticion_limitada.
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    opciones = config.get('conexiones_http', {})
+    reintentos = opciones.get('reintentos_transporte', 2)
+    adaptador = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=opciones.get('tamano_pool', max(10, config.get('hilos', 10))),
+        max_retries=Retry(
+            total=None,
+            connect=reintentos,
+            read=reintentos,
+            status=0,
+            other=0,
+            backoff_factor=0.5,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            raise_on_status=False
+        )
+    )
+
+    sesion = requests.Session()
+    sesion.mount('https://', adaptador)
+    sesion.mount('http://', adaptador)
+    if not opciones.get('keep_alive', True):
+        sesion.headers['Connection'] = 'close'
+    return sesion
+
+def obtener_sesion_http():
+    global sesion_http
+    with sesion_http_lock:
+        if sesion_http is None:
+            sesion_http = crear_sesion_http(config)
+        return sesion_http
+
+def cerrar_sesion_http():
+    global sesion_http
+    with sesion_http_lock:
+        if sesion_http is not None:
+            sesion_http.close()
+            sesion_http = None
+
+TTL_CACHE_TMDB_HORAS = {
+    "search": 24 * 7,
+    "movie": 24 * 30,
+    "images": 24 * 30,
+    "videos": 24 * 7,
+    "release_dates": 24 * 30,
+    "otros": 24
+}
+
+ENDPOINTS_SIN_CACHE = ('movie/top_rated',)
+
+class CacheTMDb:
+    def __init__(self, ruta_db, ttl_horas=None, tamano_maximo_mb=256):
+        self.ruta_db = Path(ruta_db)
+        self.ttl_horas = dict(TTL_CACHE_TMDB_HORAS)
+        self.ttl_horas.update(ttl_horas or {})
+        self.tamano_maximo = int(tamano_maximo_mb * 1024 * 1024)
+        self.aciertos = 0
+        self.fallos = 0
+        self.lock = threading.Lock()
+
+        self.conexion = sqlite3.connect(str(self.ruta_db), check_same_thread=False, isolation_level=None)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.execute("""
+            CREATE TABLE IF NOT EXISTS respuestas_tmdb (
+                clave TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                cuerpo BLOB NOT NULL,
+                tamano INTEGER NOT NULL,
+                creado REAL NOT NULL,
+                ultimo_acceso REAL NOT NULL
+            )
+        """)
+        self.conexion.execute("CREATE INDEX IF NOT EXISTS idx_respuestas_acceso ON respuestas_tmdb (ultimo_acceso)")
+        self.tamano_total = self.conexion.execute("SELECT COALESCE(SUM(tamano), 0) FROM respuestas_tmdb").fetchone()[0]
+
+    @staticmethod
+    def clasificar_endpoint(ruta):
+        partes = ruta.strip('/').split('/')
+        if partes[0] == 'search':
+            return 'search'
+        if partes[0] == 'movie' and len(partes) == 2:
+            return 'movie'
+        if partes[0] == 'movie' and len(partes) == 3:
+            return partes[2]
+        return 'otros'
+
+    @staticmethod
+    def generar_clave(ruta, params):
+        # Los booleanos se normalizan para que el cliente síncrono (False) y el asíncrono
+        # ("false") compartan las mismas entradas
+        params_clave = sorted(
+            (str(k), str(v).lower() if isinstance(v, bool) else str(v))
+            for k, v in (params or {}).items() if k != 'api_key'
+        )
+        return f"{ruta.strip('/')}?{urlencode(params_clave)}"
+
+    def obtener(self, clave, endpoint):
+        ahora = time.time()
+        ttl = self.ttl_horas.get(endpoint, self.ttl_horas['otros']) * 3600
+        with self.lock:
+            fila = self.conexion.execute(
+                "SELECT cuerpo, tamano, creado FROM respuestas_tmdb WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None:
+                self.fallos += 1
+                return None
+
+            cuerpo, tamano, creado = fila
+            if ahora - creado > ttl:
+                self.conexion.execute("DELETE FROM respuestas_tmdb WHERE clave = ?", (clave,))
+                self.tamano_total -= tamano
+                self.fallos += 1
+                return None
+
+            self.conexion.execute("UPDATE respuestas_tmdb SET ultimo_acceso = ? WHERE clave = ?", (ahora, clave))
+            self.aciertos += 1
+            return bytes(cuerpo)
+
+    def guardar(self, clave, endpoint, cuerpo):
+        ahora = time.time()
+        with self.lock:
+            anterior = self.conexion.execute(
+                "SELECT tamano FROM respuestas_tmdb WHERE clave = ?", (clave,)
+            ).fetchone()
+            self.conexion.execute(
+                "INSERT OR REPLACE INTO respuestas_tmdb (clave, endpoint, cuerpo, tamano, creado, ultimo_acceso) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (clave, endpoint, sqlite3.Binary(cuerpo), len(cuerpo), ahora, ahora)
+            )
+            self.tamano_total += len(cuerpo) - (anterior[0] if anterior else 0)
+            if self.tamano_total > self.tamano_maximo:
+                self._desalojar()
+
+    def _desalojar(self):
+        # LRU: se eliminan las respuestas menos usadas hasta quedar al 90% del límite
+        objetivo = self.tamano_maximo * 0.9
+        eliminar = []
+        for clave, tamano in self.conexion.execute(
+            "SELECT clave, tamano FROM respuestas_tmdb ORDER BY ultimo_acceso"
+        ).fetchall():
+            if self.tamano_total <= objetivo:
+                break
+            eliminar.append((clave,))
+            self.tamano_total -= tamano
+
+        self.conexion.executemany("DELETE FROM respuestas_tmdb WHERE clave = ?", eliminar)
+        logging.info(f"Caché TMDb: {len(eliminar)} respuestas desalojadas por límite de tamaño")
+
+    def cerrar(self):
+        with self.lock:
+            self.conexion.close()
+
+class CacheSondeos:
+    # Resultados de ffprobe por ruta. Una entrada solo vale si tamaño, mtime e inodo del archivo
+    # siguen siendo los mismos; cualquier cambio en el archivo obliga a volver a analizarlo.
+    def __init__(self, ruta_db):
+        self.ruta_db = Path(ruta_db)
+        self.aciertos = 0
+        self.fallos = 0
+        self.lock = threading.Lock()
+
+        self.conexion = sqlite3.connect(str(self.ruta_db), check_same_thread=False, isolation_level=None)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.execute("""
+            CREATE TABLE IF NOT EXISTS sondeos_ffprobe (
+                ruta TEXT PRIMARY KEY,
+                tamano INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                inodo INTEGER NOT NULL,
+                info TEXT NOT NULL,
+                actualizado REAL NOT NULL
+            )
+        """)
+
+    @staticmethod
+    def identidad(ruta_archivo):
+        estado = os.stat(ruta_archivo)
+        return estado.st_size, estado.st_mtime_ns, estado.st_ino
+
+    def obtener(self, ruta_archivo, identidad):
+        with self.lock:
+            fila = self.conexion.execute(
+                "SELECT tamano, mtime_ns, inodo, info FROM sondeos_ffprobe WHERE ruta = ?", (ruta_archivo,)
+            ).fetchone()
+            if fila is None or tuple(fila[:3]) != tuple(identidad):
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+        return json.loads(fila[3])
+
+    def guardar(self, ruta_archivo, identidad, info):
+        with self.lock:
+            self.conexion.execute(
+                "INSERT OR REPLACE INTO sondeos_ffprobe (ruta, tamano, mtime_ns, inodo, info, actualizado) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (ruta_archivo, *identidad, json.dumps(info), time.time())
+            )
+
+    def cerrar(self):
+        with self.lock:
+            self.conexion.close()
+
+cache_sondeos = None
+
+def configurar_cache_sondeos(config):
+    global cache_sondeos
+    opciones = config.get('cache_sondeos', {})
+    if not opciones.get('activado', True):
+        cache_sondeos = None
+        return None
+
+    ruta_db = opciones.get('ruta') or config.get('cache_tmdb', {}).get('ruta') or Path(config['ruta_peliculas']) / '.pmdb-cache.sqlite'
+    try:
+        cache_sondeos = CacheSondeos(ruta_db)
+    except sqlite3.Error as e:
+        logging.warning(f"No se pudo abrir la caché de ffprobe en {ruta_db}: {e}")
+        cache_sondeos = None
+    return cache_sondeos
+
+def cerrar_cache_sondeos():
+    global cache_sondeos
+    if cache_sondeos is not None:
+        logging.info(f"Caché ffprobe: {cache_sondeos.aciertos} aciertos, {cache_sondeos.fallos} fallos")
+        cache_sondeos.cerrar()
+        cache_sondeos = None
+
+def consultar_cache_sondeos(ruta_archivo):
+    if cache_sondeos is None:
+        return None, None
+    try:
+        identidad = CacheSondeos.identidad(ruta_archivo)
+    except OSError:
+        return None, None
+    return cache_sondeos.obtener(str(ruta_archivo), identidad), identidad
+
+def guardar_cache_sondeos(ruta_archivo, identidad, info):
+    # Los análisis fallidos no se guardan, así se repiten al instalar ffprobe o reparar el archivo
+    if cache_sondeos is not None and identidad is not None and info != INFO_TECNICA_DESCONOCIDA:
+        cache_sondeos.guardar(str(ruta_archivo), identidad, info)
+
+class CacheSinResultado:
+    # Búsquedas que no llevaron a ninguna película (vídeos caseros, extras...). Mientras la entrada
+    # esté vigente la búsqueda no se repite; cada nuevo fallo duplica el intervalo hasta la
+    # siguiente revisión, con un máximo de horas_maximas.
+    def __init__(self, ruta_db, horas_iniciales=24, horas_maximas=720):
+        self.ruta_db = Path(ruta_db)
+        self.horas_iniciales = horas_iniciales
+        self.horas_maximas = horas_maximas
+        self.aciertos = 0
+        self.fallos = 0
+        # Varios archivos con la misma búsqueda (p. ej. "Extras.mkv" en distintas carpetas)
+        # cuentan como un solo fallo por ejecución
+        self.registradas = {}
+        self.lock = threading.Lock()
+
+        self.conexion = sqlite3.connect(str(self.ruta_db), check_same_thread=False, isolation_level=None)
+        self.conexion.execute("PRAGMA journal_mode=WAL")
+        self.conexion.execute("PRAGMA synchronous=NORMAL")
+        self.conexion.execute("""
+            CREATE TABLE IF NOT EXISTS busquedas_sin_resultado (
+                clave TEXT PRIMARY KEY,
+                fallos INTEGER NOT NULL,
+                ultimo REAL NOT NULL,
+                proximo REAL NOT NULL
+            )
+        """)
+
+    @staticmethod
+    def clave(nombre_sin_año, año_archivo, idiomas):
+        return f"{normalizar_titulo(nombre_sin_año)}|{año_archivo or ''}|{','.join(idiomas)}"
+
+    def vigente(self, clave):
+        with self.lock:
+            fila = self.conexion.execute(
+                "SELECT proximo FROM busquedas_sin_resultado WHERE clave = ?", (clave,)
+            ).fetchone()
+            if fila is None or fila[0] <= time.time():
+                self.fallos += 1
+                return False
+            self.aciertos += 1
+            return True
+
+    def registrar(self, clave):
+        ahora = time.time()
+        with self.lock:
+            if clave in self.registradas:
+                return self.registradas[clave]
+            fila = self.conexion.execute(
+                "SELECT fallos FROM busquedas_sin_resultado WHERE clave = ?", (clave,)
+            ).fetchone()
+            fallos = (fila[0] if fila else 0) + 1
+            horas = min(self.horas_maximas, self.horas_iniciales * 2 ** (fallos - 1))
+            self.conexion.execute(
+                "INSERT OR REPLACE INTO busquedas_sin_resultado (clave, fallos, ultimo, proximo) VALUES (?, ?, ?, ?)",
+                (clave, fallos, ahora, ahora + horas * 3600)
+            )
+            self.registradas[clave] = horas
+        return horas
+
+    def olvidar(self, clave):
+        with self.lock:
+            self.registradas.pop(clave, None)
+            self.conexion.execute("DELETE FROM busquedas_sin_resultado WHERE clave = ?", (clave,))
+
+    def proximas_revisiones(self):
+        with self.lock:
+            return dict(self.conexion.execute("SELECT clave, proximo FROM busquedas_sin_resultado").fetchall())
+
+    def cerrar(self):
+        with self.lock:
+            self.conexion.close()
+
+cache_sin_resultado = None
+
+def configurar_cache_sin_resultado(config):
+    global cache_sin_resultado
+    opciones = config.get('cache_sin_resultado', {})
+    if not opciones.get('activado', True):
+        cache_sin_resultado = None
+        return None
+
+    ruta_db = opciones.get('ruta') or config.get('cache_tmdb', {}).get('ruta') or Path(config['ruta_peliculas']) / '.pmdb-cache.sqlite'
+    try:
+        cache_sin_resultado = CacheSinResultado(ruta_db, opciones.get('horas_iniciales', 24), opciones.get('horas_maximas', 720))
+    except sqlite3.Error as e:
+        logging.warning(f"No se pudo abrir la caché de búsquedas sin resultado en {ruta_db}: {e}")
+        cache_sin_resultado = None
+    return cache_sin_resultado
+
+def cerrar_cache_sin_resultado():
+    global cache_sin_resultado
+    if cache_sin_resultado is not None:
+        logging.info(f"Caché de búsquedas sin resultado: {cache_sin_resultado.aciertos} omitidas, {cache_sin_resultado.fallos} realizadas")
+        cache_sin_resultado.cerrar()
+        cache_sin_resultado = None
+
+def clave_sin_resultado(nombre_sin_año, año_archivo, config):
+    return CacheSinResultado.clave(nombre_sin_año, año_archivo, config['idiomas'])
+
+def clave_item_sin_resultado(item, config):
+    archivo = Path(item['archivo_original'])
+    nombre_sin_año, año_archivo = separar_año(item.get('nombre_extraido') or extraer_nombre_pelicula(archivo.name), archivo)
+    return clave_sin_resultado(nombre_sin_año, año_archivo, config)
+
+def busqueda_sin_resultado_vigente(clave):
+    return cache_sin_resultado is not None and cache_sin_resultado.vigente(clave)
+
+def registrar_sin_resultado(clave, nombre_pelicula):
+    # Solo se llama cuando TMDB respondió sin coincidencias, nunca tras un error de red o de la API
+    if cache_sin_resultado is not None:
+        horas = cache_sin_resultado.registrar(clave)
+        logging.info(f"Sin coincidencia para {nombre_pelicula}: no se volverá a buscar en {horas:g} horas")
+
+def olvidar_sin_resultado(clave):
+    if cache_sin_resultado is not None:
+        cache_sin_resultado.olvidar(clave)
+
+def operacion_tmdb(ruta):
+    # Nombre de la operación en las métricas: tmdb.search, tmdb.details, tmdb.images...
+    endpoint = CacheTMDb.clasificar_endpoint(ruta)
+    if endpoint == 'movie':
+        # movie/<id> son los detalles; movie/top_rated es la validación de la API key
+        endpoint = 'details' if ruta.rstrip('/').rpartition('/')[2].isdigit() else 'otros'
+    return f"tmdb.{endpoint}"
+
+def ruta_tmdb(url):
+    ruta = urlparse(url).path
+    return ruta[len('/3/'):] if ruta.startswith('/3/') else ruta.lstrip('/')
+
+class Estadisticas:
+    # Contadores de una ejecución. Cada hilo suma en su propia instancia (EstadisticasHilos.actual)
+    # y las instancias se fusionan al final o cuando se pidan, sin locks en el camino caliente.
+    CAMPOS = ('total_procesadas', 'encontradas', 'no_encontradas', 'boxfront', 'screenshot', 'wheel',
+              'trailers', 'bytes_descargados', 'peticiones_api')
+    __slots__ = CAMPOS
+
+    def __init__(self):
+        for campo in self.CAMPOS:
+            setattr(self, campo, 0)
+
+    def contabilizar(self, item):
+        self.total_procesadas += 1
+        if item.get("metadata"):
+            self.encontradas += 1
+        else:
+            self.no_encontradas += 1
+
+        descargas = item.get("descargas") or {}
+        if descargas.get('boxfront'):
+            self.boxfront += 1
+        if descargas.get('screenshot'):
+            self.screenshot += 1
+        if descargas.get('wheel'):
+            self.wheel += 1
+        if descargas.get('trailer'):
+            self.trailers += 1
+
+    def fusionar(self, otra):
+        for campo in self.CAMPOS:
+            setattr(self, campo, getattr(self, campo) + getattr(otra, campo))
+        return self
+
+    @classmethod
+    def desde_dict(cls, datos):
+        estadisticas = cls()
+        datos = datos or {}
+        imagenes = datos.get("imagenes_descargadas", {})
+        estadisticas.total_procesadas = datos.get("total_procesadas", 0)
+        estadisticas.encontradas = datos.get("encontradas", 0)
+        estadisticas.no_encontradas = datos.get("no_encontradas", 0)
+        estadisticas.boxfront = imagenes.get("boxfront", 0)
+        estadisticas.screenshot = imagenes.get("screenshot", 0)
+        estadisticas.wheel = imagenes.get("wheel", 0)
+        estadisticas.trailers = datos.get("trailers_descargados", 0)
+        estadisticas.bytes_descargados = datos.get("bytes_descargados", 0)
+        estadisticas.peticiones_api = datos.get("peticiones_api", 0)
+        return estadisticas
+
+    def como_dict(self):
+        return {
+            "total_procesadas": self.total_procesadas,
+            "encontradas": self.encontradas,
+            "no_encontradas": self.no_encontradas,
+            "imagenes_descargadas": {
+                "boxfront": self.boxfront,
+                "screenshot": self.screenshot,
+                "wheel": self.wheel
+            },
+            "trailers_descargados": self.trailers,
+            "bytes_descargados": self.bytes_descargados,
+            "peticiones_api": self.peticiones_api
+        }
+
+class EstadisticasHilos:
+    def __init__(self):
+        self.locales = threading.local()
+        self.lock = threading.Lock()
+        self.instancias = []
+
+    def actual(self):
+        # El lock solo se toma la primera vez que un hilo cuenta algo
+        try:
+            return self.locales.estadisticas
+        except AttributeError:
+            estadisticas = Estadisticas()
+            with self.lock:
+                self.instancias.append(estadisticas)
+            self.locales.estadisticas = estadisticas
+            return estadisticas
+
+    def total(self):
+        with self.lock:
+            instancias = list(self.instancias)
+        total = Estadisticas()
+        for estadisticas in instancias:
+            total.fusionar(estadisticas)
+        return total
+
+estadisticas_hilos = EstadisticasHilos()
+
+def fusionar_estadisticas(datos, nuevas):
+    datos["estadisticas"] = Estadisticas.desde_dict(datos.get("estadisticas")).fusionar(nuevas).como_dict()
+
+# Límites (en segundos) de las cubetas de los histogramas de latencia
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+class MetricaOperacion:
+    __slots__ = ('cantidad', 'errores', 'segundos', 'maximo', 'bytes', 'cubetas')
+
+    def __init__(self):
+        self.cantidad = 0
+        self.errores = 0
+        self.segundos = 0.0
+        self.maximo = 0.0
+        self.bytes = 0
+        self.cubetas = [0] * (len(LIMITES_LATENCIA) + 1)
+
+    def observar(self, segundos, error=False, bytes_transferidos=0):
+        self.cantidad += 1
+        self.errores += bool(error)
+        self.segundos += segundos
+        self.maximo = max(self.maximo, segundos)
+        self.bytes += bytes_transferidos
+        self.cubetas[bisect.bisect_left(LIMITES_LATENCIA, segundos)] += 1
+
+    def percentil(self, fraccion):
+        # Estimación por cubetas: el límite superior de la cubeta donde cae el percentil
+        objetivo = fraccion * self.cantidad
+        acumulado = 0
+        for limite, cantidad in zip(LIMITES_LATENCIA + (self.maximo,), self.cubetas):
+            acumulado += cantidad
+            if cantidad and acumulado >= objetivo:
+                return min(limite, self.maximo)
+        return self.maximo
+
+    def como_dict(self):
+        return {
+            "cantidad": self.cantidad,
+            "errores": self.errores,
+            "segundos_total": round(self.segundos, 3),
+            "segundos_media": round(self.segundos / self.cantidad, 4) if self.cantidad else 0,
+            "segundos_p50": round(self.percentil(0.5), 4),
+            "segundos_p95": round(self.percentil(0.95), 4),
+            "segundos_max": round(self.maximo, 4),
+            "bytes": self.bytes,
+            "histograma": {str(limite): cantidad for limite, cantidad in
+                           zip(LIMITES_LATENCIA + ('+Inf',), self.cubetas)}
+        }
+
+class Metricas:
+    # Tiempos, bytes y eventos de las operaciones costosas (peticiones TMDB, descargas, ffprobe,
+    # etapas, escrituras) para el informe de la ejecución. Las observaciones son pocas frente al
+    # coste de cada operación, así que un lock basta.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operaciones = {}
+        self.contadores = {}
+        self.inicio = time.time()
+
+    def observar(self, operacion, segundos, error=False, bytes_transferidos=0):
+        with self.lock:
+            metrica = self.operaciones.get(operacion)
+            if metrica is None:
+                metrica = self.operaciones[operacion] = MetricaOperacion()
+            metrica.observar(segundos, error, bytes_transferidos)
+
+    @contextlib.contextmanager
+    def medir(self, operacion):
+        # Quien mide puede marcar medicion['error'] o sumar medicion['bytes'] dentro del bloque
+        medicion = {'error': False, 'bytes': 0}
+        inicio = time.perf_counter()
+        try:
+            yield medicion
+        except BaseException:
+            medicion['error'] = True
+            raise
+        finally:
+            self.observar(operacion, time.perf_counter() - inicio, medicion['error'], medicion['bytes'])
+
+    def sumar_bytes(self, operacion, cantidad):
+        with self.lock:
+            metrica = self.operaciones.get(operacion)
+            if metrica is None:
+                metrica = self.operaciones[operacion] = MetricaOperacion()
+            metrica.bytes += cantidad
+
+    def contar(self, evento, cantidad=1):
+        with self.lock:
+            self.contadores[evento] = self.contadores.get(evento, 0) + cantidad
+
+    def informe(self, **datos):
+        fin = time.time()
+        with self.lock:
+            operaciones = {nombre: metrica.como_dict() for nombre, metrica in sorted(self.operaciones.items())}
+            contadores = dict(sorted(self.contadores.items()))
+        return {
+            "inicio": datetime.fromtimestamp(self.inicio).isoformat(timespec='seconds'),
+            "fin": datetime.fromtimestamp(fin).isoformat(timespec='seconds'),
+            "duracion_segundos": round(fin - self.inicio, 3),
+            **datos,
+            "contadores": contadores,
+            "operaciones": operaciones
+        }
 
-    return f".{separador}{path_obj.name}"
+metricas = Metricas()
+
+def medido(operacion, exito=bool):
+    # Mide cada llamada de la función; un resultado que no cumple exito (por defecto, un
+    # resultado falso como una descarga fallida) cuenta como error
+    def decorador(funcion):
+        if asyncio.iscoroutinefunction(funcion):
+            @functools.wraps(funcion)
+            async def envoltura_async(*args, **kwargs):
+                with metricas.medir(operacion) as medicion:
+                    resultado = await funcion(*args, **kwargs)
+                    medicion['error'] = not exito(resultado)
+                    return resultado
+            return envoltura_async
+
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            with metricas.medir(operacion) as medicion:
+                resultado = funcion(*args, **kwargs)
+                medicion['error'] = not exito(resultado)
+                return resultado
+        return envoltura
+    return decorador
+
+def formato_prometheus(informe):
+    lineas = [
+        "# HELP pmdb_operacion_segundos Duración de las operaciones del scraper",
+        "# TYPE pmdb_operacion_segundos histogram"
+    ]
+    for nombre, operacion in informe["operaciones"].items():
+        acumulado = 0
+        for limite, cantidad in operacion["histograma"].items():
+            acumulado += cantidad
+            lineas.append(f'pmdb_operacion_segundos_bucket{{operacion="{nombre}",le="{limite}"}} {acumulado}')
+        lineas.append(f'pmdb_operacion_segundos_sum{{operacion="{nombre}"}} {operacion["segundos_total"]}')
+        lineas.append(f'pmdb_operacion_segundos_count{{operacion="{nombre}"}} {operacion["cantidad"]}')
+
+    lineas.append("# TYPE pmdb_operacion_errores_total counter")
+    lineas.extend(f'pmdb_operacion_errores_total{{operacion="{nombre}"}} {operacion["errores"]}'
+                  for nombre, operacion in informe["operaciones"].items())
+    lineas.append("# TYPE pmdb_operacion_bytes_total counter")
+    lineas.extend(f'pmdb_operacion_bytes_total{{operacion="{nombre}"}} {operacion["bytes"]}'
+                  for nombre, operacion in informe["operaciones"].items())
+    lineas.append("# TYPE pmdb_eventos_total counter")
+    lineas.extend(f'pmdb_eventos_total{{evento="{evento}"}} {cantidad}'
+                  for evento, cantidad in informe["contadores"].items())
+
+    lineas.append("# TYPE pmdb_cache_total counter")
+    for cache, valores in informe.get("caches", {}).items():
+        for resultado in ('aciertos', 'fallos'):
+            lineas.append(f'pmdb_cache_total{{cache="{cache}",resultado="{resultado}"}} {valores[resultado]}')
+
+    estadisticas = informe.get("estadisticas", {})
+    lineas.append("# TYPE pmdb_peliculas gauge")
+    for clave in ('total_procesadas', 'encontradas', 'no_encontradas'):
+        lineas.append(f'pmdb_peliculas{{estado="{clave}"}} {estadisticas.get(clave, 0)}')
+    lineas.append("# TYPE pmdb_ultima_ejecucion_segundos gauge")
+    lineas.append(f"pmdb_ultima_ejecucion_segundos {informe['duracion_segundos']}")
+    lineas.append("# TYPE pmdb_ultima_ejecucion_timestamp_seconds gauge")
+    lineas.append(f"pmdb_ultima_ejecucion_timestamp_seconds {int(time.time())}")
+    return "\n".join(lineas) + "\n"
+
+def guardar_informe_metricas(informe, ruta_metadata, config):
+    opciones = config.get('informe_metricas', {})
+    if not opciones.get('activado', True):
+        return None
+
+    ruta_informe = Path(opciones.get('ruta') or Path(ruta_metadata).with_name('pmdb-informe.json'))
+    try:
+        with escribir_atomico(ruta_informe) as f:
+            json.dump(informe, f, ensure_ascii=False, indent=2)
+        # Para el textfile collector de node_exporter: el archivo se reemplaza de forma atómica
+        if opciones.get('prometheus'):
+            with escribir_atomico(opciones['prometheus']) as f:
+                f.write(formato_prometheus(informe))
+    except OSError as e:
+        logging.warning(f"No se pudo guardar el informe de métricas: {e}")
+        return None
+    return ruta_informe
+
+class SesionTMDb:
+    def __init__(self, cache=None, sesion=None):
+        self.sesion = sesion or obtener_sesion_http()
+        self.cache = cache
+
+    def request(self, method, url, params=None, **kwargs):
+        ruta = ruta_tmdb(url)
+        kwargs.setdefault('timeout', config['timeout_descargas'])
+
+        if self.cache is None or method.upper() != 'GET' or ruta in ENDPOINTS_SIN_CACHE:
+            return self._peticion_red(ruta, method, url, params, **kwargs)
+
+        endpoint = CacheTMDb.clasificar_endpoint(ruta)
+        clave = CacheTMDb.generar_clave(ruta, params)
+        cuerpo = self.cache.obtener(clave, endpoint)
+        if cuerpo is not None:
+            return self._respuesta_desde_cache(url, cuerpo)
+
+        respuesta = self._peticion_red(ruta, method, url, params, **kwargs)
+        if respuesta.status_code == 200:
+            self.cache.guardar(clave, endpoint, respuesta.content)
+        return respuesta
+
+    def _peticion_red(self, ruta, method, url, params, **kwargs):
+        estadisticas_hilos.actual().peticiones_api += 1
+        with metricas.medir(operacion_tmdb(ruta)) as medicion:
+            respuesta = peticion_limitada(self.sesion, method, url, params=params, **kwargs)
+            medicion['error'] = respuesta.status_code != 200
+            medicion['bytes'] = len(respuesta.content)
+        return respuesta
+
+    @staticmethod
+    def _respuesta_desde_cache(url, cuerpo):
+        import requests
+        respuesta = requests.models.Response()
+        respuesta.status_code = 200
+        respuesta.url = url
+        respuesta.encoding = 'utf-8'
+        respuesta.headers['Content-Type'] = 'application/json'
+        respuesta._content = cuerpo
+        return respuesta
+
+    def close(self):
+        # La sesión HTTP es compartida; se cierra con cerrar_sesion_http()
+        pass
+
+class ErrorRespuestaHTTP(Exception):
+    def __init__(self, estado, url):
+        super().__init__(f"HTTP {estado} para {url}")
+        self.estado = estado
+
+class RespuestaTMDbAsync:
+    def __init__(self, cuerpo):
+        self.cuerpo = cuerpo
+
+    async def json(self):
+        return json.loads(self.cuerpo)
+
+class SesionTMDbAsync:
+    # Equivalente de SesionTMDb para aioTMDb: misma caché, pero las peticiones de red pasan
+    # por el motor asíncrono (semáforo por host + limitador)
+    def __init__(self, motor):
+        self.motor = motor
+
+    async def request(self, method, url, params=None, **kwargs):
+        ruta = ruta_tmdb(url)
+        cache = self.motor.cache
+        usar_cache = cache is not None and method.upper() == 'GET' and ruta not in ENDPOINTS_SIN_CACHE
+
+        if usar_cache:
+            endpoint = CacheTMDb.clasificar_endpoint(ruta)
+            clave = CacheTMDb.generar_clave(ruta, params)
+            cuerpo = await asyncio.to_thread(cache.obtener, clave, endpoint)
+            if cuerpo is not None:
+                return RespuestaTMDbAsync(cuerpo)
+
+        estadisticas_hilos.actual().peticiones_api += 1
+        with metricas.medir(operacion_tmdb(ruta)) as medicion:
+            estado, cuerpo = await self.motor.peticion(url, params)
+            medicion['error'] = estado != 200
+            medicion['bytes'] = len(cuerpo)
+        if estado != 200:
+            raise ErrorRespuestaHTTP(estado, url)
+        if usar_cache:
+            await asyncio.to_thread(cache.guardar, clave, endpoint, cuerpo)
+        return RespuestaTMDbAsync(cuerpo)
+
+class PoolClientesTMDb:
+    # Un cliente por idioma, creado una sola vez y nunca modificado: el idioma es un
+    # parámetro de cada llamada y no estado compartido entre los hilos.
+    def __init__(self, api_key, cache=None):
+        self.api_key = api_key
+        self.cache = cache
+        self.clientes = {}
+        self.lock = threading.Lock()
+
+    def cliente(self, idioma):
+        from themoviedb import TMDb
+        with self.lock:
+            if idioma not in self.clientes:
+                self.clientes[idioma] = TMDb(key=self.api_key, language=idioma, session=SesionTMDb(self.cache))
+            return self.clientes[idioma]
+
+    def cerrar(self):
+        with self.lock:
+            for cliente in self.clientes.values():
+                cliente.session.close()
+            self.clientes.clear()
+
+def crear_cache_tmdb(config):
+    opciones = config.get('cache_tmdb', {})
+    if not opciones.get('activado', True):
+        return None
+
+    ruta_db = opciones.get('ruta') or Path(config['ruta_peliculas']) / '.pmdb-cache.sqlite'
+    try:
+        return CacheTMDb(
+            ruta_db,
+            ttl_horas=opciones.get('ttl_horas'),
+            tamano_maximo_mb=opciones.get('tamano_maximo_mb', 256)
+        )
+    except sqlite3.Error as e:
+        logging.warning(f"No se pudo abrir la caché TMDb en {ruta_db}: {e}")
+        return None
 
 def descargar_imagen(url, ruta_destino):
+    return descargar_imagen_estado(url, ruta_destino) == 200
+
+@medido('descargar_imagen', exito=lambda estado: estado == 200)
+def descargar_imagen_estado(url, ruta_destino):
+    # Devuelve el último código HTTP; None si se agotaron los reintentos por errores de red.
+    # Se descarga a un .tmp junto al destino: un corte a medias no pisa la imagen que ya había.
+    import requests
+    estado = None
+    limitador = obtener_limitador(url)
     for intento in range(config['max_reintentos']):
         try:
-            response = requests.get(url, stream=True, timeout=config['timeout_descargas'])
+            if limitador:
+                limitador.adquirir()
+            response = obtener_sesion_http().get(url, stream=True, timeout=config['timeout_descargas'])
             if response.status_code == 200:
-                extension = Path(url).suffix.lower()
-                ruta_destino_con_extension = f"{ruta_destino}{extension}"
+                ruta_destino_con_extension = f"{ruta_destino}{Path(url).suffix.lower()}"
+                ruta_temporal = f"{ruta_destino_con_extension}.tmp"
+                try:
+                    with open(ruta_temporal, 'wb') as f:
+                        for bloque in response.iter_content(chunk_size=64 * 1024):
+                            f.write(bloque)
+                        descargados = f.tell()
+                    os.replace(ruta_temporal, ruta_destino_con_extension)
+                finally:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.unlink(ruta_temporal)
+                estadisticas_hilos.actual().bytes_descargados += descargados
+                metricas.sumar_bytes('descargar_imagen', descargados)
+                return 200
+
+            estado = response.status_code
+            if response.status_code not in CODIGOS_REINTENTABLES:
+                logging.warning(f"Respuesta {response.status_code} al descargar {url}")
+                break
 
-                with open(ruta_destino_con_extension, 'wb') as f:
-                    response.raw.decode_content = True
-                    shutil.copyfileobj(response.raw, f)
-                return True
+            retry_after = leer_retry_after(response)
+            espera = calcular_espera_reintento(intento, retry_after)
+            if limitador and response.status_code == 429:
+                limitador.pausar(espera)
+            metricas.contar(f"reintentos_http_{response.status_code}")
+            logging.warning(f"Intento {intento + 1} fallido para {url}: HTTP {response.status_code}")
+            response.close()
+            time.sleep(espera)
         except requests.exceptions.RequestException as e:
+            metricas.contar("reintentos_red")
             logging.warning(f"Intento {intento + 1} fallido para {url}: {e}")
-            time.sleep((2 ** intento) * 1)
+            estado = None
+            time.sleep(calcular_espera_reintento(intento))
     logging.error(f"Error al descargar imagen: {url}")
-    return False
+    return estado
 
 def crear_carpetas_imagenes(ruta_base):
     media_path = Path(ruta_base) / 'media'
@@ -236,43 +1213,324 @@ def crear_carpetas_imagenes(ruta_base):
     return carpetas
 
 def validar_api_key(api_key, config):
+    from themoviedb import TMDb
     try:
-        tmdb = TMDb(key=api_key, language=config['idiomas'][0])
+        tmdb = TMDb(key=api_key, language=config['idiomas'][0], session=SesionTMDb())
         tmdb.movies().top_rated()
         return True
     except Exception as e:
         logging.error(f"Error validando API key: {e}")
         return False
 
+def validar_api_key_cacheada(config):
+    # La validación cuesta una petición y la carga de themoviedb; con validez_api_key_horas > 0 se
+    # recuerda la última validación correcta de esta clave (guardada como hash, no en claro)
+    horas = config.get('validez_api_key_horas', 24)
+    ruta = Path(config['ruta_peliculas']) / '.pmdb-api.json'
+    huella = hashlib.sha256(config['api_key'].encode('utf-8')).hexdigest()
+    if horas:
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                validacion = json.load(f)
+            if validacion.get('huella') == huella and 0 <= time.time() - validacion.get('validada', 0) < horas * 3600:
+                return True
+        except (OSError, ValueError, AttributeError, TypeError):
+            pass
+
+    if not validar_api_key(config['api_key'], config):
+        return False
+    if horas:
+        try:
+            with escribir_atomico(ruta) as f:
+                json.dump({"huella": huella, "validada": time.time()}, f)
+        except OSError as e:
+            logging.warning(f"No se pudo guardar la validación de la API key en {ruta}: {e}")
+    return True
+
+class IndiceMedia:
+    # Nombre base -> assets de las carpetas de media, leídas una sola vez al inicio en lugar de
+    # un glob por carpeta y por vídeo. Las descargas se registran al terminar.
+    def __init__(self, carpetas_imagenes):
+        self.carpetas = {tipo.lower(): Path(carpeta) for tipo, carpeta in carpetas_imagenes.items()}
+        self.por_nombre = {tipo: {} for tipo in self.carpetas}
+        self.lock = threading.Lock()
+
+        for tipo, carpeta in self.carpetas.items():
+            try:
+                with os.scandir(carpeta) as entradas:
+                    for entrada in entradas:
+                        nombre_base, punto, _ = entrada.name.rpartition('.')
+                        if punto and entrada.is_file():
+                            self.por_nombre[tipo].setdefault(nombre_base, []).append(entrada.path)
+            except OSError as e:
+                logging.warning(f"No se pudo leer la carpeta de media {carpeta}: {e}")
+
+    def assets(self, nombre_base):
+        with self.lock:
+            return {tipo: (rutas.get(nombre_base) or [None])[0] for tipo, rutas in self.por_nombre.items()}
+
+    def registrar(self, ruta):
+        ruta = Path(ruta)
+        tipo = ruta.parent.name.lower()
+        if tipo not in self.por_nombre:
+            return
+        with self.lock:
+            rutas = self.por_nombre[tipo].setdefault(ruta.stem, [])
+            if str(ruta) not in rutas:
+                rutas.append(str(ruta))
+
+    def quitar(self, nombre_base):
+        with self.lock:
+            return [ruta for rutas in self.por_nombre.values() for ruta in rutas.pop(nombre_base, [])]
+
+indice_media = None
+
+def construir_indice_media(carpetas_imagenes):
+    global indice_media
+    indice_media = IndiceMedia(carpetas_imagenes)
+    return indice_media
+
+def registrar_asset_media(ruta):
+    if indice_media is not None:
+        indice_media.registrar(ruta)
+
 def archivo_tiene_imagenes(archivo, carpetas_imagenes):
-    nombre_base = archivo.stem
-    imagenes_existentes = {
-        'boxfront': None,
-        'screenshot': None,
-        'wheel': None,
-        'video': None
-    }
+    indice = indice_media or construir_indice_media(carpetas_imagenes)
+    return indice.assets(archivo.stem)
 
-    for tipo, carpeta in carpetas_imagenes.items():
-        for archivo_imagen in carpeta.glob(f"{nombre_base}.*"):
-            imagenes_existentes[tipo.lower()] = str(archivo_imagen)
-            break
+EXTENSIONES_VIDEO = ('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.ts')
 
-    return imagenes_existentes
+def escanear_videos(ruta):
+    # Recorrido con os.scandir: tamaño y fecha salen de la propia entrada del directorio y la
+    # carpeta media/ (imágenes y tráileres generados) no se recorre.
+    raiz = str(Path(ruta))
+    archivos = {}
+    directorios = [raiz]
+    enlaces_visitados = set()
+
+    while directorios:
+        directorio = directorios.pop()
+        try:
+            with os.scandir(directorio) as entradas:
+                for entrada in entradas:
+                    try:
+                        if entrada.is_dir():
+                            if directorio == raiz and entrada.name == 'media':
+                                continue
+                            if entrada.is_symlink():
+                                destino = os.path.realpath(entrada.path)
+                                if destino in enlaces_visitados:
+                                    continue
+                                enlaces_visitados.add(destino)
+                            directorios.append(entrada.path)
+                        elif entrada.name.lower().endswith(EXTENSIONES_VIDEO) and entrada.is_file():
+                            estado = entrada.stat()
+                            archivos[entrada.path] = [estado.st_size, estado.st_mtime_ns]
+                    except OSError as e:
+                        logging.warning(f"No se pudo leer {entrada.path}: {e}")
+        except OSError as e:
+            logging.error(f"Error al acceder a la ruta {directorio}: {e}")
 
-def obtener_archivos_video(ruta):
-    extensiones_video = ('.mp4', '.mkv', '.avi', '.mov', '.wmv', '.flv', '.mpeg', '.ts')
-    archivos = []
-    try:
-        for archivo in Path(ruta).glob('**/*'):
-            if "media/video" in str(archivo):
-                continue
-            if archivo.is_file() and archivo.suffix.lower() in extensiones_video and archivo.name != "metadata.json":
-                archivos.append(archivo)
-    except Exception as e:
-        logging.error(f"Error al acceder a la ruta: {e}")
     return archivos
 
+@contextlib.contextmanager
+def escribir_atomico(ruta):
+    # Se escribe en un temporal de la misma carpeta y se renombra al terminar: si el proceso se
+    # corta a mitad, el archivo anterior queda intacto en lugar de truncado
+    ruta = Path(ruta)
+    temporal = ruta.with_name(f".{ruta.name}.{os.getpid()}.tmp")
+    try:
+        with open(temporal, 'w', encoding='utf-8') as f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporal, ruta)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            temporal.unlink()
+        raise
+
+def leer_manifiesto(ruta_manifiesto):
+    try:
+        with open(ruta_manifiesto, 'r', encoding='utf-8') as f:
+            manifiesto = json.load(f)
+        if not isinstance(manifiesto, dict):
+            raise ValueError("formato no válido")
+        return manifiesto
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"No se pudo leer el manifiesto {ruta_manifiesto}: {e}")
+        return None
+
+def guardar_manifiesto(ruta_manifiesto, archivos, tamanos_imagenes=None, proxima_revision=None):
+    # tamanos_imagenes solo se guarda cuando todas las imágenes ya están en el tamaño configurado;
+    # proxima_revision es cuándo vence la primera búsqueda sin resultado que hay que repetir
+    datos = {"version": 1, "archivos": archivos}
+    if tamanos_imagenes:
+        datos["tamanos_imagenes"] = tamanos_imagenes
+    if proxima_revision is not None:
+        datos["proxima_revision"] = proxima_revision
+    try:
+        with escribir_atomico(ruta_manifiesto) as f:
+            json.dump(datos, f, ensure_ascii=False)
+    except OSError as e:
+        logging.warning(f"No se pudo guardar el manifiesto {ruta_manifiesto}: {e}")
+
+def comparar_manifiesto(anterior, actual):
+    anterior = anterior or {}
+    cambios = {'nuevos': [], 'modificados': [], 'movidos': [], 'eliminados': []}
+
+    agregados = []
+    for ruta, identidad in actual.items():
+        previa = anterior.get(ruta)
+        if previa is None:
+            agregados.append(ruta)
+        elif list(previa) != list(identidad):
+            cambios['modificados'].append(ruta)
+
+    # Un archivo movido a otra carpeta conserva nombre, tamaño y fecha de modificación. Un
+    # renombrado cuenta como eliminado + nuevo, porque el nombre es lo que se busca en TMDB.
+    desaparecidos = {}
+    for ruta in anterior:
+        if ruta not in actual:
+            desaparecidos.setdefault((os.path.basename(ruta), *anterior[ruta]), []).append(ruta)
+
+    for ruta in agregados:
+        origenes = desaparecidos.get((os.path.basename(ruta), *actual[ruta]))
+        if origenes:
+            cambios['movidos'].append((origenes.pop(), ruta))
+        else:
+            cambios['nuevos'].append(ruta)
+
+    cambios['eliminados'] = [ruta for origenes in desaparecidos.values() for ruta in origenes]
+    return cambios
+
+def biblioteca_sin_cambios(manifiesto, archivos_biblioteca, ruta_manifiesto, ruta_metadata, ruta_diario, config):
+    # Camino rápido para las ejecuciones periódicas: con los mismos archivos, el mismo tamaño de
+    # imágenes, sin diario pendiente y sin búsquedas sin resultado por repetir no hay nada que
+    # buscar ni que reescribir. Se decide solo con
+    # el escaneo y el manifiesto, antes de cargar metadata.json o de tocar la red.
+    if manifiesto is None or ruta_diario.exists():
+        return False
+    try:
+        if ruta_metadata.stat().st_mtime_ns > ruta_manifiesto.stat().st_mtime_ns:
+            return False
+    except OSError:
+        return False
+    if manifiesto.get('tamanos_imagenes') != config['tamanos_imagenes']:
+        return False
+    if manifiesto.get('proxima_revision') is not None and manifiesto['proxima_revision'] <= time.time():
+        return False
+    cambios = comparar_manifiesto(manifiesto.get('archivos'), archivos_biblioteca)
+    return not any(cambios.values())
+
+def aplicar_cambios_biblioteca(catalogo, cambios):
+    if not cambios:
+        return
+    catalogo.eliminar(cambios['eliminados'])
+    for origen, destino in cambios['movidos']:
+        catalogo.mover(origen, destino)
+
+class DiarioResultados:
+    # Diario JSONL con cada resultado en cuanto termina. Si la ejecución se corta (cierre,
+    # corte de luz, Ctrl-C), la siguiente lo vuelca en metadata.json y solo procesa lo pendiente.
+    def __init__(self, ruta):
+        self.ruta = Path(ruta)
+        self.lock = threading.Lock()
+        self.archivo = None
+
+    def registrar(self, item):
+        linea = json.dumps(item, ensure_ascii=False)
+        with self.lock:
+            if self.archivo is None:
+                self.archivo = open(self.ruta, 'a', encoding='utf-8')
+            self.archivo.write(linea + '\n')
+            self.archivo.flush()
+            os.fsync(self.archivo.fileno())
+
+    def cerrar(self):
+        with self.lock:
+            if self.archivo is not None:
+                self.archivo.close()
+                self.archivo = None
+
+    def descartar(self):
+        self.cerrar()
+        try:
+            self.ruta.unlink()
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def leer(ruta):
+        items = []
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                for numero, linea in enumerate(f, 1):
+                    if not linea.strip():
+                        continue
+                    try:
+                        items.append(json.loads(linea))
+                    except ValueError:
+                        # La última línea puede haber quedado a medias si el corte fue durante la escritura
+                        logging.warning(f"Línea {numero} incompleta en el diario {ruta}, se ignora")
+        except FileNotFoundError:
+            pass
+        return items
+
+def recuperar_diario(ruta_diario, ruta_metadata, ruta_manifiesto):
+    entradas = [entrada for entrada in DiarioResultados.leer(ruta_diario) if entrada.get("item")]
+    if entradas:
+        datos = metadata_vacia()
+        estadisticas = Estadisticas()
+        for entrada in entradas:
+            datos["metadata"].append(entrada["item"])
+            if not entrada.get("cambio_tamano"):
+                estadisticas.contabilizar(entrada["item"])
+        datos["estadisticas"] = estadisticas.como_dict()
+        actualizar_metadata(datos, ruta_metadata)
+
+        # Los archivos recuperados quedan en el manifiesto con la identidad que tenían al procesarse
+        manifiesto = leer_manifiesto(ruta_manifiesto) or {}
+        archivos = manifiesto.get('archivos', {})
+        for entrada in entradas:
+            if entrada.get("identidad"):
+                archivos[entrada["item"]["archivo_original"]] = entrada["identidad"]
+        guardar_manifiesto(ruta_manifiesto, archivos, manifiesto.get('tamanos_imagenes'), manifiesto.get('proxima_revision'))
+        logging.info(f"Recuperados {len(entradas)} resultados del diario de una ejecución interrumpida")
+
+    DiarioResultados(ruta_diario).descartar()
+    return len(entradas)
+
+def instalar_manejador_senales(detener):
+    # Primera señal: no se empiezan archivos nuevos y se terminan los que están en curso.
+    # Segunda señal: salida inmediata; el diario ya tiene todo lo terminado.
+    def manejar(numero, frame):
+        if detener.is_set():
+            matar_procesos_yt_dlp()
+            raise KeyboardInterrupt
+        detener.set()
+        logging.warning(f"Señal {numero} recibida: terminando los archivos en curso antes de salir")
+        print(f"\n{get_translation('interrupted', config['interface_language'])}")
+
+    anteriores = {}
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        try:
+            anteriores[senal] = signal.signal(senal, manejar)
+        except (ValueError, OSError):
+            pass
+    return anteriores
+
+def restaurar_manejadores_senales(anteriores):
+    for senal, manejador in anteriores.items():
+        signal.signal(senal, manejador)
+
+def rutas_catalogadas(catalogo, cambios):
+    destinos = dict(cambios['movidos'])
+    eliminados = set(cambios['eliminados'])
+    return {destinos.get(ruta, ruta) for ruta in catalogo.rutas() if ruta not in eliminados}
+
 def extraer_nombre_pelicula(nombre_archivo):
     nombre = Path(nombre_archivo).stem
     nombre = re.sub(r'(?<!\d)[\-_.()\[\]](?!\d)', ' ', nombre)
@@ -281,150 +1539,274 @@ def extraer_nombre_pelicula(nombre_archivo):
     nombre = re.sub(r'\s*\(\d{4}\)$', '', nombre)
     return nombre.strip()
 
-def descargar_trailer(tmdb, pelicula_id, ruta_destino, calidad):
-    try:
-        sys.stdout = open(os.devnull, 'w')
-        sys.stderr = open(os.devnull, 'w')
-        idioma_original = tmdb.language
+FORMATOS_TRAILER = {
+    "240p": "bestvideo[height<=240]+bestaudio/best[height<=240]",
+    "360p": "bestvideo[height<=360]+bestaudio/best[height<=360]",
+    "480p": "bestvideo[height<=480]+bestaudio/best[height<=480]",
+    "720p": "bestvideo[height<=720]+bestaudio/best[height<=720]",
+    "1080p": "bestvideo[height<=1080]+bestaudio/best[height<=1080]"
+}
 
-        for idioma in config['trailer_lenguaje']:
-            try:
-                tmdb.language = idioma
-                videos = tmdb.movie(pelicula_id).videos()
-
-                if videos:
-                    trailers = [video for video in videos if video.type == "Trailer"]
-                    if trailers:
-                        logging.info(f"Se encontraron {len(trailers)} tráilers para la película ID {pelicula_id} en idioma {idioma}")
-                        # Obtener la URL del tráiler
-                        for trailer in trailers:
-                            if trailer.site == "YouTube":
-                                trailer_url = f"https://www.youtube.com/watch?v={trailer.key}"
-                                logging.info(f"Intentando descargar tráiler desde YouTube: {trailer_url}")
-
-                                calidad_mapping = {
-                                    "240p": "bestvideo[height<=240]+bestaudio/best[height<=240]",
-                                    "360p": "bestvideo[height<=360]+bestaudio/best[height<=360]",
-                                    "480p": "bestvideo[height<=480]+bestaudio/best[height<=480]",
-                                    "720p": "bestvideo[height<=720]+bestaudio/best[height<=720]",
-                                    "1080p": "bestvideo[height<=1080]+bestaudio/best[height<=1080]"
-                                }
-
-                                formato = calidad_mapping.get(calidad.lower(), "bestvideo[height<=240]+bestaudio/best[height<=240]")
-
-                                try:
-                                    ydl_opts = {
-                                        'format': formato,
-                                        'outtmpl': f"{ruta_destino}.%(ext)s",
-                                        'quiet': True,
-                                        'no_warnings': True,
-                                        'merge_output_format': 'mp4',
-                                        'geo_bypass': True,
-                                        'ignoreerrors': True,
-                                        'no_check_certificate': True,
-                                    }
-
-                                    with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                                        ydl.download([trailer_url])
-                                        if Path(f"{ruta_destino}.mp4").exists():
-                                            logging.info(f"Tráiler descargado exitosamente: {ruta_destino}.mp4")
-                                            return True
-                                except Exception as e:
-                                    logging.error(f"Error al descargar tráiler: {e}")
-                                    continue
+def claves_trailer(clientes_tmdb, pelicula):
+    # Los vídeos en el idioma de los detalles ya vienen en la respuesta (append_to_response);
+    # solo se piden aparte los de otros idiomas de trailer_lenguaje
+    idioma_detalles = idiomas_metadata(config)[0]
+    vistas = set()
+    for idioma in config['trailer_lenguaje']:
+        try:
+            if idioma == idioma_detalles and getattr(pelicula, 'videos', None) is not None:
+                videos = pelicula.videos
+            else:
+                videos = clientes_tmdb.cliente(idioma).movie(pelicula.id).videos()
+        except Exception as e:
+            logging.error(f"Error en el idioma {idioma}: {e}")
+            continue
 
-            except Exception as e:
-                logging.error(f"Error en el idioma {idioma}: {e}")
-                continue
+        for video in videos:
+            if video.type == "Trailer" and video.site == "YouTube" and video.key not in vistas:
+                vistas.add(video.key)
+                yield idioma, video.key
+
+procesos_yt_dlp = set()
+procesos_yt_dlp_lock = threading.RLock()
 
-        tmdb.language = idioma_original
+def matar_grupo_proceso(proceso):
+    # yt-dlp corre en su propia sesión: se mata el grupo entero para no dejar huérfano al ffmpeg de la mezcla
+    if os.name == 'nt':
+        proceso.kill()
+        return
+    with contextlib.suppress(ProcessLookupError):
+        os.killpg(proceso.pid, signal.SIGKILL)
+
+def matar_procesos_yt_dlp():
+    # RLock: también se llama desde el manejador de señales, que corre en el hilo principal
+    with procesos_yt_dlp_lock:
+        for proceso in list(procesos_yt_dlp):
+            matar_grupo_proceso(proceso)
+
+def borrar_restos_mezcla(ruta_destino):
+    # Restos de la mezcla de formatos (.fNNN.*, .temp.*). Los .part y .ytdl se conservan para que
+    # yt-dlp retome la descarga con --continue en la siguiente ejecución.
+    ruta_destino = Path(ruta_destino)
+    restos = re.compile(re.escape(ruta_destino.name) + r'\.(f[\w-]+|temp)\.')
+    for ruta in ruta_destino.parent.iterdir():
+        if not restos.match(ruta.name) or ruta.suffix in ('.part', '.ytdl') or not ruta.is_file():
+            continue
+        try:
+            ruta.unlink()
+        except OSError as e:
+            logging.warning(f"No se pudo borrar {ruta}: {e}")
+
+def ejecutar_yt_dlp(url, ruta_destino, formato):
+    # yt-dlp corre en su propio proceso: su salida se captura por trabajo (sin tocar sys.stdout
+    # de los demás hilos ni la barra de progreso), no compite por el GIL con los workers de
+    # metadata y el timeout lo puede matar. Con --continue, el .part que deje un timeout o una
+    # interrupción se retoma en la siguiente ejecución.
+    comando = [
+        sys.executable, '-m', 'yt_dlp',
+        '--format', formato,
+        '--output', f"{ruta_destino}.%(ext)s",
+        '--merge-output-format', 'mp4',
+        '--continue',
+        '--no-playlist',
+        '--no-progress',
+        '--no-check-certificates',
+        url
+    ]
+    timeout = config.get('timeout_trailer', 600)
+    try:
+        proceso = subprocess.Popen(comando, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                   text=True, encoding='utf-8', errors='replace', start_new_session=True)
+    except OSError as e:
+        logging.error(f"No se pudo ejecutar yt-dlp: {e}")
         return False
 
-    except Exception as e:
-        logging.error(f"Error general en descargar_trailer: {e}")
+    with procesos_yt_dlp_lock:
+        procesos_yt_dlp.add(proceso)
+    try:
+        salida, _ = proceso.communicate(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        matar_grupo_proceso(proceso)
+        proceso.communicate()
+        borrar_restos_mezcla(ruta_destino)
+        logging.warning(f"El tráiler {url} superó {timeout}s; la descarga parcial se retomará en la próxima ejecución")
         return False
     finally:
-        sys.stdout = sys.__stdout__
-        sys.stderr = sys.__stderr__
+        with procesos_yt_dlp_lock:
+            procesos_yt_dlp.discard(proceso)
 
-def obtener_duracion_con_ffprobe(ruta_archivo):
+    if proceso.returncode != 0:
+        ultimas_lineas = " | ".join(salida.strip().splitlines()[-3:])
+        logging.warning(f"yt-dlp terminó con código {proceso.returncode} para {url}: {ultimas_lineas}")
+        return False
+    logging.debug(f"Salida de yt-dlp para {url}:\n{salida}")
+    return True
+
+@medido('descargar_trailer')
+def descargar_trailer(clientes_tmdb, pelicula, ruta_destino, calidad):
+    formato = FORMATOS_TRAILER.get(calidad.lower(), FORMATOS_TRAILER["240p"])
+    ruta_video = Path(f"{ruta_destino}.mp4")
 
     try:
-        comando = [
-            'ffprobe', '-v', 'error', '-show_entries', 'format=duration',
-            '-of', 'default=noprint_wrappers=1:nokey=1', ruta_archivo
-        ]
-        resultado = subprocess.run(comando, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-
-        if resultado.returncode == 0:
-            duracion_segundos = float(resultado.stdout.strip())
-            return int(duracion_segundos)
-        else:
-            logging.warning(f"No se pudo obtener la duración con ffprobe para {ruta_archivo}: {resultado.stderr}")
-            return None
+        for idioma, clave in claves_trailer(clientes_tmdb, pelicula):
+            trailer_url = f"https://www.youtube.com/watch?v={clave}"
+            logging.info(f"Intentando descargar tráiler ({idioma}) desde YouTube: {trailer_url}")
+
+            if ejecutar_yt_dlp(trailer_url, ruta_destino, formato) and ruta_video.exists():
+                tamano = ruta_video.stat().st_size
+                logging.info(f"Tráiler descargado exitosamente: {ruta_video}")
+                estadisticas_hilos.actual().bytes_descargados += tamano
+                metricas.sumar_bytes('descargar_trailer', tamano)
+                return True
+        return False
+
     except Exception as e:
-        logging.error(f"Error al ejecutar ffprobe para {ruta_archivo}: {e}")
-        return None
+        logging.error(f"Error general en descargar_trailer: {e}")
+        return False
 
-def obtener_info_tecnica(ruta_archivo):
-    try:
-        cmd = [
-            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
-            '-show_entries', 'stream=codec_name,width,height,display_aspect_ratio',
-            '-of', 'default=noprint_wrappers=1:nokey=1', ruta_archivo
-        ]
-        video_info = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).stdout.strip().split('\n')
-
-        cmd_audio = [
-            'ffprobe', '-v', 'error', '-select_streams', 'a:0',
-            '-show_entries', 'stream=codec_name,channels',
-            '-of', 'default=noprint_wrappers=1:nokey=1', ruta_archivo
-        ]
-        audio_info = subprocess.run(cmd_audio, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True).stdout.strip().split('\n')
-
-        if len(video_info) >= 3 and len(audio_info) >= 2:
-            codec = video_info[0].upper()
-            width = int(video_info[1])
-            height = int(video_info[2])
-            aspect_ratio = video_info[3] if len(video_info) > 3 else "1.85:1"
-            audio_codec = audio_info[0].upper()
-            channels = int(audio_info[1])
+COMANDO_FFPROBE = ['ffprobe', '-v', 'error', '-print_format', 'json', '-show_streams', '-show_format']
+
+INFO_TECNICA_DESCONOCIDA = {
+    "x-codec": "Unknown",
+    "x-resolution": "Unknown",
+    "x-aspect": "Unknown",
+    "x-audio": "Unknown",
+    "duracion": None
+}
 
+def interpretar_ffprobe(datos):
+    # Cada campo se interpreta por separado: si falta el audio o el aspecto, el resto se conserva
+    info = dict(INFO_TECNICA_DESCONOCIDA)
+    streams = datos.get('streams') or []
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'
+                  and not (stream.get('disposition') or {}).get('attached_pic')), None)
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), None)
+
+    if video:
+        if video.get('codec_name'):
+            info['x-codec'] = video['codec_name'].upper()
+
+        width = int(video.get('width') or 0)
+        height = int(video.get('height') or 0)
+        if width or height:
             if width >= 1920 or height >= 1080:
-                resolution = "1080 HD"
+                info['x-resolution'] = "1080 HD"
             elif width >= 1280 or height >= 720:
-                resolution = "720 HD"
+                info['x-resolution'] = "720 HD"
             else:
-                resolution = "SD"
+                info['x-resolution'] = "SD"
 
-            if channels >= 6:
-                audio = "DOLBY 5.1"
-            elif channels >= 2:
-                audio = "Stereo"
-            else:
-                audio = "Mono"
+        aspecto = video.get('display_aspect_ratio')
+        info['x-aspect'] = aspecto if aspecto and aspecto not in ('0:1', 'N/A') else "1.85:1"
 
-            return {
-                "x-codec": codec,
-                "x-resolution": resolution,
-                "x-aspect": aspect_ratio,
-                "x-audio": audio
-            }
+    if audio and audio.get('channels'):
+        channels = int(audio['channels'])
+        if channels >= 6:
+            info['x-audio'] = "DOLBY 5.1"
+        elif channels >= 2:
+            info['x-audio'] = "Stereo"
+        else:
+            info['x-audio'] = "Mono"
+
+    duracion = (datos.get('format') or {}).get('duration') or (video or {}).get('duration')
+    try:
+        info['duracion'] = int(float(duracion))
+    except (TypeError, ValueError):
+        pass
+
+    return info
+
+def interpretar_salida_ffprobe(codigo_salida, salida, errores, ruta_archivo):
+    if codigo_salida != 0:
+        logging.warning(f"ffprobe no pudo analizar {ruta_archivo}: {errores.strip()}")
+        return dict(INFO_TECNICA_DESCONOCIDA)
+    try:
+        return interpretar_ffprobe(json.loads(salida or '{}'))
+    except (ValueError, TypeError, AttributeError) as e:
+        logging.error(f"Error al interpretar la salida de ffprobe para {ruta_archivo}: {e}")
+        return dict(INFO_TECNICA_DESCONOCIDA)
+
+def obtener_info_tecnica(ruta_archivo):
+    info, identidad = consultar_cache_sondeos(ruta_archivo)
+    if info is not None:
+        return info
+
+    # Una sola llamada a ffprobe por archivo: códec, resolución, aspecto, canales y duración
+    try:
+        with metricas.medir('ffprobe') as medicion:
+            resultado = subprocess.run(COMANDO_FFPROBE + [str(ruta_archivo)], stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+            medicion['error'] = resultado.returncode != 0
     except Exception as e:
         logging.error(f"Error al obtener información técnica para {ruta_archivo}: {e}")
+        return dict(INFO_TECNICA_DESCONOCIDA)
 
+    info = interpretar_salida_ffprobe(resultado.returncode, resultado.stdout, resultado.stderr, ruta_archivo)
+    guardar_cache_sondeos(ruta_archivo, identidad, info)
+    return info
+
+def idiomas_metadata(config):
+    idiomas = config['metadata_language']
+    if isinstance(idiomas, str):
+        return [idiomas]
+    return list(idiomas)
+
+def parametros_pelicula_completa(idioma):
+    # Una sola petición con todo lo que usa el scraper: créditos, imágenes (logos en el idioma
+    # principal, inglés y sin idioma), vídeos, clasificaciones y traducciones para los textos.
     return {
-        "x-codec": "Unknown",
-        "x-resolution": "Unknown",
-        "x-aspect": "Unknown",
-        "x-audio": "Unknown"
+        'append_to_response': "credits,images,videos,release_dates,translations",
+        'image_language': f"{idioma.split('-')[0]},en,null"
     }
 
-def obtener_clasificacion_mpa(tmdb, pelicula_id):
+def obtener_pelicula_completa(clientes_tmdb, pelicula_id, idioma):
+    return clientes_tmdb.cliente(idioma).movie(pelicula_id).details(**parametros_pelicula_completa(idioma))
+
+def obtener_textos_pelicula(pelicula, idiomas):
+    descripcion = None
+    tagline = None
+    traducciones = pelicula.translations.translations if pelicula.translations and pelicula.translations.translations else []
+
+    for i, idioma in enumerate(idiomas):
+        if i == 0:
+            overview, texto_tagline = pelicula.overview, pelicula.tagline
+        else:
+            partes = idioma.split('-')
+            candidatas = [t for t in traducciones if t.data and t.iso_639_1 == partes[0]]
+            exactas = [t for t in candidatas if len(partes) > 1 and t.iso_3166_1 == partes[1]]
+            traduccion = (exactas or candidatas or [None])[0]
+            if not traduccion:
+                continue
+            overview, texto_tagline = traduccion.data.overview, traduccion.data.tagline
+
+        if not descripcion and overview:
+            descripcion = overview
+        if not tagline and texto_tagline:
+            tagline = texto_tagline
+        if descripcion and tagline:
+            break
+
+    return descripcion, tagline
+
+def seleccionar_logo(logos, idioma):
+    metadata_lang = idioma.split('-')[0]
+    logos_ordenados = [logo for logo in logos if logo.iso_639_1 == metadata_lang]
+
+    if not logos_ordenados and metadata_lang != 'en':
+        logos_ordenados = [logo for logo in logos if logo.iso_639_1 == 'en']
+
+    if not logos_ordenados:
+        logos_ordenados = [logo for logo in logos if logo.iso_639_1 is None]
+
+    if not logos_ordenados and logos:
+        logos_ordenados = [logos[0]]
+
+    return logos_ordenados[0] if logos_ordenados else None
+
+def obtener_clasificacion_mpa(pelicula):
     try:
-        detalles = tmdb.movie(pelicula_id).details(append_to_response="release_dates")
-        if hasattr(detalles, 'release_dates') and detalles.release_dates:
-            for release in detalles.release_dates.results:
+        if hasattr(pelicula, 'release_dates') and pelicula.release_dates:
+            for release in pelicula.release_dates.results:
                 if release.iso_3166_1 == "US":
                     for date in release.release_dates:
                         if date.certification:
@@ -434,234 +1816,995 @@ def obtener_clasificacion_mpa(tmdb, pelicula_id):
         logging.error(f"Error al obtener clasificación MPA: {e}")
         return "NR"
 
-def obtener_metadata_pelicula(tmdb, nombre_pelicula, carpetas_imagenes, archivo_video, config, imagenes_existentes=None):
-    for intento in range(config['max_reintentos']):
+def normalizar_titulo(titulo):
+    # Minúsculas, sin acentos y con la puntuación como espacios: "Amélie" y "Amelie" o
+    # "Spider-Man" y "Spider Man" puntúan igual
+    titulo = unicodedata.normalize('NFKD', titulo or '')
+    titulo = ''.join(caracter for caracter in titulo if not unicodedata.combining(caracter))
+    return ' '.join(re.sub(r'[^\w]+', ' ', titulo.lower()).split())
+
+@functools.lru_cache(maxsize=None)
+def numpy_disponible():
+    import importlib.util
+    return importlib.util.find_spec('numpy') is not None
+
+def puntuar_titulos(consultas, titulos, workers=1):
+    # Matriz consultas x títulos con fuzz.ratio (0-1) calculada por rapidfuzz en C. Cada texto se
+    # normaliza una sola vez. process.cdist necesita numpy, que no es dependencia del proyecto:
+    # sin numpy cada consulta puntúa todos los títulos en una llamada a process.extract.
+    from rapidfuzz import fuzz, process
+    consultas = [normalizar_titulo(consulta) for consulta in consultas]
+    titulos = [normalizar_titulo(titulo) for titulo in titulos]
+    if not consultas or not titulos:
+        return [[0.0] * len(titulos) for _ in consultas]
+
+    if numpy_disponible():
+        return (process.cdist(consultas, titulos, scorer=fuzz.ratio, workers=workers) / 100).tolist()
+
+    filas = []
+    for consulta in consultas:
+        fila = [0.0] * len(titulos)
+        for _, puntaje, indice in process.extract(consulta, titulos, scorer=fuzz.ratio, limit=None):
+            fila[indice] = puntaje / 100
+        filas.append(fila)
+    return filas
+
+class Candidato:
+    # Resultado de búsqueda puntuado, con el desglose del puntaje para poder explicar la elección
+    __slots__ = ('resultado', 'campo', 'titulo', 'similitud', 'bono_año')
+
+    def __init__(self, resultado, campo, titulo, similitud, bono_año):
+        self.resultado = resultado
+        self.campo = campo
+        self.titulo = titulo
+        self.similitud = similitud
+        self.bono_año = bono_año
+
+    @property
+    def puntaje(self):
+        return self.similitud + self.bono_año
+
+    def explicar(self):
+        return (f"ID {self.resultado.id} '{self.titulo}' ({self.campo}): similitud {self.similitud:.2f}"
+                f" + año {self.bono_año:.2f} = {self.puntaje:.2f}")
+
+def rankear_lote(consultas, resultados, workers=1, limite=None):
+    # Puntúa varios nombres (nombre_sin_año, año) contra el mismo conjunto de resultados con una
+    # sola matriz de similitud. Se compara con el título y con el título original de cada
+    # resultado; un mismo ID puede aparecer en varios idiomas: se conserva su mejor puntaje y la
+    # posición de su primera aparición. Los Candidato solo se crean para lo que se devuelve.
+    titulos = []
+    for resultado in resultados:
+        if not resultado.id or not resultado.title:
+            continue
+        año = str(resultado.release_date.year) if resultado.release_date else None
+        titulos.append((resultado, 'title', resultado.title, año))
+        if resultado.original_title and resultado.original_title != resultado.title:
+            titulos.append((resultado, 'original_title', resultado.original_title, año))
+
+    ids = [resultado.id for resultado, _, _, _ in titulos]
+    años = [año for _, _, _, año in titulos]
+    matriz = puntuar_titulos([nombre for nombre, _ in consultas], [titulo for _, _, titulo, _ in titulos], workers)
+
+    rankings = []
+    for (_, año_archivo), similitudes in zip(consultas, matriz):
+        mejores = {}
+        for indice, similitud in enumerate(similitudes):
+            puntaje = similitud + 0.5 if año_archivo and años[indice] == año_archivo else similitud
+            previo = mejores.get(ids[indice])
+            if previo is None or puntaje > previo[0]:
+                mejores[ids[indice]] = (puntaje, indice)
+
+        # nlargest y sorted dejan los empates en el orden de aparición
+        elegidos = [mejor for mejor in mejores.values() if mejor[0] > 0]
+        if limite:
+            elegidos = heapq.nlargest(limite, elegidos, key=lambda mejor: mejor[0])
+        else:
+            elegidos.sort(key=lambda mejor: mejor[0], reverse=True)
+
+        ranking = []
+        for puntaje, indice in elegidos:
+            resultado, campo, titulo, _ = titulos[indice]
+            similitud = similitudes[indice]
+            ranking.append(Candidato(resultado, campo, titulo, similitud, puntaje - similitud))
+        rankings.append(ranking)
+    return rankings
+
+def rankear_candidatos(nombre_sin_año, año_archivo, resultados):
+    return rankear_lote([(nombre_sin_año, año_archivo)], resultados)[0]
+
+class ResultadoIndice:
+    # Lo mínimo de un resultado de search/movie que usan rankear_lote y la etapa de detalles.
+    # La exportación de TMDB no trae fecha: el año se comprueba después con los detalles.
+    __slots__ = ('id', 'title', 'original_title', 'popularity')
+    release_date = None
+
+    def __init__(self, id, titulo, popularidad):
+        self.id = id
+        self.title = titulo
+        self.original_title = titulo
+        self.popularity = popularidad
+
+class IndiceTitulos:
+    # Índice local de títulos construido con la exportación diaria de TMDB (movie_ids_MM_DD_YYYY.json.gz:
+    # una película por línea con id, original_title y popularity). Da los candidatos sin llamar a
+    # search/movie; solo los detalles de la película elegida van a la red.
+    VERSION = 1
+    CANDIDATOS_POR_CONSULTA = 200
+    TAMANO_LOTE = 50000
+
+    def __init__(self, ruta_db, similitud_minima=0.85):
+        self.ruta_db = Path(ruta_db)
+        self.similitud_minima = similitud_minima
+        self.lock = threading.Lock()
+        self.conexion = sqlite3.connect(f"file:{self.ruta_db}?mode=ro", uri=True, check_same_thread=False)
+        self.peliculas = int(self.leer_meta(self.conexion).get('peliculas', 0))
+
+    @staticmethod
+    def leer_meta(conexion):
+        return dict(conexion.execute("SELECT clave, valor FROM meta").fetchall())
+
+    @classmethod
+    def desactualizado(cls, ruta_db, ruta_exportacion):
+        estado = os.stat(ruta_exportacion)
         try:
-            if "media/video" in str(archivo_video):
-                logging.info(f"El archivo {archivo_video.name} es un tráiler. Saltando...")
-                return None
+            conexion = sqlite3.connect(f"file:{Path(ruta_db)}?mode=ro", uri=True)
+            try:
+                meta = cls.leer_meta(conexion)
+            finally:
+                conexion.close()
+        except sqlite3.Error:
+            return True
+        return meta.get('version') != str(cls.VERSION) or meta.get('origen') != f"{estado.st_size}:{estado.st_mtime_ns}"
+
+    @classmethod
+    def construir(cls, ruta_exportacion, ruta_db):
+        # Se construye en un archivo temporal y se renombra: mientras tanto el índice anterior sigue
+        # siendo válido y un corte a mitad no deja uno incompleto
+        ruta_db = Path(ruta_db)
+        temporal = ruta_db.with_name(f".{ruta_db.name}.{os.getpid()}.tmp")
+        estado = os.stat(ruta_exportacion)
+        peliculas = 0
+        try:
+            conexion = sqlite3.connect(str(temporal))
+            conexion.executescript("""
+                PRAGMA journal_mode=OFF;
+                PRAGMA synchronous=OFF;
+                CREATE TABLE meta (clave TEXT PRIMARY KEY, valor TEXT NOT NULL);
+                CREATE TABLE titulos (
+                    id INTEGER PRIMARY KEY,
+                    titulo TEXT NOT NULL,
+                    normalizado TEXT NOT NULL,
+                    popularidad REAL NOT NULL
+                );
+                CREATE TABLE palabras (
+                    palabra TEXT NOT NULL,
+                    popularidad REAL NOT NULL,
+                    id INTEGER NOT NULL,
+                    PRIMARY KEY (palabra, popularidad DESC, id)
+                ) WITHOUT ROWID;
+            """)
+            lote_titulos, lote_palabras = [], []
+
+            def volcar():
+                conexion.executemany("INSERT OR REPLACE INTO titulos VALUES (?, ?, ?, ?)", lote_titulos)
+                conexion.executemany("INSERT OR IGNORE INTO palabras VALUES (?, ?, ?)", lote_palabras)
+                lote_titulos.clear()
+                lote_palabras.clear()
+
+            with gzip.open(ruta_exportacion, 'rt', encoding='utf-8') as f:
+                for linea in f:
+                    try:
+                        pelicula = json.loads(linea)
+                        pelicula_id, titulo = int(pelicula['id']), pelicula.get('original_title')
+                        popularidad = float(pelicula.get('popularity') or 0)
+                    except (ValueError, KeyError, TypeError):
+                        continue
+                    if pelicula.get('adult') or not titulo:
+                        continue
+                    normalizado = normalizar_titulo(titulo)
+                    if not normalizado:
+                        continue
 
-            info_tecnica = obtener_info_tecnica(archivo_video)
-            boxfront_local = imagenes_existentes.get('boxfront') if imagenes_existentes else None
-            screenshot_local = imagenes_existentes.get('screenshot') if imagenes_existentes else None
-            wheel_local = imagenes_existentes.get('wheel') if imagenes_existentes else None
-            video_local = imagenes_existentes.get('video') if imagenes_existentes else None
-
-            año_archivo = None
-            año_match = re.search(r'\((\d{4})\)', archivo_video.name)
-            if año_match:
-                año_archivo = año_match.group(1)
-                nombre_sin_año = re.sub(r'\s*\(\d{4}\)', '', nombre_pelicula).strip()
-            else:
-                nombre_sin_año = nombre_pelicula
+                    lote_titulos.append((pelicula_id, titulo, normalizado, popularidad))
+                    lote_palabras.extend((palabra, popularidad, pelicula_id) for palabra in set(normalizado.split()) if len(palabra) > 1)
+                    peliculas += 1
+                    if len(lote_titulos) >= cls.TAMANO_LOTE:
+                        volcar()
+            volcar()
+
+            conexion.execute("CREATE INDEX idx_titulos_normalizado ON titulos (normalizado)")
+            conexion.executemany("INSERT INTO meta VALUES (?, ?)", [
+                ('version', str(cls.VERSION)),
+                ('origen', f"{estado.st_size}:{estado.st_mtime_ns}"),
+                ('exportacion', str(ruta_exportacion)),
+                ('peliculas', str(peliculas)),
+                ('construido', datetime.now().isoformat(timespec='seconds'))
+            ])
+            conexion.commit()
+            conexion.execute("VACUUM")
+            conexion.close()
+            os.replace(temporal, ruta_db)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                temporal.unlink()
+            raise
+        return peliculas
+
+    def buscar(self, consulta, limite=5):
+        # Candidatos por prefijo del título normalizado y por cada palabra de la consulta (las de
+        # 5 letras o más también por sus 4 primeras, para tolerar erratas al final). Se puntúan
+        # con rankear_lote; los empates quedan ordenados por popularidad. Un año suelto al final
+        # ("Heat 1995", "Heat [1995]") se prueba también quitado, en el mismo lote.
+        normalizado = normalizar_titulo(consulta)
+        if not normalizado:
+            return []
+        consultas = [normalizado]
+        sin_año = re.sub(r'\s(?:19|20)\d{2}$', '', normalizado)
+        if sin_año != normalizado:
+            consultas.append(sin_año)
+
+        with metricas.medir('indice_titulos'):
+            filas = []
+            with self.lock:
+                for prefijo in consultas:
+                    filas.extend(self.conexion.execute(
+                        "SELECT id, titulo, popularidad FROM titulos WHERE normalizado >= ? AND normalizado < ? "
+                        "ORDER BY popularidad DESC LIMIT ?",
+                        (prefijo, prefijo + '\U0010ffff', self.CANDIDATOS_POR_CONSULTA)
+                    ))
+                for palabra in set(normalizado.split()):
+                    if len(palabra) < 2:
+                        continue
+                    por_palabra = self.conexion.execute(
+                        "SELECT t.id, t.titulo, t.popularidad FROM palabras p JOIN titulos t ON t.id = p.id "
+                        "WHERE p.palabra = ? ORDER BY p.popularidad DESC LIMIT ?",
+                        (palabra, self.CANDIDATOS_POR_CONSULTA)
+                    ).fetchall()
+                    if not por_palabra and len(palabra) >= 5:
+                        por_palabra = self.conexion.execute(
+                            "SELECT t.id, t.titulo, t.popularidad FROM palabras p JOIN titulos t ON t.id = p.id "
+                            "WHERE p.palabra >= ? AND p.palabra < ? ORDER BY p.popularidad DESC LIMIT ?",
+                            (palabra[:4], palabra[:4] + '\U0010ffff', self.CANDIDATOS_POR_CONSULTA)
+                        ).fetchall()
+                    filas.extend(por_palabra)
+
+            resultados = {}
+            for pelicula_id, titulo, popularidad in sorted(filas, key=lambda fila: fila[2], reverse=True):
+                resultados.setdefault(pelicula_id, ResultadoIndice(pelicula_id, titulo, popularidad))
+            mejores = {}
+            for ranking in rankear_lote([(texto, None) for texto in consultas], list(resultados.values()), limite=limite):
+                for candidato in ranking:
+                    previo = mejores.get(candidato.resultado.id)
+                    if candidato.similitud >= self.similitud_minima and (previo is None or candidato.puntaje > previo.puntaje):
+                        mejores[candidato.resultado.id] = candidato
+            ranking = sorted(mejores.values(), key=lambda candidato: candidato.puntaje, reverse=True)[:limite]
+
+        metricas.contar("indice_titulos_aciertos" if ranking else "indice_titulos_fallos")
+        return ranking
+
+    def cerrar(self):
+        with self.lock:
+            self.conexion.close()
+
+indice_titulos = None
+
+def configurar_indice_titulos(config):
+    global indice_titulos
+    indice_titulos = None
+    opciones = config.get('indice_titulos', {})
+    if not opciones.get('activado', False):
+        return None
 
-            todos_resultados = []
+    ruta_db = opciones.get('ruta') or Path(config['ruta_peliculas']) / '.pmdb-titulos.sqlite'
+    exportacion = opciones.get('exportacion')
+    try:
+        if exportacion and IndiceTitulos.desactualizado(ruta_db, exportacion):
+            logging.info(f"Construyendo el índice de títulos desde {exportacion}...")
+            inicio = time.monotonic()
+            peliculas = IndiceTitulos.construir(exportacion, ruta_db)
+            logging.info(f"Índice de títulos: {peliculas} películas en {time.monotonic() - inicio:.1f} s")
+        if not Path(ruta_db).exists():
+            logging.warning(f"No existe el índice de títulos {ruta_db}: se usará la búsqueda de TMDB")
+            return None
+        indice_titulos = IndiceTitulos(ruta_db, opciones.get('similitud_minima', 0.85))
+    except (OSError, EOFError, sqlite3.Error) as e:
+        logging.warning(f"No se pudo usar el índice de títulos {ruta_db}: {e}. Se usará la búsqueda de TMDB")
+        indice_titulos = None
+    return indice_titulos
+
+def cerrar_indice_titulos():
+    global indice_titulos
+    if indice_titulos is not None:
+        indice_titulos.cerrar()
+        indice_titulos = None
+
+def buscar_en_indice_titulos(nombre_sin_año, config):
+    # Sin coincidencia suficiente en el índice se vuelve a la búsqueda en TMDB
+    if indice_titulos is None:
+        return []
+    try:
+        return indice_titulos.buscar(nombre_sin_año, config.get('max_candidatos_detalle', 5) or 20)
+    except sqlite3.Error as e:
+        logging.warning(f"Error al consultar el índice de títulos: {e}")
+        return []
+
+def año_coincide(año_archivo, resultado, pelicula_detalle):
+    # Los resultados sin fecha (índice local) se comprueban con la fecha de los detalles
+    if not año_archivo or resultado.release_date or not pelicula_detalle.release_date:
+        return True
+    return str(pelicula_detalle.release_date.year) == año_archivo
 
-            for idioma in config['idiomas']:
-                tmdb.language = idioma
-                try:
-                    resultados = tmdb.search().movies(nombre_sin_año)
-                    if resultados:
-                        todos_resultados.extend(resultados)
-                except Exception as e:
-                    logging.warning(f"Error al buscar en idioma {idioma}: {str(e)}")
-                    continue
+def separar_año(nombre_pelicula, archivo_video):
+    año_match = re.search(r'\((\d{4})\)', archivo_video.name)
+    if año_match:
+        return re.sub(r'\s*\(\d{4}\)', '', nombre_pelicula).strip(), año_match.group(1)
+    return nombre_pelicula, None
 
-            if not todos_resultados:
-                logging.warning(f"No se encontró información para la película: {nombre_pelicula} (Archivo: {archivo_video.name})")
-                return None
+def assets_locales(imagenes_existentes):
+    imagenes_existentes = imagenes_existentes or {}
+    return {
+        'boxfront_local': imagenes_existentes.get('boxfront'),
+        'screenshot_local': imagenes_existentes.get('screenshot'),
+        'wheel_local': imagenes_existentes.get('wheel'),
+        'video_local': imagenes_existentes.get('video'),
+        'imagenes_tmdb': {}
+    }
+
+def es_candidato_valido(resultado, pelicula_detalle):
+    if pelicula_detalle.runtime and pelicula_detalle.runtime < 60:
+        logging.warning(f"Descartando película {resultado.title} (ID: {resultado.id}) por duración insuficiente: {pelicula_detalle.runtime} minutos")
+        return False
+    return True
+
+def unir_busquedas(idiomas, busquedas):
+    # Junta los resultados de search/movie de cada idioma; las búsquedas fallidas llegan como excepción
+    todos_resultados = []
+    errores = 0
+    for idioma, resultados in zip(idiomas, busquedas):
+        if isinstance(resultados, Exception):
+            errores += 1
+            logging.warning(f"Error al buscar en idioma {idioma}: {str(resultados)}")
+        elif resultados:
+            todos_resultados.extend(resultados)
+    return todos_resultados, errores
+
+class SeleccionCandidato:
+    # Elige la película entre los candidatos del ranking a medida que llegan sus detalles.
+    # No hace E/S: cada motor pide los detalles a su manera (hilos o await) y los pasa a evaluar().
+    def __init__(self, ranking, año_archivo, max_detalles):
+        self.ranking = ranking[:max_detalles] if max_detalles else ranking
+        self.año_archivo = año_archivo
+        self.elegido = None
+        self.respaldo = None
+        self.errores = 0
+
+    def candidatos(self):
+        for candidato in self.ranking:
+            if self.elegido:
+                return
+            yield candidato
+
+    def error(self, candidato, e):
+        self.errores += 1
+        logging.warning(f"Error al obtener detalles para película ID {candidato.resultado.id}: {str(e)}")
+
+    def evaluar(self, candidato, pelicula_detalle):
+        if not es_candidato_valido(candidato.resultado, pelicula_detalle):
+            return
+        if año_coincide(self.año_archivo, candidato.resultado, pelicula_detalle):
+            self.elegido = (candidato, pelicula_detalle)
+        elif not self.respaldo:
+            self.respaldo = (candidato, pelicula_detalle)
+
+    def pelicula(self, nombre_archivo):
+        if self.elegido:
+            logging.info(f"Coincidencia para {nombre_archivo}: {self.elegido[0].explicar()}")
+            return self.elegido[1]
+        if self.respaldo:
+            logging.info(f"Coincidencia para {nombre_archivo} (sin coincidir el año): {self.respaldo[0].explicar()}")
+            return self.respaldo[1]
+        return None
+
+def planificar_descargas_imagenes(pelicula, carpetas_imagenes, nombre_base, locales, config):
+    rutas_tmdb = {'boxfront': pelicula.poster_path, 'screenshot': pelicula.backdrop_path, 'wheel': None}
+    logos = pelicula.images.logos if pelicula.images and pelicula.images.logos else []
+    if logos:
+        logo = seleccionar_logo(logos, idiomas_metadata(config)[0])
+        rutas_tmdb['wheel'] = logo.file_path if logo else None
+
+    descargas = []
+    for asset, (tipo, carpeta) in IMAGENES_ASSETS.items():
+        ruta = rutas_tmdb[asset]
+        if not locales[f"{asset}_local"] and config['obtener_datos'][tipo] and ruta:
+            descargas.append((f"{asset}_local", tipo, url_imagen_tmdb(ruta, tipo, config),
+                              carpetas_imagenes[carpeta] / nombre_base,
+                              {'ruta': ruta, 'tamano': config['tamanos_imagenes'][tipo]}))
+
+    return descargas
+
+def registrar_imagen_descargada(locales, clave_local, url, ruta_destino, imagen_tmdb):
+    # Guarda la ruta TMDB y el tamaño descargado para poder cambiar de tamaño más adelante
+    locales[clave_local] = str(ruta_destino) + Path(url).suffix
+    registrar_asset_media(locales[clave_local])
+    locales.setdefault('imagenes_tmdb', {})[clave_local[:-len('_local')]] = imagen_tmdb
+
+def planificar_cambios_tamano(metadata_existente, carpetas_imagenes, config):
+    # Imágenes ya descargadas cuyo tamaño registrado no coincide con el configurado. Se vuelven
+    # a descargar desde la ruta TMDB guardada en la metadata, sin consultar la API.
+    cambios = []
+    for item in (metadata_existente or {}).get('metadata', []):
+        metadata = item.get('metadata')
+        if not metadata or not metadata.get('imagenes_tmdb'):
+            continue
+
+        nombre_base = Path(item['archivo_original']).stem
+        for asset, imagen_tmdb in metadata['imagenes_tmdb'].items():
+            tipo, carpeta = IMAGENES_ASSETS[asset]
+            tamano = config['tamanos_imagenes'][tipo]
+            if tamano in (imagen_tmdb.get('tamano'), imagen_tmdb.get('tamano_no_disponible')):
+                continue
+            if not config['obtener_datos'][tipo] or not metadata.get(f"{asset}_local"):
+                continue
+            cambios.append((item, f"{asset}_local", url_imagen_tmdb(imagen_tmdb['ruta'], tipo, config),
+                            carpetas_imagenes[carpeta] / nombre_base,
+                            {'ruta': imagen_tmdb['ruta'], 'tamano': tamano}))
 
-            def calcular_similitud(titulo_archivo, titulo_pelicula):
-                return fuzz.ratio(titulo_archivo.lower(), titulo_pelicula.lower()) / 100
+    return cambios
 
-            candidatos_validos = []
+def descargar_cambio_tamano(cambio):
+    _, clave_local, url, ruta_destino, _ = cambio
+    try:
+        return descargar_imagen_estado(url, ruta_destino)
+    except Exception as e:
+        logging.warning(f"Error al cambiar el tamaño de {clave_local} ({url}): {e}")
+        return None
 
-            for resultado in todos_resultados:
-                try:
+def aplicar_cambios_tamano(cambios, config):
+    # Un 4xx (p. ej. un tamaño que TMDB no tiene para esa imagen) no se arregla reintentando: se
+    # conserva la imagen actual y se anota el tamaño para no pedirlo otra vez. Los errores
+    # transitorios quedan pendientes para la siguiente ejecución.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=config.get('hilos', 10)) as executor:
+        estados = list(executor.map(descargar_cambio_tamano, cambios))
+
+    aplicados = []
+    descartados = []
+    for (item, clave_local, url, ruta_destino, imagen_tmdb), estado in zip(cambios, estados):
+        if estado == 200:
+            registrar_imagen_descargada(item['metadata'], clave_local, url, ruta_destino, imagen_tmdb)
+            aplicados.append((item, clave_local))
+        elif estado and 400 <= estado < 500 and estado not in CODIGOS_REINTENTABLES:
+            logging.warning(f"TMDB no tiene {clave_local} en tamaño {imagen_tmdb['tamano']} para: {item.get('nombre_extraido')}; se conserva la imagen actual")
+            item['metadata']['imagenes_tmdb'][clave_local[:-len('_local')]]['tamano_no_disponible'] = imagen_tmdb['tamano']
+            descartados.append((item, clave_local))
+        else:
+            logging.warning(f"No se pudo cambiar el tamaño de {clave_local} para: {item.get('nombre_extraido')}")
+    return aplicados, descartados
 
-                    tmdb.language = config['metadata_language'][0]
-                    pelicula_detalle = tmdb.movie(resultado.id).details()
+def construir_metadata_pelicula(pelicula, archivo_video, info_tecnica, duracion, locales, config):
+    idiomas = idiomas_metadata(config)
+    clasificacion = obtener_clasificacion_mpa(pelicula)
+    mejor_descripcion, mejor_tagline = obtener_textos_pelicula(pelicula, idiomas)
+    if not mejor_descripcion:
+        mejor_descripcion = pelicula.overview
 
-                    if hasattr(pelicula_detalle, 'runtime') and pelicula_detalle.runtime and pelicula_detalle.runtime < 60:
-                        logging.warning(f"Descartando película {resultado.title} (ID: {resultado.id}) por duración insuficiente: {pelicula_detalle.runtime} minutos")
-                        continue
+    return {
+        'titulo': archivo_video.stem,
+        'titulo_tmdb': pelicula.title,
+        'titulo_original': pelicula.original_title if hasattr(pelicula, 'original_title') else None,
+        'año': str(pelicula.release_date.year) if pelicula.release_date else None,
+        'duracion': duracion,
+        'director': next((crew.name for crew in pelicula.credits.crew if crew.job == "Director"), "Desconocido"),
+        'productora': [company.name for company in pelicula.production_companies] if pelicula.production_companies else [],
+        'rating': round(pelicula.vote_average / 10, 2) if pelicula.vote_average else 0,
+        'descripcion': mejor_descripcion,
+        'generos': [genero.name for genero in pelicula.genres],
+        'boxfront_local': locales['boxfront_local'],
+        'screenshot_local': locales['screenshot_local'],
+        'wheel_local': locales['wheel_local'],
+        'video_local': locales['video_local'],
+        'imagenes_tmdb': locales['imagenes_tmdb'],
+        'tmdb_id': pelicula.id,
+        'fecha_lanzamiento': str(pelicula.release_date) if pelicula.release_date else None,
+        'idioma_metadata': ", ".join(idiomas),
+        'x-added-date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'x-Duration': duracion,
+        'x-tagline': mejor_tagline if mejor_tagline else "",
+        'x-classification': clasificacion if clasificacion else "Desconocido",
+        'x-codec': info_tecnica['x-codec'],
+        'x-resolution': info_tecnica['x-resolution'],
+        'x-aspect': info_tecnica['x-aspect'],
+        'x-audio': info_tecnica['x-audio']
+    }
 
-                    año_resultado = None
-                    if hasattr(resultado, 'release_date') and resultado.release_date:
-                        año_resultado = str(resultado.release_date.year)
+class TrabajoPelicula:
+    def __init__(self, archivo, nombre_pelicula, imagenes_existentes=None):
+        self.archivo = archivo
+        self.nombre_pelicula = nombre_pelicula
+        self.imagenes_existentes = imagenes_existentes or {}
+        self.locales = assets_locales(imagenes_existentes)
+        self.nombre_sin_año, self.año_archivo = separar_año(nombre_pelicula, archivo)
+        self.clave_busqueda = None
+        self.interrumpido = False
+        self.info_tecnica = None
+        self.ranking = []
+        self.desde_indice = False
+        self.errores_busqueda = 0
+        self.pelicula = None
+        self.duracion = None
+        self.metadata = None
+
+def etapa_ffprobe(trabajo, clientes_tmdb, carpetas_imagenes, config):
+    if "media/video" in str(trabajo.archivo):
+        logging.info(f"El archivo {trabajo.archivo.name} es un tráiler. Saltando...")
+        return False
 
-                    candidato = {
-                        'resultado': resultado,
-                        'año': año_resultado,
-                        'duracion': pelicula_detalle.runtime if hasattr(pelicula_detalle, 'runtime') else None
-                    }
-                    candidatos_validos.append(candidato)
-                except Exception as e:
-                    logging.warning(f"Error al obtener detalles para película ID {resultado.id}: {str(e)}")
-                    continue
+    trabajo.info_tecnica = obtener_info_tecnica(trabajo.archivo)
+    return True
 
-            if not candidatos_validos:
-                logging.warning(f"No se encontraron candidatos válidos después del filtro de duración para: {nombre_pelicula} (Archivo: {archivo_video.name})")
-                return None
+def etapa_busqueda(trabajo, clientes_tmdb, carpetas_imagenes, config):
+    trabajo.clave_busqueda = clave_sin_resultado(trabajo.nombre_sin_año, trabajo.año_archivo, config)
+    if busqueda_sin_resultado_vigente(trabajo.clave_busqueda):
+        logging.info(f"Búsqueda sin resultado en una ejecución anterior, se omite: {trabajo.nombre_pelicula} (Archivo: {trabajo.archivo.name})")
+        return False
 
-            mejor_resultado = None
-            mejor_puntaje = 0
+    trabajo.ranking = buscar_en_indice_titulos(trabajo.nombre_sin_año, config)
+    if trabajo.ranking:
+        trabajo.desde_indice = True
+        return True
+    return buscar_candidatos_tmdb(trabajo, clientes_tmdb, config)
 
-            for candidato in candidatos_validos:
-                resultado = candidato['resultado']
-                año_resultado = candidato['año']
-                puntaje = calcular_similitud(nombre_sin_año, resultado.title)
+def buscar_candidatos_tmdb(trabajo, clientes_tmdb, config):
+    busquedas = []
+    for idioma in config['idiomas']:
+        try:
+            busquedas.append(clientes_tmdb.cliente(idioma).search().movies(trabajo.nombre_sin_año))
+        except Exception as e:
+            busquedas.append(e)
+    todos_resultados, trabajo.errores_busqueda = unir_busquedas(config['idiomas'], busquedas)
+    trabajo.desde_indice = False
+
+    if not todos_resultados:
+        logging.warning(f"No se encontró información para la película: {trabajo.nombre_pelicula} (Archivo: {trabajo.archivo.name})")
+        if not trabajo.errores_busqueda:
+            registrar_sin_resultado(trabajo.clave_busqueda, trabajo.nombre_pelicula)
+        return False
 
-                if año_archivo and año_resultado and año_archivo == año_resultado:
-                    puntaje += 0.5
+    trabajo.ranking = rankear_candidatos(trabajo.nombre_sin_año, trabajo.año_archivo, todos_resultados)
+    return True
 
-                if puntaje > mejor_puntaje:
-                    mejor_puntaje = puntaje
-                    mejor_resultado = resultado
+def seleccionar_pelicula(trabajo, clientes_tmdb, config):
+    idioma = idiomas_metadata(config)[0]
+    seleccion = SeleccionCandidato(trabajo.ranking, trabajo.año_archivo, config.get('max_candidatos_detalle', 5))
+    for candidato in seleccion.candidatos():
+        try:
+            pelicula_detalle = obtener_pelicula_completa(clientes_tmdb, candidato.resultado.id, idioma)
+        except Exception as e:
+            seleccion.error(candidato, e)
+        else:
+            seleccion.evaluar(candidato, pelicula_detalle)
+    return seleccion
+
+def etapa_detalles(trabajo, clientes_tmdb, carpetas_imagenes, config):
+    seleccion = seleccionar_pelicula(trabajo, clientes_tmdb, config)
+    trabajo.pelicula = seleccion.pelicula(trabajo.archivo.name)
+
+    if not trabajo.pelicula and trabajo.desde_indice:
+        # El índice local solo adelanta la búsqueda: sin candidato válido se pregunta a TMDB
+        logging.info(f"Ningún candidato del índice de títulos es válido para {trabajo.archivo.name}, se busca en TMDB")
+        if not buscar_candidatos_tmdb(trabajo, clientes_tmdb, config):
+            return False
+        seleccion = seleccionar_pelicula(trabajo, clientes_tmdb, config)
+        trabajo.pelicula = seleccion.pelicula(trabajo.archivo.name)
+
+    if not trabajo.pelicula:
+        logging.warning(f"No se encontró un resultado adecuado para: {trabajo.nombre_pelicula} (Archivo: {trabajo.archivo.name})")
+        if not seleccion.errores and not trabajo.errores_busqueda:
+            registrar_sin_resultado(trabajo.clave_busqueda, trabajo.nombre_pelicula)
+        return False
 
-            if not mejor_resultado:
-                logging.warning(f"No se encontró un resultado adecuado para: {nombre_pelicula} (Archivo: {archivo_video.name})")
-                return None
+    olvidar_sin_resultado(trabajo.clave_busqueda)
 
-            pelicula_id = mejor_resultado.id
-            clasificacion = obtener_clasificacion_mpa(tmdb, pelicula_id)
+    trabajo.duracion = trabajo.pelicula.runtime
+    if not trabajo.duracion:
+        trabajo.duracion = trabajo.info_tecnica['duracion']
+    return True
 
-            duracion_tmdb = None
-            for idioma_metadata in config['metadata_language']:
+def etapa_imagenes(trabajo, clientes_tmdb, carpetas_imagenes, config):
+    descargas = planificar_descargas_imagenes(trabajo.pelicula, carpetas_imagenes, trabajo.archivo.stem, trabajo.locales, config)
+    for clave_local, tipo, url, ruta_destino, imagen_tmdb in descargas:
+        if descargar_imagen(url, ruta_destino):
+            registrar_imagen_descargada(trabajo.locales, clave_local, url, ruta_destino, imagen_tmdb)
+            logging.info(f"Imagen ({tipo}) descargada exitosamente para: {trabajo.nombre_pelicula} (Archivo: {trabajo.archivo.name})")
+        else:
+            logging.warning(f"No se pudo descargar el {tipo} para la película: {trabajo.nombre_pelicula} (Archivo: {trabajo.archivo.name})")
+    return True
+
+def etapa_trailer(trabajo, clientes_tmdb, carpetas_imagenes, config):
+    if not trabajo.locales['video_local'] and config['obtener_datos']['trailer']:
+        video_path = carpetas_imagenes['video'] / trabajo.archivo.stem
+        if descargar_trailer(clientes_tmdb, trabajo.pelicula, video_path, config['calidad_trailer']):
+            trabajo.locales['video_local'] = str(video_path) + ".mp4"
+            registrar_asset_media(trabajo.locales['video_local'])
+        else:
+            logging.warning(f"No se pudo descargar el tráiler para la película: {trabajo.nombre_pelicula} (Archivo: {trabajo.archivo.name})")
+
+    trabajo.metadata = construir_metadata_pelicula(trabajo.pelicula, trabajo.archivo, trabajo.info_tecnica,
+                                                   trabajo.duracion, trabajo.locales, config)
+    return True
+
+ETAPAS_PELICULA = (
+    ('ffprobe', etapa_ffprobe),
+    ('busqueda', etapa_busqueda),
+    ('detalles', etapa_detalles),
+    ('imagenes', etapa_imagenes),
+    ('trailer', etapa_trailer)
+)
+
+def ejecutar_etapa(funcion, trabajo, clientes_tmdb, carpetas_imagenes, config):
+    # Los reintentos son por etapa: un fallo al descargar imágenes no repite búsqueda ni detalles
+    for intento in range(config['max_reintentos']):
+        try:
+            with metricas.medir(funcion.__name__):
+                return funcion(trabajo, clientes_tmdb, carpetas_imagenes, config)
+        except Exception as e:
+            metricas.contar(f"reintentos_{funcion.__name__}")
+            logging.error(f"Error al procesar {trabajo.nombre_pelicula} (Intento {intento + 1}): {e}")
+            time.sleep(calcular_espera_reintento(intento))
+
+    logging.error(f"Error al procesar {trabajo.nombre_pelicula} después de {config['max_reintentos']} intentos.")
+    return False
+
+def obtener_metadata_pelicula(clientes_tmdb, nombre_pelicula, carpetas_imagenes, archivo_video, config, imagenes_existentes=None):
+    trabajo = TrabajoPelicula(archivo_video, nombre_pelicula, imagenes_existentes)
+    for nombre, funcion in ETAPAS_PELICULA:
+        if not ejecutar_etapa(funcion, trabajo, clientes_tmdb, carpetas_imagenes, config):
+            return None
+    return trabajo.metadata
+
+def concurrencia_etapas(config):
+    hilos = config.get('hilos', 10)
+    por_defecto = {
+        'ffprobe': min(hilos, os.cpu_count() or 4),
+        'busqueda': hilos,
+        'detalles': hilos,
+        'imagenes': hilos,
+        'trailer': 2
+    }
+    return {**por_defecto, **config.get('etapas', {})}
+
+class TuberiaEtapas:
+    # Cada etapa tiene su propio grupo de hilos y una cola acotada de entrada. Un archivo pasa
+    # a la siguiente etapa al terminar la anterior, así un tráiler lento no ocupa un hilo de
+    # búsqueda y las colas llenas frenan a las etapas previas.
+    def __init__(self, etapas, al_terminar, tamano_cola=64, detener=None):
+        self.etapas = etapas
+        self.al_terminar = al_terminar
+        self.detener = detener
+        self.colas = [queue.Queue(maxsize=tamano_cola) for _ in etapas]
+        self.grupos = []
+
+        for indice, (nombre, funcion, cantidad) in enumerate(etapas):
+            grupo = [threading.Thread(target=self._trabajar, args=(indice,), name=f"{nombre}-{numero}", daemon=True)
+                     for numero in range(max(1, cantidad))]
+            for hilo in grupo:
+                hilo.start()
+            self.grupos.append(grupo)
+
+    def _trabajar(self, indice):
+        funcion = self.etapas[indice][1]
+        siguiente = self.colas[indice + 1] if indice + 1 < len(self.colas) else None
+
+        while True:
+            trabajo = self.colas[indice].get()
+            if trabajo is None:
+                return
+            if self.detener is not None and self.detener.is_set():
+                # Interrupción: ninguna etapa empieza trabajos nuevos. El archivo se entrega sin
+                # resultado y queda pendiente para la próxima ejecución
+                trabajo.interrumpido = True
+                continuar = False
+            else:
                 try:
-                    tmdb.language = idioma_metadata
-                    pelicula_temp = tmdb.movie(pelicula_id).details()
-                    if hasattr(pelicula_temp, 'runtime') and pelicula_temp.runtime:
-                        duracion_tmdb = pelicula_temp.runtime
-                        break
+                    continuar = funcion(trabajo)
                 except Exception as e:
-                    logging.debug(f"No se pudo obtener duración en {idioma_metadata}: {str(e)}")
-                    continue
+                    logging.error(f"Error en la etapa {self.etapas[indice][0]}: {e}")
+                    continuar = False
 
-            if not duracion_tmdb:
-                duracion_tmdb = obtener_duracion_con_ffprobe(archivo_video)
+            if continuar and siguiente is not None:
+                siguiente.put(trabajo)
+            else:
+                try:
+                    self.al_terminar(trabajo)
+                except Exception as e:
+                    logging.error(f"Error al registrar resultado: {e}")
+
+    def agregar(self, trabajo):
+        self.colas[0].put(trabajo)
+
+    def cerrar(self):
+        # Se cierra etapa por etapa para que ningún trabajo quede en una cola sin hilos
+        for cola, grupo in zip(self.colas, self.grupos):
+            for _ in grupo:
+                cola.put(None)
+            for hilo in grupo:
+                hilo.join()
+
+def crear_tuberia_peliculas(clientes_tmdb, carpetas_imagenes, config, al_terminar, detener=None):
+    concurrencia = concurrencia_etapas(config)
+    etapas = [
+        (nombre, lambda trabajo, funcion=funcion: ejecutar_etapa(funcion, trabajo, clientes_tmdb, carpetas_imagenes, config),
+         concurrencia[nombre])
+        for nombre, funcion in ETAPAS_PELICULA
+    ]
+    return TuberiaEtapas(etapas, al_terminar, config.get('tamano_cola_etapas', 64), detener)
+
+CONCURRENCIA_ASYNC_DEFECTO = {
+    "archivos": 200,
+    "api.themoviedb.org": 64,
+    "image.tmdb.org": 64,
+    "ffprobe": 8,
+    "trailer": 2,
+    "otros": 32
+}
 
-            mejor_tagline = None
-            mejor_descripcion = None
+class MotorAsync:
+    def __init__(self, config, cache=None, clientes_tmdb=None):
+        self.config = config
+        self.cache = cache
+        self.clientes_tmdb = clientes_tmdb
+        self.concurrencia = dict(CONCURRENCIA_ASYNC_DEFECTO)
+        self.concurrencia.update(config.get('concurrencia_async', {}))
+        self.semaforos = {}
+        self.clientes = {}
+        self.sesion = None
+        self.sesion_tmdb = None
+
+    async def __aenter__(self):
+        import aiohttp
+        self.sesion = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=0),
+            timeout=aiohttp.ClientTimeout(total=self.config['timeout_descargas'])
+        )
+        self.sesion_tmdb = SesionTMDbAsync(self)
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.sesion.close()
+
+    def semaforo(self, nombre):
+        if nombre not in self.semaforos:
+            self.semaforos[nombre] = asyncio.Semaphore(self.concurrencia.get(nombre, self.concurrencia['otros']))
+        return self.semaforos[nombre]
+
+    def cliente(self, idioma):
+        if idioma not in self.clientes:
+            from themoviedb import aioTMDb
+            self.clientes[idioma] = aioTMDb(key=self.config['api_key'], language=idioma, session=self.sesion_tmdb)
+        return self.clientes[idioma]
+
+    async def peticion(self, url, params=None):
+        # Los errores de conexión y lectura se reintentan aparte, con los mismos reintentos_transporte
+        # que el adaptador de requests del motor de hilos; los 429/5xx con max_reintentos
+        import aiohttp
+        host = urlparse(url).hostname
+        limitador = limitadores.get(host)
+        max_reintentos = self.config['max_reintentos']
+        reintentos_red = self.config.get('conexiones_http', {}).get('reintentos_transporte', 2)
+        intento = 0
+        fallos_red = 0
+
+        async with self.semaforo(host):
+            while True:
+                if limitador:
+                    espera = limitador.reservar()
+                    if espera > 0:
+                        await asyncio.sleep(espera)
 
-            for idioma_metadata in config['metadata_language']:
                 try:
-                    tmdb.language = idioma_metadata
-                    pelicula = tmdb.movie(pelicula_id).details(append_to_response="credits,images,videos")
+                    async with self.sesion.get(url, params=params) as respuesta:
+                        estado = respuesta.status
+                        cuerpo = await respuesta.read()
+                        retry_after = leer_retry_after(respuesta)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    if fallos_red >= reintentos_red:
+                        raise
+                    espera = calcular_espera_reintento(fallos_red)
+                    fallos_red += 1
+                    metricas.contar("reintentos_red")
+                    logging.warning(f"Error de red con {host} ({e}), reintentando en {espera:.1f}s")
+                    await asyncio.sleep(espera)
+                    continue
 
-                    if not mejor_descripcion and hasattr(pelicula, 'overview') and pelicula.overview:
-                        mejor_descripcion = pelicula.overview
+                if estado not in CODIGOS_REINTENTABLES or intento == max_reintentos:
+                    return estado, cuerpo
 
-                    if not mejor_tagline and hasattr(pelicula, 'tagline') and pelicula.tagline:
-                        mejor_tagline = pelicula.tagline
+                espera = calcular_espera_reintento(intento, retry_after)
+                intento += 1
+                if limitador and estado == 429:
+                    limitador.pausar(espera)
+                metricas.contar(f"reintentos_http_{estado}")
+                logging.warning(f"Respuesta {estado} de {host}, reintentando en {espera:.1f}s")
+                await asyncio.sleep(espera)
 
-                    if mejor_descripcion and mejor_tagline:
-                        break
-                except Exception as e:
-                    logging.debug(f"No se pudo obtener metadata en {idioma_metadata}: {str(e)}")
-                    continue
+    async def info_tecnica(self, archivo):
+        info, identidad = consultar_cache_sondeos(archivo)
+        if info is not None:
+            return info
 
-            if not mejor_descripcion:
-                tmdb.language = config['metadata_language'][0]
-                pelicula = tmdb.movie(pelicula_id).details(append_to_response="credits,images,videos")
-                mejor_descripcion = pelicula.overview if hasattr(pelicula, 'overview') else "Sin descripción disponible"
+        async with self.semaforo('ffprobe'):
+            try:
+                with metricas.medir('ffprobe') as medicion:
+                    proceso = await asyncio.create_subprocess_exec(
+                        *COMANDO_FFPROBE, str(archivo),
+                        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+                    )
+                    salida, errores = await proceso.communicate()
+                    medicion['error'] = proceso.returncode != 0
+            except Exception as e:
+                logging.error(f"Error al obtener información técnica para {archivo}: {e}")
+                return dict(INFO_TECNICA_DESCONOCIDA)
+
+        info = interpretar_salida_ffprobe(proceso.returncode, salida.decode('utf-8', 'replace'),
+                                          errores.decode('utf-8', 'replace'), archivo)
+        guardar_cache_sondeos(archivo, identidad, info)
+        return info
+
+    async def ejecutar_bloqueante(self, nombre_semaforo, funcion, *args):
+        async with self.semaforo(nombre_semaforo):
+            return await asyncio.to_thread(funcion, *args)
+
+    @medido('descargar_imagen')
+    async def descargar_imagen(self, url, ruta_destino):
+        import aiohttp
+        for intento in range(self.config['max_reintentos']):
+            try:
+                estado, cuerpo = await self.peticion(url)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                metricas.contar("reintentos_red")
+                logging.warning(f"Intento {intento + 1} fallido para {url}: {e}")
+                await asyncio.sleep(calcular_espera_reintento(intento))
+                continue
 
-            tmdb.language = config['metadata_language'][0]
-            pelicula = tmdb.movie(pelicula_id).details(append_to_response="credits,images,videos")
-            imagenes = tmdb.movie(pelicula_id).images()
-            nombre_base = archivo_video.stem
+            if estado == 200:
+                with open(f"{ruta_destino}{Path(url).suffix.lower()}", 'wb') as f:
+                    f.write(cuerpo)
+                estadisticas_hilos.actual().bytes_descargados += len(cuerpo)
+                metricas.sumar_bytes('descargar_imagen', len(cuerpo))
+                return True
 
-            if not boxfront_local and config['obtener_datos']['poster'] and pelicula.poster_path:
-                poster_url = f"https://image.tmdb.org/t/p/original{pelicula.poster_path}"
-                poster_path = carpetas_imagenes['boxFront'] / nombre_base
-                if descargar_imagen(poster_url, poster_path):
-                    boxfront_local = str(poster_path) + Path(poster_url).suffix
-                    logging.info(f"Poster descargado exitosamente para: {nombre_pelicula} (Archivo: {archivo_video.name})")
-                else:
-                    logging.warning(f"No se pudo descargar el poster para la película: {nombre_pelicula} (Archivo: {archivo_video.name})")
+            logging.warning(f"Respuesta {estado} al descargar {url}")
+            break
 
-            if not screenshot_local and config['obtener_datos']['backdrop'] and pelicula.backdrop_path:
-                backdrop_url = f"https://image.tmdb.org/t/p/original{pelicula.backdrop_path}"
-                backdrop_path = carpetas_imagenes['screenshot'] / nombre_base
-                if descargar_imagen(backdrop_url, backdrop_path):
-                    screenshot_local = str(backdrop_path) + Path(backdrop_url).suffix
-                else:
-                    logging.warning(f"No se pudo descargar el backdrop para la película: {nombre_pelicula} (Archivo: {archivo_video.name})")
-
-            if not wheel_local and config['obtener_datos']['logo'] and hasattr(imagenes, 'logos') and imagenes.logos:
-                logos_ordenados = []
-                metadata_lang = config['metadata_language'][0].split('-')[0]
-                logos_primary = [logo for logo in imagenes.logos if logo.iso_639_1 == metadata_lang]
-                if logos_primary:
-                    logos_ordenados.extend(logos_primary)
-
-                if not logos_ordenados and metadata_lang != 'en':
-                    logos_en = [logo for logo in imagenes.logos if logo.iso_639_1 == 'en']
-                    logos_ordenados.extend(logos_en)
-
-                if not logos_ordenados:
-                    logos_null = [logo for logo in imagenes.logos if logo.iso_639_1 is None]
-                    logos_ordenados.extend(logos_null)
-
-                if not logos_ordenados and imagenes.logos:
-                    logos_ordenados = [imagenes.logos[0]]
-
-                if logos_ordenados:
-                    logo_url = f"https://image.tmdb.org/t/p/original{logos_ordenados[0].file_path}"
-                    logo_path = carpetas_imagenes['wheel'] / nombre_base
-                    if descargar_imagen(logo_url, logo_path):
-                        wheel_local = str(logo_path) + Path(logo_url).suffix
-                    else:
-                        logging.warning(f"No se pudo descargar el logo para la película: {nombre_pelicula} (Archivo: {archivo_video.name})")
+        logging.error(f"Error al descargar imagen: {url}")
+        return False
+
+async def buscar_candidatos_async(motor, nombre_sin_año, año_archivo, config):
+    busquedas = await asyncio.gather(
+        *(motor.cliente(idioma).search().movies(nombre_sin_año) for idioma in config['idiomas']),
+        return_exceptions=True
+    )
+    todos_resultados, errores = unir_busquedas(config['idiomas'], busquedas)
+    if not todos_resultados:
+        return [], errores
+    return rankear_candidatos(nombre_sin_año, año_archivo, todos_resultados), errores
+
+async def seleccionar_pelicula_async(motor, ranking, año_archivo, config):
+    idioma = idiomas_metadata(config)[0]
+    seleccion = SeleccionCandidato(ranking, año_archivo, config.get('max_candidatos_detalle', 5))
+    for candidato in seleccion.candidatos():
+        try:
+            pelicula_detalle = await motor.cliente(idioma).movie(candidato.resultado.id).details(**parametros_pelicula_completa(idioma))
+        except Exception as e:
+            seleccion.error(candidato, e)
+        else:
+            seleccion.evaluar(candidato, pelicula_detalle)
+    return seleccion
+
+async def obtener_metadata_pelicula_async(motor, nombre_pelicula, carpetas_imagenes, archivo_video, config, imagenes_existentes=None):
+    for intento in range(config['max_reintentos']):
+        try:
+            if "media/video" in str(archivo_video):
+                logging.info(f"El archivo {archivo_video.name} es un tráiler. Saltando...")
+                return None
+
+            tarea_info_tecnica = asyncio.ensure_future(motor.info_tecnica(archivo_video))
+            locales = assets_locales(imagenes_existentes)
+            nombre_sin_año, año_archivo = separar_año(nombre_pelicula, archivo_video)
+            clave_busqueda = clave_sin_resultado(nombre_sin_año, año_archivo, config)
+            if cache_sin_resultado is not None and await asyncio.to_thread(busqueda_sin_resultado_vigente, clave_busqueda):
+                await tarea_info_tecnica
+                logging.info(f"Búsqueda sin resultado en una ejecución anterior, se omite: {nombre_pelicula} (Archivo: {archivo_video.name})")
+                return None
+
+            ranking = await asyncio.to_thread(buscar_en_indice_titulos, nombre_sin_año, config) if indice_titulos else []
+            pelicula = None
+            if ranking:
+                seleccion = await seleccionar_pelicula_async(motor, ranking, año_archivo, config)
+                pelicula = seleccion.pelicula(archivo_video.name)
+                if not pelicula:
+                    # El índice local solo adelanta la búsqueda: sin candidato válido se pregunta a TMDB
+                    logging.info(f"Ningún candidato del índice de títulos es válido para {archivo_video.name}, se busca en TMDB")
+
+            errores_busqueda = 0
+            if not pelicula:
+                ranking, errores_busqueda = await buscar_candidatos_async(motor, nombre_sin_año, año_archivo, config)
+                if not ranking:
+                    await tarea_info_tecnica
+                    logging.warning(f"No se encontró información para la película: {nombre_pelicula} (Archivo: {archivo_video.name})")
+                    if not errores_busqueda:
+                        await asyncio.to_thread(registrar_sin_resultado, clave_busqueda, nombre_pelicula)
+                    return None
+                seleccion = await seleccionar_pelicula_async(motor, ranking, año_archivo, config)
+                pelicula = seleccion.pelicula(archivo_video.name)
+
+            info_tecnica = await tarea_info_tecnica
+            if not pelicula:
+                logging.warning(f"No se encontró un resultado adecuado para: {nombre_pelicula} (Archivo: {archivo_video.name})")
+                if not seleccion.errores and not errores_busqueda:
+                    await asyncio.to_thread(registrar_sin_resultado, clave_busqueda, nombre_pelicula)
+                return None
+            if cache_sin_resultado is not None:
+                await asyncio.to_thread(olvidar_sin_resultado, clave_busqueda)
+
+            duracion_tmdb = pelicula.runtime
+            if not duracion_tmdb:
+                duracion_tmdb = info_tecnica['duracion']
+
+            nombre_base = archivo_video.stem
+            descargas = planificar_descargas_imagenes(pelicula, carpetas_imagenes, nombre_base, locales, config)
+            completadas = await asyncio.gather(*(motor.descargar_imagen(url, ruta) for _, _, url, ruta, _ in descargas))
+
+            for (clave_local, tipo, url, ruta_destino, imagen_tmdb), completada in zip(descargas, completadas):
+                if completada:
+                    registrar_imagen_descargada(locales, clave_local, url, ruta_destino, imagen_tmdb)
+                    logging.info(f"Imagen ({tipo}) descargada exitosamente para: {nombre_pelicula} (Archivo: {archivo_video.name})")
                 else:
-                    logging.warning(f"No se encontró logo para la película: {nombre_pelicula} (Archivo: {archivo_video.name})")
+                    logging.warning(f"No se pudo descargar el {tipo} para la película: {nombre_pelicula} (Archivo: {archivo_video.name})")
 
-            if not video_local and config['obtener_datos']['trailer']:
+            if not locales['video_local'] and config['obtener_datos']['trailer']:
                 video_path = carpetas_imagenes['video'] / nombre_base
-                if descargar_trailer(tmdb, pelicula_id, video_path, config['calidad_trailer']):
-                    video_local = str(video_path) + ".mp4"
+                if await motor.ejecutar_bloqueante('trailer', descargar_trailer, motor.clientes_tmdb, pelicula, video_path, config['calidad_trailer']):
+                    locales['video_local'] = str(video_path) + ".mp4"
+                    registrar_asset_media(locales['video_local'])
                 else:
                     logging.warning(f"No se pudo descargar el tráiler para la película: {nombre_pelicula} (Archivo: {archivo_video.name})")
 
-            metadata_final = {
-                'titulo': archivo_video.stem,
-                'titulo_tmdb': pelicula.title,
-                'titulo_original': pelicula.original_title if hasattr(pelicula, 'original_title') else None,
-                'año': str(pelicula.release_date.year) if pelicula.release_date else None,
-                'duracion': duracion_tmdb,
-                'director': next((crew.name for crew in pelicula.credits.crew if crew.job == "Director"), "Desconocido"),
-                'productora': [company.name for company in pelicula.production_companies] if pelicula.production_companies else [],
-                'rating': round(pelicula.vote_average / 10, 2) if pelicula.vote_average else 0,
-                'descripcion': mejor_descripcion,
-                'generos': [genero.name for genero in pelicula.genres],
-                'boxfront_local': boxfront_local,
-                'screenshot_local': screenshot_local,
-                'wheel_local': wheel_local,
-                'video_local': video_local,
-                'tmdb_id': pelicula_id,
-                'fecha_lanzamiento': str(pelicula.release_date) if pelicula.release_date else None,
-                'idioma_metadata': ", ".join(config['metadata_language']),
-                'x-added-date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'x-Duration': duracion_tmdb,
-                'x-tagline': mejor_tagline if mejor_tagline else "",
-                'x-classification': clasificacion if clasificacion else "Desconocido",
-                'x-codec': info_tecnica['x-codec'],
-                'x-resolution': info_tecnica['x-resolution'],
-                'x-aspect': info_tecnica['x-aspect'],
-                'x-audio': info_tecnica['x-audio']
-            }
-
-            return metadata_final
+            return construir_metadata_pelicula(pelicula, archivo_video, info_tecnica, duracion_tmdb, locales, config)
 
         except Exception as e:
             logging.error(f"Error al procesar {nombre_pelicula} (Intento {intento + 1}): {e}")
-            time.sleep((2 ** intento) * 1)
+            await asyncio.sleep(calcular_espera_reintento(intento))
 
     logging.error(f"Error al procesar {nombre_pelicula} después de {config['max_reintentos']} intentos.")
     return None
 
-def obtener_metadata_serie(tmdb, nombre_serie, carpetas_imagenes, ruta_carpeta):
+async def ejecutar_motor_async(archivos, procesar_archivo_async, config, cache_tmdb, clientes_tmdb, detener=None):
+    from tqdm import tqdm
+    async with MotorAsync(config, cache_tmdb, clientes_tmdb) as motor:
+        semaforo_archivos = motor.semaforo('archivos')
+
+        async def procesar(archivo):
+            async with semaforo_archivos:
+                if detener is not None and detener.is_set():
+                    return
+                await procesar_archivo_async(motor, archivo)
+
+        tareas = [asyncio.ensure_future(procesar(archivo)) for archivo in archivos]
+
+        with tqdm(total=len(archivos), desc=get_translation("progress", config['interface_language']),
+              unit=get_translation("progress_file", config['interface_language'])) as pbar:
+            for tarea in asyncio.as_completed(tareas):
+                try:
+                    await tarea
+                except Exception as e:
+                    logging.error(f"Error al procesar archivo: {e}")
+                finally:
+                    pbar.update(1)
+
+def obtener_metadata_serie(clientes_tmdb, nombre_serie, carpetas_imagenes, ruta_carpeta):
     try:
+        tmdb = clientes_tmdb.cliente(idiomas_metadata(config)[0])
         resultados = tmdb.search().tv(nombre_serie)
         if not resultados:
             return None
@@ -674,19 +2817,19 @@ def obtener_metadata_serie(tmdb, nombre_serie, carpetas_imagenes, ruta_carpeta):
         boxfront_local = screenshot_local = wheel_local = None
 
         if config['obtener_datos']['poster'] and serie.poster_path:
-            poster_url = f"https://image.tmdb.org/t/p/original{serie.poster_path}"
+            poster_url = url_imagen_tmdb(serie.poster_path, 'poster', config)
             poster_path = carpetas_imagenes['boxFront'] / f"{nombre_seguro}.{config['formato_imagenes']}"
             if descargar_imagen(poster_url, poster_path):
                 boxfront_local = str(poster_path)
 
         if config['obtener_datos']['backdrop'] and serie.backdrop_path:
-            backdrop_url = f"https://image.tmdb.org/t/p/original{serie.backdrop_path}"
+            backdrop_url = url_imagen_tmdb(serie.backdrop_path, 'backdrop', config)
             backdrop_path = carpetas_imagenes['screenshot'] / f"{nombre_seguro}.{config['formato_imagenes']}"
             if descargar_imagen(backdrop_url, backdrop_path):
                 screenshot_local = str(backdrop_path)
 
         if config['obtener_datos']['logo'] and hasattr(imagenes, 'logos') and imagenes.logos:
-            logo_url = f"https://image.tmdb.org/t/p/original{imagenes.logos[0].file_path}"
+            logo_url = url_imagen_tmdb(imagenes.logos[0].file_path, 'logo', config)
             logo_path = carpetas_imagenes['wheel'] / f"{nombre_seguro}.{config['formato_imagenes']}"
             if descargar_imagen(logo_url, logo_path):
                 wheel_local = str(logo_path)
@@ -716,74 +2859,127 @@ def cargar_metadata_existente(ruta_metadata):
             return json.load(f)
     return None
 
-def actualizar_metadata(nuevos_datos, ruta_metadata):
-    if ruta_metadata.exists():
-        with open(ruta_metadata, 'r', encoding='utf-8') as f:
-            metadata_existente = json.load(f)
-    else:
-        metadata_existente = {
-            "metadata": [],
-            "errores": [],
-            "timestamp": datetime.now().isoformat(),
-            "estadisticas": {
-                "total_procesadas": 0,
-                "encontradas": 0,
-                "no_encontradas": 0,
-                "imagenes_descargadas": {
-                    "boxfront": 0,
-                    "screenshot": 0,
-                    "wheel": 0
-                },
-                "trailers_descargados": 0
-            }
+def metadata_vacia():
+    return {
+        "metadata": [],
+        "errores": [],
+        "timestamp": datetime.now().isoformat(),
+        "estadisticas": Estadisticas().como_dict()
+    }
+
+class IndiceCatalogo:
+    # Índices en memoria sobre metadata.json: por archivo_original (una entrada por archivo) y
+    # por tmdb_id (varios archivos pueden ser la misma película). La lista del JSON sigue siendo
+    # la que se guarda; los índices apuntan a los mismos diccionarios.
+    def __init__(self, datos=None):
+        self.datos = datos if datos and "metadata" in datos else metadata_vacia()
+        self.por_archivo = {}
+        self.por_tmdb_id = {}
+        # Entradas nuevas o modificadas desde la carga: son las únicas cuyo bloque de metadata.txt se regenera
+        self.cambiados = set()
+        for item in self.datos["metadata"]:
+            self._indexar(item)
+
+    def _indexar(self, item):
+        self.por_archivo.setdefault(item.get("archivo_original"), item)
+        tmdb_id = (item.get("metadata") or {}).get("tmdb_id")
+        if tmdb_id is not None:
+            self.por_tmdb_id.setdefault(tmdb_id, []).append(item)
+
+    def _desindexar_tmdb(self, item):
+        tmdb_id = (item.get("metadata") or {}).get("tmdb_id")
+        items = self.por_tmdb_id.get(tmdb_id)
+        if items and item in items:
+            items.remove(item)
+            if not items:
+                del self.por_tmdb_id[tmdb_id]
+
+    def __len__(self):
+        return len(self.datos["metadata"])
+
+    def __contains__(self, archivo_original):
+        return str(archivo_original) in self.por_archivo
+
+    def obtener(self, archivo_original):
+        return self.por_archivo.get(str(archivo_original))
+
+    def buscar_tmdb_id(self, tmdb_id):
+        return list(self.por_tmdb_id.get(tmdb_id, []))
+
+    def rutas(self):
+        return self.por_archivo.keys()
+
+    def guardar_item(self, nuevo_item):
+        archivo_original = nuevo_item.get("archivo_original")
+        self.cambiados.add(archivo_original)
+        datos_item = {
+            "tipo": "pelicula",
+            "archivo_original": archivo_original,
+            "nombre_extraido": nuevo_item["nombre_extraido"],
+            "metadata": nuevo_item["metadata"]
         }
 
+        item = self.por_archivo.get(archivo_original)
+        if item is None:
+            self.datos["metadata"].append(datos_item)
+            self._indexar(datos_item)
+            return datos_item
+
+        self._desindexar_tmdb(item)
+        item.update(datos_item)
+        tmdb_id = (item.get("metadata") or {}).get("tmdb_id")
+        if tmdb_id is not None:
+            self.por_tmdb_id.setdefault(tmdb_id, []).append(item)
+        return item
+
+    def mover(self, origen, destino):
+        item = self.por_archivo.pop(origen, None)
+        if item is not None:
+            item["archivo_original"] = destino
+            self.por_archivo[destino] = item
+            self.cambiados.add(destino)
+
+    def eliminar(self, archivos):
+        archivos = {str(archivo) for archivo in archivos}
+        if not archivos:
+            return
+        conservados = []
+        for item in self.datos["metadata"]:
+            if item.get("archivo_original") in archivos:
+                self._desindexar_tmdb(item)
+            else:
+                conservados.append(item)
+        self.datos["metadata"] = conservados
+        for archivo in archivos:
+            self.por_archivo.pop(archivo, None)
+
+def actualizar_metadata(nuevos_datos, ruta_metadata, cambios_biblioteca=None):
+    catalogo = IndiceCatalogo(cargar_metadata_existente(ruta_metadata))
+    metadata_existente = catalogo.datos
+
+    aplicar_cambios_biblioteca(catalogo, cambios_biblioteca)
+
     for nuevo_item in nuevos_datos["metadata"]:
-        archivo_original = nuevo_item.get("archivo_original")
-        encontrado = False
-
-        for item in metadata_existente["metadata"]:
-            if item.get("archivo_original") == archivo_original:
-                item.update({
-                    "tipo": "pelicula",
-                    "archivo_original": archivo_original,
-                    "nombre_extraido": nuevo_item["nombre_extraido"],
-                    "metadata": nuevo_item["metadata"]
-                })
-                encontrado = True
-                break
+        catalogo.guardar_item(nuevo_item)
 
-        if not encontrado:
-            metadata_existente["metadata"].append({
-                "tipo": "pelicula",
-                "archivo_original": archivo_original,
-                "nombre_extraido": nuevo_item["nombre_extraido"],
-                "metadata": nuevo_item["metadata"]
-            })
-
-    metadata_existente["estadisticas"]["total_procesadas"] += nuevos_datos["estadisticas"]["total_procesadas"]
-    metadata_existente["estadisticas"]["encontradas"] += nuevos_datos["estadisticas"]["encontradas"]
-    metadata_existente["estadisticas"]["no_encontradas"] += nuevos_datos["estadisticas"]["no_encontradas"]
-    metadata_existente["estadisticas"]["imagenes_descargadas"]["boxfront"] += nuevos_datos["estadisticas"]["imagenes_descargadas"]["boxfront"]
-    metadata_existente["estadisticas"]["imagenes_descargadas"]["screenshot"] += nuevos_datos["estadisticas"]["imagenes_descargadas"]["screenshot"]
-    metadata_existente["estadisticas"]["imagenes_descargadas"]["wheel"] += nuevos_datos["estadisticas"]["imagenes_descargadas"]["wheel"]
-    metadata_existente["estadisticas"]["trailers_descargados"] += nuevos_datos["estadisticas"].get("trailers_descargados", 0)
-
-    with open(ruta_metadata, 'w', encoding='utf-8') as f:
-        json.dump(metadata_existente, f, ensure_ascii=False, indent=2)
+    fusionar_estadisticas(metadata_existente, Estadisticas.desde_dict(nuevos_datos["estadisticas"]))
+
+    guardar_metadata(catalogo, ruta_metadata)
 
+def guardar_metadata(catalogo, ruta_metadata):
+    # Se comprueba antes de escribir metadata.json, que después siempre es más reciente que el TXT
     ruta_txt = ruta_metadata.with_suffix('.txt')
-    convert_json_to_txt(metadata_existente, ruta_txt)
+    cambiados = catalogo.cambiados if txt_al_dia(ruta_txt, ruta_metadata) else None
 
-def archivo_tiene_metadata(archivo, metadata_existente):
-    if metadata_existente and "metadata" in metadata_existente:
-        for item in metadata_existente["metadata"]:
-            if item.get("archivo_original") == str(archivo):
-                return True
-    return False
+    with metricas.medir('escribir_json'), escribir_atomico(ruta_metadata) as f:
+        json.dump(catalogo.datos, f, ensure_ascii=False, indent=2)
+
+    with metricas.medir('escribir_txt'):
+        convert_json_to_txt(catalogo.datos, ruta_txt, cambiados)
+    catalogo.cambiados = set()
 
-def listar_peliculas(metadata_existente):
-    if not metadata_existente or "metadata" not in metadata_existente:
+def listar_peliculas(catalogo):
+    if not len(catalogo):
         logging.error(get_translation("no_metadata", config['interface_language']))
         return None
 
@@ -803,7 +2999,7 @@ def listar_peliculas(metadata_existente):
     except:
         supports_color = False
 
-    peliculas_ordenadas = sorted(metadata_existente["metadata"], key=lambda x: x.get('nombre_extraido', '').lower())
+    peliculas_ordenadas = sorted(catalogo.datos["metadata"], key=lambda x: x.get('nombre_extraido', '').lower())
 
     print(f"\n{get_translation('movies_available', config['interface_language'])}")
     print(f"0. {get_translation('cancel', config['interface_language'])}")
@@ -841,59 +3037,43 @@ def listar_peliculas(metadata_existente):
         return peliculas_ordenadas[int(seleccion) - 1]
     return None
 
-def actualizar_pelicula_manual(tmdb, pelicula, carpetas_imagenes, ruta_metadata):
+def actualizar_pelicula_manual(clientes_tmdb, pelicula, carpetas_imagenes, ruta_metadata, catalogo):
+    import requests
     nombre_pelicula = pelicula.get("nombre_extraido", "Desconocido")
     archivo_video = Path(pelicula.get("archivo_original", ""))
     info_tecnica = obtener_info_tecnica(archivo_video)
 
     logging.info(f"Eliminando archivos relacionados para: {nombre_pelicula}")
-    nombre_base = archivo_video.stem
-
-    for tipo, carpeta in carpetas_imagenes.items():
-        for archivo in carpeta.glob(f"{nombre_base}.*"):
-            try:
-                archivo.unlink()
-                logging.info(f"Archivo eliminado: {archivo}")
-            except Exception as e:
-                logging.warning(f"No se pudo eliminar {archivo}: {e}")
-
-    metadata_existente = cargar_metadata_existente(ruta_metadata)
-    if metadata_existente and "metadata" in metadata_existente:
-        metadata_existente["metadata"] = [
-            item for item in metadata_existente["metadata"]
-            if item.get("archivo_original") != str(archivo_video)
-        ]
+    eliminar_archivos_relacionados(pelicula, config['ruta_peliculas'])
 
-        with open(ruta_metadata, 'w', encoding='utf-8') as f:
-            json.dump(metadata_existente, f, ensure_ascii=False, indent=2)
-
-        ruta_txt = ruta_metadata.with_suffix('.txt')
-        convert_json_to_txt(metadata_existente, ruta_txt)
+    # La entrada se quita solo en memoria; metadata.json y metadata.txt se escriben una sola vez al final
+    eliminada = str(archivo_video) in catalogo
+    if eliminada:
+        catalogo.eliminar([archivo_video])
 
     print(f"\n{get_translation('updating_metadata_for', config['interface_language'])}: {nombre_pelicula}")
-    tmdb.language = config['metadata_language'][0]
-    resultados = tmdb.search().movies(nombre_pelicula)
+    idioma_principal = idiomas_metadata(config)[0]
+    resultados = clientes_tmdb.cliente(idioma_principal).search().movies(nombre_pelicula)
 
     if not resultados:
         for idioma in config['idiomas']:
-            if idioma != config['metadata_language'][0]:
-                tmdb.language = idioma
-                resultados_alt = tmdb.search().movies(nombre_pelicula)
+            if idioma != idioma_principal:
+                resultados_alt = clientes_tmdb.cliente(idioma).search().movies(nombre_pelicula)
                 if resultados_alt:
                     resultados.extend(resultados_alt)
 
     if not resultados:
         logging.warning(f"No se encontraron resultados para: {nombre_pelicula}")
+        if eliminada:
+            guardar_metadata(catalogo, ruta_metadata)
         return
 
     print(f"\n{get_translation('results_for', config['interface_language'])} '{nombre_pelicula}':")
     print("\n" + "="*100)
 
-    tmdb.language = config['metadata_language'][0]
-
     for i, resultado in enumerate(resultados):
         try:
-            detalles = tmdb.movie(resultado.id).details()
+            detalles = clientes_tmdb.cliente(idioma_principal).movie(resultado.id).details()
         except requests.exceptions.HTTPError as e:
             if e.response.status_code == 404:
                 logging.warning(f"Película con ID {resultado.id} no encontrada en TMDb. Saltando...")
@@ -914,7 +3094,7 @@ def actualizar_pelicula_manual(tmdb, pelicula, carpetas_imagenes, ruta_metadata)
 
         poster_url = None
         if hasattr(detalles, 'poster_path') and detalles.poster_path:
-            poster_url = f"https://image.tmdb.org/t/p/original{detalles.poster_path}"
+            poster_url = url_imagen_tmdb(detalles.poster_path, 'poster', config)
         print(f"\n{i + 1}. {get_translation('metadata_fields.title', config['interface_language'])}: {detalles.title}")
         print(f"   {get_translation('metadata_fields.year', config['interface_language'])}: {año}")
         if hasattr(detalles, 'original_title') and detalles.original_title != detalles.title:
@@ -926,6 +3106,8 @@ def actualizar_pelicula_manual(tmdb, pelicula, carpetas_imagenes, ruta_metadata)
         if poster_url:
             print(f"   Poster: {poster_url}")
         print(f"   ID TMDb: {detalles.id}")
+        for item in catalogo.buscar_tmdb_id(detalles.id):
+            print(f"   {get_translation('already_in_library', config['interface_language'])}: {item.get('archivo_original')}")
         if hasattr(detalles, 'genres') and detalles.genres:
             generos = ", ".join([genero.name for genero in detalles.genres])
             print(f"   {get_translation('metadata_fields.genres', config['interface_language'])}: {generos}")
@@ -935,57 +3117,30 @@ def actualizar_pelicula_manual(tmdb, pelicula, carpetas_imagenes, ruta_metadata)
     seleccion = input(f"\n{get_translation('select_correct_movie', config['interface_language'])}")
     if not seleccion.isdigit() or int(seleccion) < 1 or int(seleccion) > len(resultados):
         logging.info("Actualización cancelada.")
+        if eliminada:
+            guardar_metadata(catalogo, ruta_metadata)
         return
 
     try:
         pelicula_seleccionada = resultados[int(seleccion) - 1]
         pelicula_id = pelicula_seleccionada.id
-        clasificacion = obtener_clasificacion_mpa(tmdb, pelicula_id)
-        tmdb.language = config['metadata_language'][0]
-        pelicula = tmdb.movie(pelicula_id).details(append_to_response="credits,images,videos")
-        imagenes = tmdb.movie(pelicula_id).images()
+        pelicula = obtener_pelicula_completa(clientes_tmdb, pelicula_id, idioma_principal)
+        clasificacion = obtener_clasificacion_mpa(pelicula)
         nombre_base = archivo_video.stem
-        boxfront_local = screenshot_local = wheel_local = video_local = None
-
-        if config['obtener_datos']['poster'] and pelicula.poster_path:
-            poster_url = f"https://image.tmdb.org/t/p/original{pelicula.poster_path}"
-            poster_path = carpetas_imagenes['boxFront'] / nombre_base
-            if descargar_imagen(poster_url, poster_path):
-                boxfront_local = str(poster_path) + Path(poster_url).suffix
-
-        if config['obtener_datos']['backdrop'] and pelicula.backdrop_path:
-            backdrop_url = f"https://image.tmdb.org/t/p/original{pelicula.backdrop_path}"
-            backdrop_path = carpetas_imagenes['screenshot'] / nombre_base
-            if descargar_imagen(backdrop_url, backdrop_path):
-                screenshot_local = str(backdrop_path) + Path(backdrop_url).suffix
-
-        if config['obtener_datos']['logo'] and hasattr(imagenes, 'logos') and imagenes.logos:
-            logos_ordenados = []
-            metadata_lang = config['metadata_language'][0].split('-')[0]
-            logos_primary = [logo for logo in imagenes.logos if logo.iso_639_1 == metadata_lang]
-            if logos_primary:
-                logos_ordenados.extend(logos_primary)
-
-            if not logos_ordenados and metadata_lang != 'en':
-                logos_en = [logo for logo in imagenes.logos if logo.iso_639_1 == 'en']
-                logos_ordenados.extend(logos_en)
-
-            if not logos_ordenados:
-                logos_null = [logo for logo in imagenes.logos if logo.iso_639_1 is None]
-                logos_ordenados.extend(logos_null)
+        video_local = None
+        locales = assets_locales(None)
 
-            if not logos_ordenados and imagenes.logos:
-                logos_ordenados = [imagenes.logos[0]]
+        for clave_local, tipo, url, ruta_destino, imagen_tmdb in planificar_descargas_imagenes(pelicula, carpetas_imagenes, nombre_base, locales, config):
+            if descargar_imagen(url, ruta_destino):
+                registrar_imagen_descargada(locales, clave_local, url, ruta_destino, imagen_tmdb)
 
-            if logos_ordenados:
-                logo_url = f"https://image.tmdb.org/t/p/original{logos_ordenados[0].file_path}"
-                logo_path = carpetas_imagenes['wheel'] / nombre_base
-                if descargar_imagen(logo_url, logo_path):
-                    wheel_local = str(logo_path) + Path(logo_url).suffix
+        boxfront_local = locales['boxfront_local']
+        screenshot_local = locales['screenshot_local']
+        wheel_local = locales['wheel_local']
 
         if config['obtener_datos']['trailer']:
             video_path = carpetas_imagenes['video'] / nombre_base
-            if descargar_trailer(tmdb, pelicula_id, video_path, config['calidad_trailer']):
+            if descargar_trailer(clientes_tmdb, pelicula, video_path, config['calidad_trailer']):
                 video_local = str(video_path) + ".mp4"
             else:
                 logging.warning(f"{get_translation('trailer_no_downloaded', config['interface_language'])} {nombre_pelicula}")
@@ -1004,9 +3159,10 @@ def actualizar_pelicula_manual(tmdb, pelicula, carpetas_imagenes, ruta_metadata)
             'screenshot_local': screenshot_local,
             'wheel_local': wheel_local,
             'video_local': video_local,
+            'imagenes_tmdb': locales['imagenes_tmdb'],
             'tmdb_id': pelicula_id,
             'fecha_lanzamiento': str(pelicula.release_date) if pelicula.release_date else None,
-            'idioma_metadata': ", ".join(config['metadata_language']),
+            'idioma_metadata': ", ".join(idiomas_metadata(config)),
             'x-classification': clasificacion if clasificacion else "Desconocido",
             'x-added-date': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             'x-codec': info_tecnica['x-codec'],
@@ -1015,48 +3171,24 @@ def actualizar_pelicula_manual(tmdb, pelicula, carpetas_imagenes, ruta_metadata)
             'x-audio': info_tecnica['x-audio']
         }
 
-        metadata_existente = cargar_metadata_existente(ruta_metadata)
-        if not metadata_existente:
-            metadata_existente = {
-                "metadata": [],
-                "errores": [],
-                "timestamp": datetime.now().isoformat(),
-                "estadisticas": {
-                    "total_procesadas": 0,
-                    "encontradas": 0,
-                    "no_encontradas": 0,
-                    "imagenes_descargadas": {
-                        "boxfront": 0,
-                        "screenshot": 0,
-                        "wheel": 0
-                    },
-                    "trailers_descargados": 0
-                }
-            }
-
-        metadata_existente["metadata"].append({
-            "tipo": "pelicula",
+        catalogo.guardar_item({
             "archivo_original": str(archivo_video),
             "nombre_extraido": nombre_pelicula,
             "metadata": nuevos_metadatos
         })
+        estadisticas = Estadisticas()
+        estadisticas.contabilizar({
+            "metadata": nuevos_metadatos,
+            "descargas": {
+                'boxfront': bool(boxfront_local),
+                'screenshot': bool(screenshot_local),
+                'wheel': bool(wheel_local),
+                'trailer': bool(video_local)
+            }
+        })
+        fusionar_estadisticas(catalogo.datos, estadisticas)
 
-        metadata_existente["estadisticas"]["total_procesadas"] += 1
-        metadata_existente["estadisticas"]["encontradas"] += 1
-        if boxfront_local:
-            metadata_existente["estadisticas"]["imagenes_descargadas"]["boxfront"] += 1
-        if screenshot_local:
-            metadata_existente["estadisticas"]["imagenes_descargadas"]["screenshot"] += 1
-        if wheel_local:
-            metadata_existente["estadisticas"]["imagenes_descargadas"]["wheel"] += 1
-        if video_local:
-            metadata_existente["estadisticas"]["trailers_descargados"] += 1
-
-        with open(ruta_metadata, 'w', encoding='utf-8') as f:
-            json.dump(metadata_existente, f, ensure_ascii=False, indent=2)
-
-        ruta_txt = ruta_metadata.with_suffix('.txt')
-        convert_json_to_txt(metadata_existente, ruta_txt)
+        guardar_metadata(catalogo, ruta_metadata)
 
         print(f"\n{get_translation('metadata_updated', config['interface_language'])}: {nombre_pelicula}")
         print(f"Metadatos actualizados correctamente para: {nombre_pelicula}")
@@ -1066,157 +3198,359 @@ def actualizar_pelicula_manual(tmdb, pelicula, carpetas_imagenes, ruta_metadata)
         logging.error(f"Error al obtener metadatos para la película seleccionada: {e}")
         print(f"\nError al actualizar los metadatos para: {nombre_pelicula}")
         print(f"Detalles del error: {e}")
+        if eliminada:
+            guardar_metadata(catalogo, ruta_metadata)
+
+CABECERA_TXT = (
+    "collection: Movies\n"
+    "shortname: movies\n"
+    "extension: mp4, mkv, avi, mov, wmv, flv, mpeg, ts\n"
+    "launch: command... {file.path}\n\n"
+)
 
-def convert_json_to_txt(json_data, output_file):
+def renderizar_bloque_txt(item):
+    lineas = []
+    if item.get('metadata') is None:
+        archivo_original = item.get('archivo_original', '')
+        nombre_archivo = normalizar_ruta_para_sistema(archivo_original)
+        nombre_base = os.path.splitext(Path(archivo_original).name)[0]
+
+        lineas.append(f"game: {nombre_base}")
+        lineas.append("file:")
+        lineas.append(f"  {nombre_archivo}")
+        lineas.append("developer: Unknown")
+        lineas.append("publisher: Unknown")
+        lineas.append("genre: Unknown")
+        lineas.append("description:")
+        lineas.append("  No description available")
+        lineas.append("release: Unknown")
+        lineas.append("rating: 0%")
+        lineas.append("x-tagline: ")
+        lineas.append("x-lastPosition: 0")
+        lineas.append("x-codec: Unknown")
+        lineas.append("x-resolution: Unknown")
+        lineas.append("x-aspect: Unknown")
+        lineas.append("x-audio: Unknown")
+        lineas.append("x-classification: Unknown")
+    else:
+        metadata = item['metadata']
+        titulo = metadata.get('titulo', '')
+        archivo_original = item.get('archivo_original', '')
+        director = metadata.get('director', '')
+        productoras = metadata.get('productora', [])
+        productora = productoras[0] if productoras else ''
+        generos = ', '.join(metadata.get('generos', []))
+        descripcion = metadata.get('descripcion', '')
+        fecha_lanzamiento = metadata.get('fecha_lanzamiento', '')
+        rating = int(float(metadata.get('rating', 0)) * 100)
+        x_tagline = metadata.get('x-tagline', '')
+        x_clasification = metadata.get('x-classification', 'Unknown')
+
+        archivo_normalizado = normalizar_ruta_para_sistema(archivo_original)
+        boxfront_normalizado = normalizar_ruta_para_sistema(metadata.get('boxfront_local', ''), True)
+        screenshot_normalizado = normalizar_ruta_para_sistema(metadata.get('screenshot_local', ''), True)
+        wheel_normalizado = normalizar_ruta_para_sistema(metadata.get('wheel_local', ''), True)
+        video_normalizado = normalizar_ruta_para_sistema(metadata.get('video_local', ''), True)
+
+        x_timestamp = ""
+        if 'x-added-date' in metadata:
+            try:
+                # fromisoformat lee "%Y-%m-%d %H:%M:%S" bastante más rápido que strptime
+                fecha = datetime.fromisoformat(metadata['x-added-date'])
+                x_timestamp = str(int(fecha.timestamp() * 1000))
+            except:
+                x_timestamp = ""
+
+        lineas.append(f"game: {titulo}")
+        lineas.append("file:")
+        lineas.append(f"  {archivo_normalizado}")
+        lineas.append(f"developer: {director}")
+        lineas.append(f"publisher: {productora}")
+        lineas.append(f"genre: {generos}")
+        lineas.append("description:")
+        lineas.append(f"  {descripcion}")
+        lineas.append(f"release: {fecha_lanzamiento}")
+        lineas.append(f"rating: {rating}%")
+
+        if boxfront_normalizado:
+            lineas.append(f"assets.boxFront: {boxfront_normalizado}")
+        if screenshot_normalizado:
+            lineas.append(f"assets.screenshot: {screenshot_normalizado}")
+        if wheel_normalizado:
+            lineas.append(f"assets.wheel: {wheel_normalizado}")
+        if video_normalizado:
+            lineas.append(f"assets.video: {video_normalizado}")
+
+        lineas.append(f"x-codec: {metadata.get('x-codec', 'Unknown')}")
+        lineas.append(f"x-resolution: {metadata.get('x-resolution', 'Unknown')}")
+        lineas.append(f"x-aspect: {metadata.get('x-aspect', 'Unknown')}")
+        lineas.append(f"x-audio: {metadata.get('x-audio', 'Unknown')}")
+
+        if x_timestamp:
+            lineas.append(f"x-added-timestamp: {x_timestamp}")
+        if metadata.get('x-Duration'):
+            lineas.append(f"x-Duration: {metadata.get('x-Duration')}")
+        lineas.append(f"x-tagline: {x_tagline}")
+        lineas.append(f"x-classification: {x_clasification}")
+    return "\n".join(lineas) + "\n\n"
+
+def clave_bloque_txt(archivo_original):
+    return f"file:\n  {normalizar_ruta_para_sistema(archivo_original)}\n"
+
+def txt_al_dia(ruta_txt, ruta_json):
+    # Si metadata.json se editó a mano después de generar el TXT, sus bloques no sirven
     try:
-        separador = '\\' if os.name == 'nt' else '/'
+        return os.path.getmtime(ruta_txt) >= os.path.getmtime(ruta_json)
+    except OSError:
+        return False
 
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write("collection: Movies\n")
-            f.write("shortname: movies\n")
-            f.write("extension: mp4, mkv, avi, mov, wmv, flv, mpeg, ts\n")
-            f.write('launch: command... {file.path}\n\n')
+def cargar_bloques_txt(ruta_txt):
+    # El metadata.txt anterior hace de caché de bloques ya renderizados, indexados por su línea
+    # "file:". Quien lo usa debe comprobar antes con txt_al_dia que sigue vigente.
+    try:
+        with open(ruta_txt, 'r', encoding='utf-8') as f:
+            contenido = f.read()
+    except OSError:
+        return {}
+
+    if not contenido.startswith(CABECERA_TXT):
+        return {}
+
+    bloques = {}
+    repetidas = set()
+    for bloque in contenido[len(CABECERA_TXT):].split("\n\n"):
+        if not bloque:
+            continue
+        lineas = bloque.split("\n", 3)
+        # Un bloque completo empieza con game/file y termina con x-classification; una sinopsis
+        # con líneas en blanco lo partiría, y esos trozos se descartan para volver a renderizarlos
+        if len(lineas) < 4 or lineas[1] != "file:" or not bloque.rpartition("\n")[2].startswith("x-classification: "):
+            continue
+        clave = f"{lineas[1]}\n{lineas[2]}\n"
+        if clave in bloques:
+            # Dos archivos con el mismo nombre en carpetas distintas: no se puede saber cuál es cuál
+            repetidas.add(clave)
+        bloques[clave] = bloque + "\n\n"
+    for clave in repetidas:
+        del bloques[clave]
+    return bloques
+
+def iterar_metadata_json(ruta_metadata, tamano_lectura=1 << 20):
+    # Lee las entradas de la lista "metadata" de metadata.json una a una, sin cargar el archivo
+    # entero: solo el bloque leído y la entrada en curso están en memoria
+    decodificador = json.JSONDecoder()
+    with open(ruta_metadata, 'r', encoding='utf-8') as f:
+        buffer = f.read(tamano_lectura)
+        inicio = re.search(r'"metadata"\s*:\s*\[', buffer)
+        while inicio is None:
+            bloque = f.read(tamano_lectura)
+            if not bloque:
+                return
+            buffer += bloque
+            inicio = re.search(r'"metadata"\s*:\s*\[', buffer)
+        posicion = inicio.end()
+
+        while True:
+            while posicion < len(buffer) and buffer[posicion] in ' \t\r\n,':
+                posicion += 1
+            if posicion < len(buffer) and buffer[posicion] == ']':
+                return
+            try:
+                item, fin = decodificador.raw_decode(buffer, posicion)
+            except ValueError:
+                bloque = f.read(tamano_lectura)
+                if not bloque:
+                    raise
+                buffer = buffer[posicion:] + bloque
+                posicion = 0
+                continue
+            yield item
+            posicion = fin
+            if posicion > tamano_lectura:
+                buffer = buffer[posicion:]
+                posicion = 0
+
+def generar_txt(items, bloques=None, cambiados=None, contador=None):
+    # Un string por entrada: el bloque del metadata.txt anterior si la entrada no cambió, o uno
+    # renderizado en el momento. items puede ser cualquier iterable (lista o iterar_metadata_json).
+    yield CABECERA_TXT
+    for item in items:
+        try:
+            bloque = None
+            if bloques and item.get('archivo_original', '') not in cambiados:
+                bloque = bloques.get(clave_bloque_txt(item.get('archivo_original', '')))
+            if bloque is None:
+                bloque = renderizar_bloque_txt(item)
+                if contador is not None:
+                    contador['generados'] += 1
+            elif contador is not None:
+                contador['reutilizados'] += 1
+            yield bloque
+        except Exception as e:
+            logging.warning(f"Error procesando película: {e}")
+
+def escribir_en_bloques(f, partes, tamano_buffer=1 << 20):
+    # Junta los bloques hasta ~1 MB por write en lugar de decenas de writes pequeños por película
+    pendientes = []
+    tamano = 0
+    for parte in partes:
+        pendientes.append(parte)
+        tamano += len(parte)
+        if tamano >= tamano_buffer:
+            f.write(''.join(pendientes))
+            pendientes = []
+            tamano = 0
+    if pendientes:
+        f.write(''.join(pendientes))
+
+def convert_json_to_txt(json_data, output_file, cambiados=None):
+    # json_data puede ser el diccionario de metadata.json o un iterable de entradas.
+    # cambiados=None regenera todo el archivo; con un conjunto de rutas solo se renderizan esas
+    # entradas y el resto se copia del metadata.txt anterior, que debe estar al día (txt_al_dia)
+    output_file = Path(output_file)
+    items = json_data["metadata"] if isinstance(json_data, dict) else json_data
+    bloques = {}
+    if cambiados is not None:
+        bloques = cargar_bloques_txt(output_file)
 
-            for item in json_data["metadata"]:
-                try:
-                    if item.get('metadata') is None:
-                        archivo_original = item.get('archivo_original', '')
-                        nombre_archivo = normalizar_ruta_para_sistema(archivo_original)
-                        nombre_base = os.path.splitext(Path(archivo_original).name)[0]
-
-                        f.write(f"game: {nombre_base}\n")
-                        f.write("file:\n")
-                        f.write(f"  {nombre_archivo}\n")
-                        f.write("developer: Unknown\n")
-                        f.write("publisher: Unknown\n")
-                        f.write("genre: Unknown\n")
-                        f.write("description:\n")
-                        f.write("  No description available\n")
-                        f.write("release: Unknown\n")
-                        f.write("rating: 0%\n")
-                        f.write("x-tagline: \n")
-                        f.write("x-lastPosition: 0\n")
-                        f.write("x-codec: Unknown\n")
-                        f.write("x-resolution: Unknown\n")
-                        f.write("x-aspect: Unknown\n")
-                        f.write("x-audio: Unknown\n")
-                        f.write("x-classification: Unknown\n")
-                        f.write("\n")
-                    else:
-                        metadata = item['metadata']
-                        titulo = metadata.get('titulo', '')
-                        archivo_original = item.get('archivo_original', '')
-                        director = metadata.get('director', '')
-                        productoras = metadata.get('productora', [])
-                        productora = productoras[0] if productoras else ''
-                        generos = ', '.join(metadata.get('generos', []))
-                        descripcion = metadata.get('descripcion', '')
-                        fecha_lanzamiento = metadata.get('fecha_lanzamiento', '')
-                        rating = int(float(metadata.get('rating', 0)) * 100)
-                        x_tagline = metadata.get('x-tagline', '')
-                        x_clasification = metadata.get('x-classification', 'Unknown')
-
-                        archivo_normalizado = normalizar_ruta_para_sistema(archivo_original)
-                        boxfront_normalizado = normalizar_ruta_para_sistema(metadata.get('boxfront_local', ''), True)
-                        screenshot_normalizado = normalizar_ruta_para_sistema(metadata.get('screenshot_local', ''), True)
-                        wheel_normalizado = normalizar_ruta_para_sistema(metadata.get('wheel_local', ''), True)
-                        video_normalizado = normalizar_ruta_para_sistema(metadata.get('video_local', ''), True)
-
-                        x_timestamp = ""
-                        if 'x-added-date' in metadata:
-                            try:
-                                fecha = datetime.strptime(metadata['x-added-date'], "%Y-%m-%d %H:%M:%S")
-                                x_timestamp = str(int(fecha.timestamp() * 1000))
-                            except:
-                                x_timestamp = ""
-
-                        f.write(f"game: {titulo}\n")
-                        f.write("file:\n")
-                        f.write(f"  {archivo_normalizado}\n")
-                        f.write(f"developer: {director}\n")
-                        f.write(f"publisher: {productora}\n")
-                        f.write(f"genre: {generos}\n")
-                        f.write("description:\n")
-                        f.write(f"  {descripcion}\n")
-                        f.write(f"release: {fecha_lanzamiento}\n")
-                        f.write(f"rating: {rating}%\n")
-
-                        if boxfront_normalizado:
-                            f.write(f"assets.boxFront: {boxfront_normalizado}\n")
-                        if screenshot_normalizado:
-                            f.write(f"assets.screenshot: {screenshot_normalizado}\n")
-                        if wheel_normalizado:
-                            f.write(f"assets.wheel: {wheel_normalizado}\n")
-                        if video_normalizado:
-                            f.write(f"assets.video: {video_normalizado}\n")
-
-                        f.write(f"x-codec: {metadata.get('x-codec', 'Unknown')}\n")
-                        f.write(f"x-resolution: {metadata.get('x-resolution', 'Unknown')}\n")
-                        f.write(f"x-aspect: {metadata.get('x-aspect', 'Unknown')}\n")
-                        f.write(f"x-audio: {metadata.get('x-audio', 'Unknown')}\n")
-
-                        if x_timestamp:
-                            f.write(f"x-added-timestamp: {x_timestamp}\n")
-                        if metadata.get('x-Duration'):
-                            f.write(f"x-Duration: {metadata.get('x-Duration')}\n")
-                        f.write(f"x-tagline: {x_tagline}\n")
-                        f.write(f"x-classification: {x_clasification}\n")
-                        f.write("\n")
+    try:
+        contador = {'generados': 0, 'reutilizados': 0}
+        with escribir_atomico(output_file) as f:
+            escribir_en_bloques(f, generar_txt(items, bloques, cambiados, contador))
 
-                except Exception as e:
-                    logging.warning(f"Error procesando película: {e}")
-                    continue
+        logging.info(f"metadata.txt: {contador['generados']} bloques generados, {contador['reutilizados']} reutilizados")
 
     except Exception as e:
         logging.error(f"Error en la conversión a TXT: {e}")
 
 def main():
-    global config
+    global config, estadisticas_hilos, metricas
     config = load_config()
+    estadisticas_hilos = EstadisticasHilos()
+    metricas = Metricas()
 
-    resultados = {
-        "metadata": [],
-        "errores": [],
-        "timestamp": datetime.now().isoformat(),
-        "estadisticas": {
-            "total_procesadas": 0,
-            "encontradas": 0,
-            "no_encontradas": 0,
-            "imagenes_descargadas": {
-                "boxfront": 0,
-                "screenshot": 0,
-                "wheel": 0
-            },
-            "trailers_descargados": 0
-        }
-    }
-
-    if not validar_api_key(config['api_key'], config):
-        logging.error(get_translation("invalid_api_key", config['interface_language']))
-        return
+    resultados = metadata_vacia()
+    manual = config.get('actualizar_manual', False)
 
-    archivos = obtener_archivos_video(config['ruta_peliculas'])
-    if not archivos:
+    archivos_biblioteca = escanear_videos(config['ruta_peliculas'])
+    if not archivos_biblioteca:
         logging.error(get_translation("no_video_files", config['interface_language']))
         return
 
-    carpetas_imagenes = crear_carpetas_imagenes(config['ruta_peliculas'])
-    tmdb = TMDb(key=config['api_key'], language=config['metadata_language'][0])
-
+    configurar_tamanos_imagenes(config)
     ruta_metadata = Path(config['ruta_peliculas']) / f"metadata.{config['exportar_formato']}"
-    metadata_existente = cargar_metadata_existente(ruta_metadata)
+    ruta_manifiesto = Path(config['ruta_peliculas']) / '.pmdb-manifest.json'
+    ruta_diario = Path(config['ruta_peliculas']) / '.pmdb-journal.jsonl'
+    manifiesto = leer_manifiesto(ruta_manifiesto)
+
+    if not manual and biblioteca_sin_cambios(manifiesto, archivos_biblioteca, ruta_manifiesto, ruta_metadata, ruta_diario, config):
+        logging.info(f"Sin cambios en la biblioteca ({len(archivos_biblioteca)} archivos). Nada que hacer")
+        print(get_translation('nothing_to_do', config['interface_language']).format(len(archivos_biblioteca)))
+        return
+
+    # En modo manual la clave se valida después de elegir la película
+    if not manual and not validar_api_key_cacheada(config):
+        logging.error(get_translation("invalid_api_key", config['interface_language']))
+        return
 
-    if config.get('actualizar_manual', False):
-        pelicula = listar_peliculas(metadata_existente)
-        if pelicula:
-            actualizar_pelicula_manual(tmdb, pelicula, carpetas_imagenes, ruta_metadata)
+    carpetas_imagenes = crear_carpetas_imagenes(config['ruta_peliculas'])
+    construir_indice_media(carpetas_imagenes)
+    configurar_limitadores(config)
+    cache_tmdb = crear_cache_tmdb(config)
+    configurar_cache_sondeos(config)
+    configurar_indice_titulos(config)
+    configurar_cache_sin_resultado(config)
+    clientes_tmdb = PoolClientesTMDb(config['api_key'], cache_tmdb)
+
+    recuperados = recuperar_diario(ruta_diario, ruta_metadata, ruta_manifiesto)
+    if recuperados:
+        print(get_translation('journal_recovered', config['interface_language']).format(recuperados))
+    catalogo = IndiceCatalogo(cargar_metadata_existente(ruta_metadata))
+
+    if manual:
+        pelicula = listar_peliculas(catalogo)
+        if pelicula and not validar_api_key_cacheada(config):
+            logging.error(get_translation("invalid_api_key", config['interface_language']))
+        elif pelicula:
+            actualizar_pelicula_manual(clientes_tmdb, pelicula, carpetas_imagenes, ruta_metadata, catalogo)
+        clientes_tmdb.cerrar()
+        cerrar_sesion_http()
+        cerrar_cache_sondeos()
+        cerrar_indice_titulos()
+        cerrar_cache_sin_resultado()
+        if cache_tmdb:
+            cache_tmdb.cerrar()
         return
 
+    # El diario recuperado puede haber reescrito el manifiesto
+    if recuperados:
+        manifiesto = leer_manifiesto(ruta_manifiesto)
+    manifiesto_anterior = (manifiesto or {}).get('archivos', {})
+    cambios_biblioteca = comparar_manifiesto(manifiesto_anterior, archivos_biblioteca)
+    logging.info(f"Cambios en la biblioteca: {len(cambios_biblioteca['nuevos'])} nuevos, "
+                 f"{len(cambios_biblioteca['modificados'])} modificados, {len(cambios_biblioteca['movidos'])} movidos, "
+                 f"{len(cambios_biblioteca['eliminados'])} eliminados")
+
+    # Solo entran al proceso los archivos sin metadata, los modificados desde la última ejecución
+    # y los que no tuvieron coincidencia cuando vence su próxima revisión
+    catalogadas = rutas_catalogadas(catalogo, cambios_biblioteca)
+    modificados = set(cambios_biblioteca['modificados'])
+    sin_resultado = {}
+    if cache_sin_resultado is not None:
+        for ruta in archivos_biblioteca:
+            item = catalogo.obtener(ruta)
+            if item is not None and not item.get('metadata'):
+                sin_resultado[ruta] = clave_item_sin_resultado(item, config)
+    revisiones = cache_sin_resultado.proximas_revisiones() if cache_sin_resultado is not None else {}
+    vencidas = {ruta for ruta, clave in sin_resultado.items() if revisiones.get(clave, 0) <= time.time()}
+    if vencidas:
+        logging.info(f"Se vuelven a buscar {len(vencidas)} archivos sin coincidencia en ejecuciones anteriores")
+    archivos = [Path(ruta) for ruta in archivos_biblioteca
+                if ruta not in catalogadas or ruta in modificados or ruta in vencidas]
+    estadisticas_hilos.actual().total_procesadas += len(archivos_biblioteca) - len(archivos)
+
     logging.info(get_translation("processing_files", config['interface_language']).format(len(archivos)))
     resultados_queue = queue.Queue()
+    diario = DiarioResultados(ruta_diario)
+    completados = set()
+    detener = threading.Event()
+
+    def publicar_resultado(item, cambio_tamano=False):
+        diario.registrar({
+            "item": item,
+            "identidad": archivos_biblioteca.get(item["archivo_original"]),
+            "cambio_tamano": cambio_tamano
+        })
+        completados.add(item["archivo_original"])
+        resultados_queue.put(item)
+
+    cambios_tamano = planificar_cambios_tamano(catalogo.datos, carpetas_imagenes, config)
+    tamanos_completos = True
+    if cambios_tamano:
+        logging.info(f"Cambiando el tamaño de {len(cambios_tamano)} imágenes ya descargadas")
+        aplicados, descartados = aplicar_cambios_tamano(cambios_tamano, config)
+        tamanos_completos = len(aplicados) + len(descartados) == len(cambios_tamano)
+        items_actualizados = {}
+        for item, clave_local in aplicados:
+            estadisticas = estadisticas_hilos.actual()
+            asset = clave_local[:-len('_local')]
+            setattr(estadisticas, asset, getattr(estadisticas, asset) + 1)
+            items_actualizados[item['archivo_original']] = item
+        for item, clave_local in descartados:
+            items_actualizados[item['archivo_original']] = item
+        for item in items_actualizados.values():
+            publicar_resultado({
+                "tipo": "pelicula",
+                "archivo_original": item['archivo_original'],
+                "nombre_extraido": item.get('nombre_extraido'),
+                "metadata": item['metadata'],
+                "descargas": {}
+            }, cambio_tamano=True)
+
+    def preparar_archivo(archivo):
+        return archivo_tiene_imagenes(archivo, carpetas_imagenes), extraer_nombre_pelicula(archivo.name)
 
-    def procesar_archivo(archivo):
-        nonlocal resultados
+    def registrar_resultado(archivo, nombre_pelicula, metadata, imagenes_existentes):
         stats = {
             'boxfront': False,
             'screenshot': False,
@@ -1224,20 +3558,7 @@ def main():
             'trailer': False
         }
 
-        if metadata_existente and archivo_tiene_metadata(archivo, metadata_existente):
-            logging.info(f"El archivo {archivo.name} ya tiene metadata. Saltando...")
-            resultados["estadisticas"]["total_procesadas"] += 1
-            return
-
-        imagenes_existentes = archivo_tiene_imagenes(archivo, carpetas_imagenes)
-        nombre_pelicula = extraer_nombre_pelicula(archivo.name)
-        metadata = obtener_metadata_pelicula(tmdb, nombre_pelicula, carpetas_imagenes, archivo, config, imagenes_existentes)
-
-        resultados["estadisticas"]["total_procesadas"] += 1
-
         if metadata:
-            resultados["estadisticas"]["encontradas"] += 1
-
             if metadata.get('boxfront_local') and not imagenes_existentes.get('boxfront'):
                 stats['boxfront'] = True
             if metadata.get('screenshot_local') and not imagenes_existentes.get('screenshot'):
@@ -1247,75 +3568,127 @@ def main():
             if metadata.get('video_local') and not imagenes_existentes.get('video'):
                 stats['trailer'] = True
         else:
-            resultados["estadisticas"]["no_encontradas"] += 1
             resultados["errores"].append(f"No se encontró información para: {nombre_pelicula}")
             logging.warning(f"No se encontró información para: {nombre_pelicula} (Archivo: {archivo.name})")
 
-        if stats['boxfront']:
-            resultados["estadisticas"]["imagenes_descargadas"]["boxfront"] += 1
-        if stats['screenshot']:
-            resultados["estadisticas"]["imagenes_descargadas"]["screenshot"] += 1
-        if stats['wheel']:
-            resultados["estadisticas"]["imagenes_descargadas"]["wheel"] += 1
-        if stats['trailer']:
-            resultados["estadisticas"]["trailers_descargados"] += 1
-
-        resultados_queue.put({
+        item = {
             "tipo": "pelicula",
             "archivo_original": str(archivo),
             "nombre_extraido": nombre_pelicula,
             "metadata": metadata,
             "descargas": stats
-        })
+        }
+        estadisticas_hilos.actual().contabilizar(item)
+        publicar_resultado(item)
 
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        futures = [executor.submit(procesar_archivo, archivo) for archivo in archivos]
+    async def procesar_archivo_async(motor, archivo):
+        imagenes_existentes, nombre_pelicula = preparar_archivo(archivo)
+        metadata = await obtener_metadata_pelicula_async(motor, nombre_pelicula, carpetas_imagenes, archivo, config, imagenes_existentes)
+        registrar_resultado(archivo, nombre_pelicula, metadata, imagenes_existentes)
 
-        with tqdm(total=len(archivos), desc=get_translation("progress", config['interface_language']),
-              unit=get_translation("progress_file", config['interface_language'])) as pbar:
-            for future in concurrent.futures.as_completed(futures):
-                try:
-                    future.result()
-                except Exception as e:
-                    logging.error(f"Error al procesar archivo: {e}")
-                finally:
-                    pbar.update(1)
+    manejadores_anteriores = instalar_manejador_senales(detener)
+    try:
+        if config.get('motor', 'hilos') == 'async':
+            asyncio.run(ejecutar_motor_async(archivos, procesar_archivo_async, config, cache_tmdb, clientes_tmdb, detener))
+        else:
+            from tqdm import tqdm
+            with tqdm(total=len(archivos), desc=get_translation("progress", config['interface_language']),
+                  unit=get_translation("progress_file", config['interface_language'])) as pbar:
+                registro_lock = threading.Lock()
+
+                def al_terminar(trabajo):
+                    with registro_lock:
+                        if trabajo.interrumpido:
+                            return
+                        registrar_resultado(trabajo.archivo, trabajo.nombre_pelicula, trabajo.metadata, trabajo.imagenes_existentes)
+                        pbar.update(1)
+
+                tuberia = crear_tuberia_peliculas(clientes_tmdb, carpetas_imagenes, config, al_terminar, detener)
+                for archivo in archivos:
+                    if detener.is_set():
+                        break
+                    imagenes_existentes, nombre_pelicula = preparar_archivo(archivo)
+                    tuberia.agregar(TrabajoPelicula(archivo, nombre_pelicula, imagenes_existentes))
+                tuberia.cerrar()
+    finally:
+        # Con la segunda señal los hilos de las etapas mueren con el proceso, pero los yt-dlp
+        # están en otra sesión y seguirían descargando
+        matar_procesos_yt_dlp()
+    diario.cerrar()
+    restaurar_manejadores_senales(manejadores_anteriores)
+
+    if detener.is_set():
+        # Los archivos que quedaron sin procesar conservan la identidad anterior del manifiesto
+        # para que la próxima ejecución los vuelva a intentar
+        for archivo in archivos:
+            ruta = str(archivo)
+            if ruta in completados:
+                continue
+            if ruta in manifiesto_anterior:
+                archivos_biblioteca[ruta] = manifiesto_anterior[ruta]
+            else:
+                archivos_biblioteca.pop(ruta, None)
 
     while not resultados_queue.empty():
         item = resultados_queue.get()
         resultados["metadata"].append(item)
 
-    total_descargas = (
-        resultados["estadisticas"]["imagenes_descargadas"]["boxfront"] +
-        resultados["estadisticas"]["imagenes_descargadas"]["screenshot"] +
-        resultados["estadisticas"]["imagenes_descargadas"]["wheel"] +
-        resultados["estadisticas"]["trailers_descargados"]
-    )
+    resultados["estadisticas"] = estadisticas_hilos.total().como_dict()
 
-    if total_descargas == 0:
+    actualizar_metadata(resultados, ruta_metadata, cambios_biblioteca)
+    # Archivos que siguen sin coincidencia: la primera revisión que venza hace que la próxima
+    # ejecución no tome el camino rápido
+    proxima_revision = None
+    if cache_sin_resultado is not None:
         for item in resultados["metadata"]:
             if item.get("metadata"):
-                metadata = item["metadata"]
-                if metadata.get("boxfront_local") or metadata.get("screenshot_local") or \
-                   metadata.get("wheel_local") or metadata.get("video_local"):
-                    logging.warning("Se detectaron archivos locales pero no se registraron como descargas")
-                    # Recontar manualmente si es necesario
-                    if metadata.get("boxfront_local"):
-                        resultados["estadisticas"]["imagenes_descargadas"]["boxfront"] += 1
-                    if metadata.get("screenshot_local"):
-                        resultados["estadisticas"]["imagenes_descargadas"]["screenshot"] += 1
-                    if metadata.get("wheel_local"):
-                        resultados["estadisticas"]["imagenes_descargadas"]["wheel"] += 1
-                    if metadata.get("video_local"):
-                        resultados["estadisticas"]["trailers_descargados"] += 1
-
-    actualizar_metadata(resultados, ruta_metadata)
+                sin_resultado.pop(item["archivo_original"], None)
+            else:
+                sin_resultado[item["archivo_original"]] = clave_item_sin_resultado(item, config)
+        for ruta in cambios_biblioteca['eliminados']:
+            sin_resultado.pop(ruta, None)
+        revisiones = cache_sin_resultado.proximas_revisiones()
+        proxima_revision = min((revisiones.get(clave, 0) for clave in sin_resultado.values()), default=None)
+
+    # Si alguna imagen quedó en el tamaño anterior, la próxima ejecución no toma el camino rápido
+    guardar_manifiesto(ruta_manifiesto, archivos_biblioteca,
+                       config['tamanos_imagenes'] if tamanos_completos and not detener.is_set() else None,
+                       proxima_revision)
+    diario.descartar()
+
+    caches = {}
+    if cache_tmdb:
+        caches["tmdb"] = {"aciertos": cache_tmdb.aciertos, "fallos": cache_tmdb.fallos}
+    if cache_sondeos:
+        caches["ffprobe"] = {"aciertos": cache_sondeos.aciertos, "fallos": cache_sondeos.fallos}
+    if cache_sin_resultado:
+        caches["sin_resultado"] = {"aciertos": cache_sin_resultado.aciertos, "fallos": cache_sin_resultado.fallos}
+    motor = config.get('motor', 'hilos')
+    informe = metricas.informe(
+        motor=motor,
+        concurrencia=config.get('concurrencia_async', {}) if motor == 'async' else concurrencia_etapas(config),
+        interrumpida=detener.is_set(),
+        archivos_biblioteca=len(archivos_biblioteca),
+        archivos_procesados=len(completados),
+        estadisticas=resultados["estadisticas"],
+        caches=caches
+    )
+    if informe["duracion_segundos"]:
+        informe["archivos_por_segundo"] = round(len(completados) / informe["duracion_segundos"], 2)
+    ruta_informe = guardar_informe_metricas(informe, ruta_metadata, config)
+    if ruta_informe:
+        logging.info(f"Informe de métricas: {ruta_informe}")
 
     print(f"\n{get_translation('operation_summary', config['interface_language'])}")
     print(f"{get_translation('file_generated', config['interface_language'])} {ruta_metadata}")
     print(f"{get_translation('total_files_processed', config['interface_language'])} {resultados['estadisticas']['total_procesadas']}")
     print(f"{get_translation('movies_found', config['interface_language'])} {resultados['estadisticas']['encontradas']}")
     print(f"{get_translation('movies_not_found', config['interface_language'])} {resultados['estadisticas']['no_encontradas']}")
+    print(get_translation('library_changes', config['interface_language']).format(
+        len(cambios_biblioteca['nuevos']), len(cambios_biblioteca['modificados']),
+        len(cambios_biblioteca['movidos']), len(cambios_biblioteca['eliminados'])))
+    print(get_translation('network_usage', config['interface_language']).format(
+        resultados['estadisticas']['peticiones_api'], resultados['estadisticas']['bytes_descargados'] / 2**20))
 
     if (resultados["estadisticas"]["imagenes_descargadas"]["boxfront"] > 0 or
         resultados["estadisticas"]["imagenes_descargadas"]["screenshot"] > 0 or
@@ -1334,6 +3707,16 @@ def main():
     else:
         print("\nNo se descargaron nuevos assets (las imágenes/tráilers ya existían)")
 
+    clientes_tmdb.cerrar()
+    cerrar_sesion_http()
+    cerrar_cache_sondeos()
+    cerrar_indice_titulos()
+    cerrar_cache_sin_resultado()
+    if cache_tmdb:
+        print(f"{get_translation('tmdb_cache', config['interface_language'])} {cache_tmdb.aciertos}/{cache_tmdb.fallos}")
+        logging.info(f"Caché TMDb: {cache_tmdb.aciertos} aciertos, {cache_tmdb.fallos} fallos")
+        cache_tmdb.cerrar()
+
     logging.info("=== Resumen detallado ===")
     logging.info(f"Archivo generado: {ruta_metadata}")
     logging.info(f"Total de archivos procesados: {resultados['estadisticas']['total_procesadas']}")